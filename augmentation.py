@@ -3,23 +3,49 @@ import os
 import sys
 import json
 import random
+import zlib
 import bpy
 from mathutils import Vector
+sys.path.append(os.path.dirname(__file__))
+import util
+import mesh_quality
+from augmentation_index import AugmentationIndex
 
 class FastPollenAugmentor:
     """
     Optimized pollen mesh augmentation pipeline with resume capability.
     - On abort/restart, skips already processed meshes.
     - Stores progress in 'progress.json' under output_dir.
+    - Records every exported variant in the augmentation index ('index.jsonl'),
+      together with its recipe: per-variant RNG seed and every sampled parameter.
+    - Any indexed variant can be regenerated from its base mesh + recipe (see replay()).
+    - Lattices and displacement textures are pooled by name and orphaned datablocks are
+      purged between meshes, so bpy.data stays flat over long runs.
+    - Every variant passes a quality gate (volume, aspect, thickness, non-manifold edges)
+      against its base; failures are re-rolled with a new seed, and variants that never
+      pass are indexed as invalid instead of exported.
+    - The base is scaled into the unit sphere around its bound_box corners ('bbox') or its
+      tight vertex bounding sphere ('sphere'). Deformation strengths are absolute, so the
+      recipe records which; recipes without it predate 'sphere' and replay with 'bbox'.
     """
     PROGRESS_FILE = 'progress.json'
 
-    def __init__(self, mesh_dir, output_dir, num_augmentations=2, decimate_ratio=1.0, seed=42):
+    def __init__(self, mesh_dir, output_dir, num_augmentations=2, decimate_ratio=1.0, seed=42,
+                 max_attempts=3, quality_thresholds=None, normalization='bbox'):
         self.mesh_dir = mesh_dir
         self.output_dir = output_dir
         self.num_augmentations = num_augmentations
         self.decimate_ratio = decimate_ratio
+        self.normalization = normalization
+        # Radius per normalization of the last imported base (import_and_reduce)
+        self.base_radii = {}
+        self.seed = seed
+        self.max_attempts = max_attempts
+        self.quality_thresholds = quality_thresholds
         random.seed(seed)
+        self._params = {}
+        self._lattice_pool = {}
+        self._texture_pool = {}
         # Define deformation methods
         self.deformations = {
             'twisting': self._twisting,
@@ -32,7 +58,99 @@ class FastPollenAugmentor:
         }
         self._prepare_workspace()
         self.progress = self._load_progress()
+        self.index = AugmentationIndex(self.output_dir)
         
+    def _record(self, key, value):
+        # Log a sampled parameter into the recipe of the variant being built
+        self._params[key] = value
+        return value
+
+    def variant_seed(self, fname, name, variant, attempt=0):
+        # Stable across processes and runs, unlike hash()
+        key = '{0}:{1}:{2}:{3}'.format(self.seed, fname, name, variant)
+        if attempt:
+            key += ':{0}'.format(attempt)
+        return zlib.crc32(key.encode('utf-8')) & 0xffffffff
+
+    def mesh_stats(self, obj):
+        # Measure the evaluated (modifier-applied) mesh in world space without baking it
+        bpy.context.scene.update()
+        mesh = obj.to_mesh(bpy.context.scene, True, 'PREVIEW')
+        try:
+            verts, tris = util.get_mesh_arrays(mesh, obj.matrix_world)
+        finally:
+            bpy.data.meshes.remove(mesh)
+        return mesh_quality.mesh_stats(verts, tris)
+
+    def generate_variant(self, base, base_stats, fname, name, variant, t):
+        """
+        Deform a copy of base, re-rolling the seed until the result passes the quality gate.
+        :return: (object, or None if every attempt failed; params; seed; quality report)
+        """
+        for attempt in range(self.max_attempts):
+            seed = self.variant_seed(fname, name, variant, attempt)
+            obj, params = self.apply_deformation(self.duplicate(base), name, t, seed)
+            quality = mesh_quality.check(self.mesh_stats(obj), base_stats, self.quality_thresholds)
+            quality['attempts'] = attempt + 1
+            if quality['valid']:
+                return obj, params, seed, quality
+            print('[!] Rejected {0} {1} #{2} (seed {3}): {4}'.format(
+                fname, name, variant, seed, ', '.join(quality['failed'])))
+            self.discard(obj)
+        return None, params, seed, quality
+
+    def apply_deformation(self, obj, name, t, seed):
+        """Run one deformation under its own seed and return (object, sampled params)."""
+        random.seed(seed)
+        self._params = {'t': t, 'decimate_ratio': self.decimate_ratio, 'normalization': self.normalization}
+        result = self.deformations[name](obj, t)
+        if result is None:
+            result = obj
+        return result, self._params
+
+    def _lattice(self, name):
+        # Pooled 4x4x4 lattice object, reset to its rest shape before each use
+        lat = self._lattice_pool.get(name)
+        if lat is None:
+            lat_data = bpy.data.lattices.new(name)
+            lat_data.points_u = lat_data.points_v = lat_data.points_w = 4
+            lat = bpy.data.objects.new(name + 'Obj', lat_data)
+            self._lattice_pool[name] = lat
+        else:
+            for p in lat.data.points:
+                p.co_deform = p.co
+        if lat.name not in bpy.context.scene.objects:
+            bpy.context.scene.objects.link(lat)
+        return lat
+
+    def _texture(self, name):
+        # Pooled CLOUDS texture; each name belongs to a single call site, which sets its parameters
+        tex = self._texture_pool.get(name)
+        if tex is None:
+            tex = bpy.data.textures.new(name, type='CLOUDS')
+            self._texture_pool[name] = tex
+        return tex
+
+    def collect_garbage(self):
+        """Remove datablocks left without users by deleted objects and applied modifiers."""
+        removed = 0
+        for collection in (bpy.data.meshes, bpy.data.objects, bpy.data.materials):
+            for block in list(collection):
+                if block.users == 0:
+                    collection.remove(block)
+                    removed += 1
+        pooled_lattices = set(lat.data.name for lat in self._lattice_pool.values())
+        for lat_data in list(bpy.data.lattices):
+            if lat_data.users == 0 and lat_data.name not in pooled_lattices:
+                bpy.data.lattices.remove(lat_data)
+                removed += 1
+        pooled_textures = set(tex.name for tex in self._texture_pool.values())
+        for tex in list(bpy.data.textures):
+            if tex.users == 0 and tex.name not in pooled_textures:
+                bpy.data.textures.remove(tex)
+                removed += 1
+        return removed
+
     def _make_modifier_first(self, obj, mod):
         while obj.modifiers[0] != mod:
             bpy.ops.object.modifier_move_up(modifier=mod.name)
@@ -60,43 +178,82 @@ class FastPollenAugmentor:
             json.dump(self.progress, f)
 
     def clear_scene(self):
-        bpy.ops.object.select_all(action='SELECT')
+        # Only meshes and lattices, so a renderer's camera and lamps survive in fused mode
+        bpy.ops.object.select_all(action='DESELECT')
+        pooled = set(self._lattice_pool.values())
+        for obj in bpy.context.scene.objects:
+            if obj.type == 'MESH' or (obj.type == 'LATTICE' and obj not in pooled):
+                obj.select = True
         bpy.ops.object.delete()
+        self.collect_garbage()
 
-    def import_and_reduce(self, filepath):
+    def import_and_reduce(self, filepath, decimate_ratio=None):
         self.clear_scene()
         bpy.ops.import_mesh.stl(filepath=filepath)
         obj = bpy.context.selected_objects[0]
-        bbox = [obj.matrix_world * Vector(c) for c in obj.bound_box]  # <-- fix here
+        bbox = [obj.matrix_world * Vector(c) for c in obj.bound_box]
         center = sum(bbox, Vector((0,0,0))) / 8.0
-        r = max((v-center).length for v in bbox)
-        if r > 0:
-            obj.scale = (1.0/r, 1.0/r, 1.0/r)
-        if self.decimate_ratio < 1.0:
+        self.base_radii = {
+            'bbox': max((v-center).length for v in bbox),
+            'sphere': util.bounding_sphere(util.get_vertices(obj.data, obj.matrix_world))[1],
+        }
+        self._scale_base(obj, self.normalization)
+        decimate_ratio = self.decimate_ratio if decimate_ratio is None else decimate_ratio
+        if decimate_ratio < 1.0:
             mod = obj.modifiers.new('Decimate', type='DECIMATE')
-            mod.ratio = self.decimate_ratio
+            mod.ratio = decimate_ratio
             bpy.ops.object.modifier_apply(modifier=mod.name)
         return obj
 
-    def bake_and_export(self, obj, out_path):
+    def _scale_base(self, obj, normalization):
+        # Decimation does not depend on the scale, so rescaling a copy equals re-importing
+        r = self.base_radii[normalization]
+        if r > 0:
+            obj.scale = (1.0/r, 1.0/r, 1.0/r)
+
+    def duplicate(self, base):
+        dup = base.copy()
+        dup.data = base.data.copy()
+        bpy.context.scene.objects.link(dup)
+        return dup
+
+    def bake(self, obj):
+        # Apply all remaining modifiers so the object can be used without re-import
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select = True
+        bpy.context.scene.objects.active = obj
+        bpy.ops.object.convert(target='MESH')
+        return obj
+
+    def export(self, obj, out_path):
         bpy.ops.object.select_all(action='DESELECT')
         obj.select = True
         bpy.ops.export_mesh.stl(filepath=out_path, use_selection=True)
+
+    def discard(self, obj):
+        # Drop the object together with its mesh, which objects.remove() would orphan
+        mesh = obj.data
         bpy.data.objects.remove(obj, do_unlink=True)
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+    def bake_and_export(self, obj, out_path):
+        self.export(obj, out_path)
+        self.discard(obj)
 
     def _twisting(self, obj, t):
             # Randomly rotate the object to twist along a random axis
             original_rotation = obj.rotation_euler[:]
-            obj.rotation_euler = (
+            obj.rotation_euler = self._record('rotation', (
                 random.uniform(0, 2 * 3.14159),
                 random.uniform(0, 2 * 3.14159),
                 random.uniform(0, 2 * 3.14159)
-            )
+            ))
             mod = obj.modifiers.new('Twist', type='SIMPLE_DEFORM')
             mod.deform_method = 'TWIST'
             # Make the twist angle more pronounced and random
             base_angle = 0.1 + t * 0.4
-            mod.angle = base_angle * random.uniform(-1.2, 1.2)
+            mod.angle = self._record('twist_angle', base_angle * random.uniform(-1.2, 1.2))
             # Apply the modifier and reset rotation
             bpy.context.scene.objects.active = obj
             bpy.ops.object.select_all(action='DESELECT')
@@ -107,21 +264,21 @@ class FastPollenAugmentor:
     def _stretching(self, obj, t):
         # Randomly rotate the object to stretch in a random direction
         original_rotation = obj.rotation_euler[:]
-        obj.rotation_euler = (
+        obj.rotation_euler = self._record('rotation', (
             random.uniform(0, 3.1415 * 2),
             random.uniform(0, 3.1415 * 2),
             random.uniform(0, 3.1415 * 2)
-        )
+        ))
         mod = obj.modifiers.new('Taper', type='SIMPLE_DEFORM')
         mod.deform_method = 'TAPER'
         base_factor = (0.08 + t * 0.35) / 2.5
-        mod.factor = base_factor * random.uniform(0.85, 1.25)
+        mod.factor = self._record('taper_factor', base_factor * random.uniform(0.85, 1.25))
         # Add a subtle displacement for surface detail
-        tex = bpy.data.textures.new('StretchDisplace', type='CLOUDS')
-        tex.noise_scale = 0.13 + t * 0.07
+        tex = self._texture('StretchDisplace')
+        tex.noise_scale = self._record('noise_scale', 0.13 + t * 0.07)
         mod_disp = obj.modifiers.new('StretchDisplace', type='DISPLACE')
         mod_disp.texture = tex
-        mod_disp.strength = 0.015 + t * 0.03
+        mod_disp.strength = self._record('displace_strength', 0.015 + t * 0.03)
         # Apply the modifier and reset rotation
         bpy.context.scene.objects.active = obj
         bpy.ops.object.select_all(action='DESELECT')
@@ -137,7 +294,7 @@ class FastPollenAugmentor:
         mod.deform_method = 'BEND'
         # Make the bend a bit more pronounced
         base_angle = -0.15 - t * 0.3
-        mod.angle = base_angle * random.uniform(0.8, 1.2)
+        mod.angle = self._record('bend_angle', base_angle * random.uniform(0.8, 1.2))
         bpy.context.scene.objects.active = obj
         bpy.ops.object.select_all(action='DESELECT')
         obj.select = True
@@ -146,28 +303,28 @@ class FastPollenAugmentor:
         obj.rotation_euler = original_rotation
     
         # Add a subtle displacement for a wavy groove effect
-        tex = bpy.data.textures.new('GrooveDisplace', type='CLOUDS')
-        tex.noise_scale = 0.12 + t * 0.08
+        tex = self._texture('GrooveDisplace')
+        tex.noise_scale = self._record('noise_scale', 0.12 + t * 0.08)
         mod_disp = obj.modifiers.new('GrooveDisplace', type='DISPLACE')
         mod_disp.texture = tex
-        mod_disp.strength = 0.02 + t * 0.04
+        mod_disp.strength = self._record('displace_strength', 0.02 + t * 0.04)
 
     def _asymmetry(self, obj, t):
         mod = obj.modifiers.new('TiltDeform', type='SIMPLE_DEFORM')
         mod.deform_method = 'TAPER'
         base_factor = 0.10 + t * 0.30  # doubled from 0.05 + t * 0.15
-        mod.factor = base_factor * random.uniform(0.6, 1.6)  # wider range
-        obj.rotation_euler = (
+        mod.factor = self._record('taper_factor', base_factor * random.uniform(0.6, 1.6))  # wider range
+        obj.rotation_euler = self._record('rotation', (
             random.uniform(-0.24, 0.24),  # doubled from -0.12, 0.12
             random.uniform(-0.24, 0.24),
             random.uniform(-0.24, 0.24)
-        )
+        ))
         # Add a subtle displacement for surface asymmetry
-        tex = bpy.data.textures.new('AsymDisplace', type='CLOUDS')
-        tex.noise_scale = 0.36 + t * 0.16  # doubled noise scale
+        tex = self._texture('AsymDisplace')
+        tex.noise_scale = self._record('noise_scale', 0.36 + t * 0.16)  # doubled noise scale
         mod_disp = obj.modifiers.new('AsymDisplace', type='DISPLACE')
         mod_disp.texture = tex
-        mod_disp.strength = 0.06 + t * 0.14  # doubled strength
+        mod_disp.strength = self._record('displace_strength', 0.06 + t * 0.14)  # doubled strength
             
     
         
@@ -180,10 +337,7 @@ class FastPollenAugmentor:
         
 
     def _mild_lattice(self, obj, t):
-        lat_data = bpy.data.lattices.new('RandLat')
-        lat_data.points_u = lat_data.points_v = lat_data.points_w = 4
-        lat = bpy.data.objects.new('RandLatObj', lat_data)
-        bpy.context.scene.objects.link(lat)
+        lat = self._lattice('RandLat')
         lat.location = obj.location
         lat.scale = obj.dimensions
         mod_lat = obj.modifiers.new('RandLattice', type='LATTICE')
@@ -191,7 +345,7 @@ class FastPollenAugmentor:
         bpy.context.scene.objects.active = lat
         bpy.ops.object.mode_set(mode='EDIT')
         # Slightly reduced amplitude for safety
-        base_amp = 0.0007 + t * 0.002
+        base_amp = self._record('lattice_jitter', 0.0007 + t * 0.002)
         for p in lat.data.points:
             dist = sum(abs(x - 0.5) for x in p.co_deform) / 1.5
             amp = base_amp * (0.7 + 0.5 * dist)
@@ -213,15 +367,15 @@ class FastPollenAugmentor:
     
     def _mild_cast(self, obj, t):
         mod = obj.modifiers.new('RandCast', type='CAST')
-        mod.cast_type = random.choice(['SPHERE', 'CYLINDER'])
-        mod.factor = 0.2 + t * random.uniform(0.03, 0.08)
+        mod.cast_type = self._record('cast_type', random.choice(['SPHERE', 'CYLINDER']))
+        mod.factor = self._record('cast_factor', 0.2 + t * random.uniform(0.03, 0.08))
         mod.use_x = mod.use_y = mod.use_z = True
     
     def _mild_displace(self, obj, t):
-        tex = bpy.data.textures.new('RandDisplaceTex', type='CLOUDS')
+        tex = self._texture('RandDisplaceTex')
         mod = obj.modifiers.new('RandDisplace', type='DISPLACE')
         mod.texture = tex
-        mod.strength = 0.01 + t * 0.02
+        mod.strength = self._record('displace_strength', 0.01 + t * 0.02)
     
     def _irregular(self, obj, t):
         """
@@ -230,29 +384,31 @@ class FastPollenAugmentor:
         """
         # Choose a random subset of deformations (2 or 3)
         deform_choices = [
-            lambda o: self._mild_simple_deform(o, 'RandTwist', 'TWIST', 0.10 + t * 0.15),
-            lambda o: self._mild_simple_deform(o, 'RandBend', 'BEND', 0.10 + t * 0.15),
+            ('twist', lambda o: self._mild_simple_deform(o, 'RandTwist', 'TWIST', 0.10 + t * 0.15)),
+            ('bend', lambda o: self._mild_simple_deform(o, 'RandBend', 'BEND', 0.10 + t * 0.15)),
             # Clamp TAPER and STRETCH to positive values to avoid flattening
-            lambda o: self._mild_simple_deform(o, 'RandTaper', 'TAPER', 0.08 + t * 0.10, clamp_positive=True),
-            #lambda o: self._mild_simple_deform(o, 'RandStretch', 'STRETCH', 0.06 + t * 0.10, clamp_positive=True),
-            lambda o: self._mild_cast(o, t),
-            lambda o: self._mild_displace(o, t),
-            lambda o: self._mild_lattice(o, t),
+            ('taper', lambda o: self._mild_simple_deform(o, 'RandTaper', 'TAPER', 0.08 + t * 0.10, clamp_positive=True)),
+            #('stretch', lambda o: self._mild_simple_deform(o, 'RandStretch', 'STRETCH', 0.06 + t * 0.10, clamp_positive=True)),
+            ('cast', lambda o: self._mild_cast(o, t)),
+            ('displace', lambda o: self._mild_displace(o, t)),
+            ('lattice', lambda o: self._mild_lattice(o, t)),
         ]
         num_deforms = random.choice([2, 3])
-        for deform in random.sample(deform_choices, num_deforms):
+        chosen = random.sample(deform_choices, num_deforms)
+        self._record('steps', [label for label, _ in chosen])
+        for _, deform in chosen:
             deform(obj)
     
     def _mild_simple_deform(self, obj, name, method, strength, clamp_positive=False):
         mod = obj.modifiers.new(name, type='SIMPLE_DEFORM')
         mod.deform_method = method
         if method in ['TWIST', 'BEND']:
-            mod.angle = random.uniform(-strength, strength)
+            mod.angle = self._record(name + '_angle', random.uniform(-strength, strength))
         elif method in ['TAPER', 'STRETCH'] and clamp_positive:
             # Only positive values to avoid flattening
-            mod.factor = random.uniform(0.0, strength)
+            mod.factor = self._record(name + '_factor', random.uniform(0.0, strength))
         else:
-            mod.factor = random.uniform(-strength, strength)
+            mod.factor = self._record(name + '_factor', random.uniform(-strength, strength))
 
 
     def _radical_reshape(self, obj, t):
@@ -260,20 +416,17 @@ class FastPollenAugmentor:
         mod_bend = obj.modifiers.new('BigBend', type='SIMPLE_DEFORM')
         mod_bend.deform_method = 'BEND'
         # Slightly increased angle range and scaling
-        mod_bend.angle = random.uniform(-0.28, 0.28) * (0.22 + 0.28 * t)
+        mod_bend.angle = self._record('bend_angle', random.uniform(-0.28, 0.28) * (0.22 + 0.28 * t))
         # Optionally, add a cast for more radical but smooth reshaping
-        if random.random() < 0.5:
+        if self._record('use_cast', random.random() < 0.5):
             mod_cast = obj.modifiers.new('RadicalCast', type='CAST')
-            mod_cast.cast_type = random.choice(['SPHERE', 'CYLINDER'])
+            mod_cast.cast_type = self._record('cast_type', random.choice(['SPHERE', 'CYLINDER']))
             # Slightly increased factor for a bit more effect
-            mod_cast.factor = 0.22 + t * random.uniform(0.03, 0.10)
+            mod_cast.factor = self._record('cast_factor', 0.22 + t * random.uniform(0.03, 0.10))
             mod_cast.use_x = mod_cast.use_y = mod_cast.use_z = True
         # Optionally, add a lattice for organic but smooth deformation
-        if random.random() < 0.5:
-            lat_data = bpy.data.lattices.new('RadicalLat')
-            lat_data.points_u = lat_data.points_v = lat_data.points_w = 4
-            lat = bpy.data.objects.new('RadicalLatObj', lat_data)
-            bpy.context.scene.objects.link(lat)
+        if self._record('use_lattice', random.random() < 0.5):
+            lat = self._lattice('RadicalLat')
             lat.location = obj.location
             lat.scale = obj.dimensions
             mod_lat = obj.modifiers.new('RadicalLattice', type='LATTICE')
@@ -281,7 +434,7 @@ class FastPollenAugmentor:
             bpy.context.scene.objects.active = lat
             bpy.ops.object.mode_set(mode='EDIT')
             # Slightly increased amplitude for a bit more visible deformation
-            base_amp = 0.0012 + t * 0.003
+            base_amp = self._record('lattice_jitter', 0.0012 + t * 0.003)
             for p in lat.data.points:
                 dist = sum(abs(x - 0.5) for x in p.co_deform) / 1.5
                 amp = base_amp * (0.7 + 0.5 * dist)
@@ -299,31 +452,28 @@ class FastPollenAugmentor:
         base_twist = (0.01 + t * 0.03) * 1.1
         mod_twist = obj.modifiers.new('Twist', type='SIMPLE_DEFORM')
         mod_twist.deform_method = 'TWIST'
-        mod_twist.angle = base_twist * random.uniform(0.8, 1.2)
+        mod_twist.angle = self._record('twist_angle', base_twist * random.uniform(0.8, 1.2))
         base_bend = (-0.01 - t * 0.03) * 1.1
         mod_bend = obj.modifiers.new('Bend', type='SIMPLE_DEFORM')
         mod_bend.deform_method = 'BEND'
-        mod_bend.angle = base_bend * random.uniform(0.8, 1.2)
+        mod_bend.angle = self._record('bend_angle', base_bend * random.uniform(0.8, 1.2))
         base_taper = (0.003 + t * 0.012) * 1.1
         mod_taper = obj.modifiers.new('Taper', type='SIMPLE_DEFORM')
         mod_taper.deform_method = 'TAPER'
-        mod_taper.factor = base_taper * random.uniform(0.8, 1.2)
+        mod_taper.factor = self._record('taper_factor', base_taper * random.uniform(0.8, 1.2))
         base_stretch = (0.003 + t * 0.012) * 1.1
         mod_stretch = obj.modifiers.new('Stretch', type='SIMPLE_DEFORM')
         mod_stretch.deform_method = 'STRETCH'
-        mod_stretch.factor = base_stretch * random.uniform(0.8, 1.2)
-        lat_data = bpy.data.lattices.new('LatCombo')
-        lat_data.points_u = lat_data.points_v = lat_data.points_w = 4
-        lat = bpy.data.objects.new('LatObjCombo', lat_data)
-        bpy.context.scene.objects.link(lat)
+        mod_stretch.factor = self._record('stretch_factor', base_stretch * random.uniform(0.8, 1.2))
+        lat = self._lattice('LatCombo')
         lat.location = obj.location
         lat.scale = obj.dimensions
         mod_lat = obj.modifiers.new('LatticeCombo', type='LATTICE')
         mod_lat.object = lat
         bpy.context.scene.objects.active = lat
         bpy.ops.object.mode_set(mode='EDIT')
-        base_amp = (0.0015 + t * 0.004) * 1.1
-        amp_factor = random.uniform(0.8, 1.2)
+        base_amp = self._record('lattice_jitter', (0.0015 + t * 0.004) * 1.1)
+        amp_factor = self._record('lattice_amp_factor', random.uniform(0.8, 1.2))
         for p in lat.data.points:
             dist = sum(abs(x - 0.5) for x in p.co_deform) / 1.5
             amp = base_amp * (0.7 + 0.5 * dist) * amp_factor
@@ -343,25 +493,62 @@ class FastPollenAugmentor:
         for fname in files:
             mesh_prog = self.progress.get(fname, {})
             base = self.import_and_reduce(os.path.join(self.mesh_dir, fname))
+            base_stats = self.mesh_stats(base)
             for name, fn in self.deformations.items():
                 completed = mesh_prog.get(name, -1)
                 out_dir = os.path.join(self.output_dir, name)
                 for i in range(completed + 1, self.num_augmentations):
                     print('Processing {0} {1} ({2}/{3})'.format(fname, name, i + 1, self.num_augmentations))
                     t = float(i) / (self.num_augmentations - 1) * 0.4 if self.num_augmentations > 1 else 0
-                    dup = base.copy()
-                    dup.data = base.data.copy()
-                    bpy.context.scene.objects.link(dup)
-                    result = fn(dup, t)
-                    if result is None:
-                        result = dup
+                    result, params, seed, quality = self.generate_variant(base, base_stats, fname, name, i + 1, t)
                     out_name = '{0}_{1}_{2}.stl'.format(os.path.splitext(fname)[0], name, i + 1)
-                    self.bake_and_export(result, os.path.join(out_dir, out_name))
+                    if result is not None:
+                        self.bake_and_export(result, os.path.join(out_dir, out_name))
+                    self.index.add('{0}/{1}'.format(name, out_name), fname, name, i + 1, params, seed, quality)
                     mesh_prog[name] = i
                     self.progress[fname] = mesh_prog
                     self._save_progress()
         print('🎉 All augmentations done.')
 
+    def replay(self, entry, base=None):
+        """
+        Regenerate an indexed variant from its base mesh and recipe.
+        Returns the deformed, not yet exported object. Pass the last imported base (with the
+        recipe's decimate_ratio) to replay several variants of one mesh without re-importing it.
+        """
+        params = entry['params']
+        if base is None:
+            base = self.import_and_reduce(os.path.join(self.mesh_dir, entry['base']),
+                                          params.get('decimate_ratio', self.decimate_ratio))
+        obj = self.duplicate(base)
+        self._scale_base(obj, params.get('normalization', 'bbox'))
+        result, _ = self.apply_deformation(obj, entry['deformation'], params['t'], entry['seed'])
+        return result
+
+    def materialize(self, rel_paths=None, overwrite=False):
+        """Export every indexed variant (or only rel_paths) whose STL is missing on disk."""
+        todo = {}
+        for entry in self.index:
+            if rel_paths is not None and entry['file'] not in rel_paths:
+                continue
+            if entry.get('seed') is None:
+                print('[!] No recipe recorded for {0}, skipping'.format(entry['file']))
+                continue
+            if not AugmentationIndex.is_valid(entry):
+                continue
+            out_path = os.path.join(self.output_dir, *entry['file'].split('/'))
+            if os.path.exists(out_path) and not overwrite:
+                continue
+            key = (entry['base'], entry['params'].get('decimate_ratio', self.decimate_ratio))
+            todo.setdefault(key, []).append((entry, out_path))
+
+        for (base_name, ratio), jobs in sorted(todo.items()):
+            base = self.import_and_reduce(os.path.join(self.mesh_dir, base_name), ratio)
+            for entry, out_path in jobs:
+                print('Replaying {0}'.format(entry['file']))
+                self.bake_and_export(self.replay(entry, base), out_path)
+        print('Materialized {0} variants.'.format(sum(len(j) for j in todo.values())))
+
 if __name__=='__main__':
     p = argparse.ArgumentParser()
     p.add_argument('--mesh_dir', required=True)
@@ -369,6 +556,17 @@ if __name__=='__main__':
     p.add_argument('--num_augmentations', type=int, default=5)
     p.add_argument('--decimate_ratio', type=float, default=1.0)
     p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--max_attempts', type=int, default=3, help='Seeds tried per variant before it is marked invalid.')
+    p.add_argument('--normalization', default='bbox', choices=util.NORMALIZATIONS,
+                   help="Base mesh scale: unit bounding-box sphere ('bbox', legacy) or tight vertex sphere ('sphere')")
+    p.add_argument('--replay', nargs='*', default=None,
+                   help='Regenerate indexed variants from their recipes instead of augmenting. '
+                        'Optionally restrict to index paths like twisting/<name>_twisting_1.stl.')
+    p.add_argument('--overwrite', action='store_true', help='With --replay, also rewrite existing STLs.')
     args = p.parse_args(sys.argv[sys.argv.index('--')+1:])
-    aug = FastPollenAugmentor(args.mesh_dir, args.output_dir, args.num_augmentations, args.decimate_ratio, args.seed)
-    aug.augment()
\ No newline at end of file
+    aug = FastPollenAugmentor(args.mesh_dir, args.output_dir, args.num_augmentations, args.decimate_ratio, args.seed,
+                              args.max_attempts, normalization=args.normalization)
+    if args.replay is not None:
+        aug.materialize(set(args.replay) or None, overwrite=args.overwrite)
+    else:
+        aug.augment()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import json
+import os
+
+
+class AugmentationIndex:
+    """
+    Persistent lookup table for augmented meshes.
+    - Maps each augmented file (relative to the augmentation root) to its base mesh,
+      deformation, variant index and parameters.
+    - 'params' plus 'seed' form the variant's recipe: FastPollenAugmentor.replay()
+      rebuilds the mesh from them, so the STL itself can be deleted.
+    - 'quality' holds the mesh quality gate report; variants with quality.valid == False
+      were never exported and must not be rendered.
+    - Stored as JSON lines in 'index.jsonl' so every export is a cheap append and a
+      killed run keeps everything written before it.
+    """
+    INDEX_FILE = 'index.jsonl'
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, self.INDEX_FILE)
+        self.entries = self._load()
+
+    def _load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Truncated last line of an aborted run
+                    continue
+                # Later lines win, so re-exported variants overwrite older records
+                entries[entry['file']] = entry
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __contains__(self, rel_path):
+        return rel_path in self.entries
+
+    def get(self, rel_path, default=None):
+        return self.entries.get(rel_path, default)
+
+    def add(self, rel_path, base, deformation, variant, params=None, seed=None, quality=None):
+        entry = {
+            'file': rel_path.replace(os.sep, '/'),
+            'base': base,
+            'deformation': deformation,
+            'variant': variant,
+            'params': params or {},
+            'seed': seed,
+        }
+        if quality is not None:
+            entry['quality'] = quality
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.entries[entry['file']] = entry
+        return entry
+
+    @staticmethod
+    def is_valid(entry):
+        # Entries without a quality report predate the gate and are trusted
+        return entry.get('quality', {}).get('valid', True)
+
+    def compact(self):
+        """Rewrite the index with one line per file, dropping superseded records."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def rebuild(cls, root, base_ext='.stl'):
+        """
+        Build an index for an augmentation tree written before indexing existed.
+        Files are expected as '<deformation>/<base>_<deformation>_<variant>.stl'.
+        """
+        index = cls(root)
+        index.entries = {}
+        for aug_entry in os.scandir(root):
+            if not aug_entry.is_dir():
+                continue
+            aug_type = aug_entry.name
+            marker = '_{0}_'.format(aug_type)
+            for f in os.scandir(aug_entry.path):
+                if not f.name.lower().endswith('.stl') or marker not in f.name:
+                    continue
+                stem, variant = os.path.splitext(f.name)[0].rsplit(marker, 1)
+                rel_path = '{0}/{1}'.format(aug_type, f.name)
+                index.entries[rel_path] = {
+                    'file': rel_path,
+                    'base': stem + base_ext,
+                    'deformation': aug_type,
+                    'variant': int(variant) if variant.isdigit() else variant,
+                    'params': {},
+                    'seed': None,
+                }
+        index.compact()
+        return index
+
+
+if __name__ == '__main__':
+    import argparse
+    p = argparse.ArgumentParser(description='Rebuild the augmentation index from an existing output tree.')
+    p.add_argument('--root', required=True, help='Augmentation output directory.')
+    args = p.parse_args()
+    idx = AugmentationIndex.rebuild(args.root)
+    print('Indexed {0} augmented meshes into {1}'.format(len(idx), idx.path))
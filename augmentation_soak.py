@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(__file__))
+import bpy
+from augmentation import FastPollenAugmentor
+
+# Soak check for FastPollenAugmentor: runs thousands of deformations on one mesh and
+# reports bpy.data sizes and process RSS, failing if they keep growing after warm-up.
+#
+#   blender --background --python augmentation_soak.py -- --iterations 5000
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def datablock_counts():
+    return {
+        'meshes': len(bpy.data.meshes),
+        'objects': len(bpy.data.objects),
+        'lattices': len(bpy.data.lattices),
+        'textures': len(bpy.data.textures),
+        'materials': len(bpy.data.materials),
+    }
+
+
+p = argparse.ArgumentParser(description='Check that augmentation keeps bpy.data and memory flat.')
+p.add_argument('--mesh_fpath', type=str, help='Base mesh (.stl); defaults to an ico sphere.')
+p.add_argument('--iterations', type=int, default=5000)
+p.add_argument('--report_every', type=int, default=250)
+p.add_argument('--reimport_every', type=int, default=35, help='Start from a fresh base mesh every N variants.')
+p.add_argument('--max_rss_growth_mb', type=float, default=50.0)
+argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+opt = p.parse_args(argv)
+
+work_dir = tempfile.mkdtemp(prefix='augmentation_soak_')
+mesh_fpath = opt.mesh_fpath
+if mesh_fpath is None:
+    bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=4)
+    mesh_fpath = os.path.join(work_dir, 'soak_base.stl')
+    bpy.ops.export_mesh.stl(filepath=mesh_fpath, use_selection=True)
+
+aug = FastPollenAugmentor(os.path.dirname(mesh_fpath), work_dir, num_augmentations=5)
+names = list(aug.deformations)
+base = None
+baseline = None
+
+for it in range(opt.iterations):
+    if it % opt.reimport_every == 0:
+        base = aug.import_and_reduce(mesh_fpath)
+    name = names[it % len(names)]
+    obj, _ = aug.apply_deformation(aug.duplicate(base), name, 0.4 * (it % 5) / 4.0, it)
+    aug.bake(obj)
+    aug.discard(obj)
+
+    if (it + 1) % opt.report_every == 0:
+        counts = datablock_counts()
+        rss = rss_mb()
+        print('[soak] {0:6d} variants  rss={1:8.1f} MB  {2}'.format(it + 1, rss, counts))
+        # First report is the warm-up baseline: pools are populated by then
+        if baseline is None:
+            baseline = (counts, rss)
+
+counts, rss = datablock_counts(), rss_mb()
+grown = [k for k in counts if counts[k] > baseline[0][k]]
+if grown or rss - baseline[1] > opt.max_rss_growth_mb:
+    print('[soak] FAIL: datablocks grew {0}, rss {1:.1f} -> {2:.1f} MB'.format(grown, baseline[1], rss))
+    sys.exit(1)
+print('[soak] OK: bpy.data and memory flat over {0} variants'.format(opt.iterations))
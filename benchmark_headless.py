@@ -0,0 +1,174 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import bpy_stub
+from verify_renders import FIXED_VIEWS
+
+# Times (and with --check, verifies) the pure-Python/NumPy parts of the pipeline on plain
+# CPython, with bpy/mathutils replaced by bpy_stub: camera sampling and pose conversion,
+# near/far and view screening, split generation, driver job-graph building, and one
+# BlenderInterface session with rendering recorded instead of executed.
+#
+#   python benchmark_headless.py            # timings
+#   python benchmark_headless.py --check    # also assert invariants; exit 1 on failure
+
+
+def timeit(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def sphere_mesh(n_lat=64, n_lon=128):
+    theta = np.linspace(0, np.pi, n_lat)
+    phi = np.linspace(0, 2 * np.pi, n_lon, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+    verts = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], -1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(n_lat - 1), np.arange(n_lon), indexing="ij")
+    a = i * n_lon + j
+    b = i * n_lon + (j + 1) % n_lon
+    quads = np.stack([a, b, b + n_lon, a + n_lon], -1).reshape(-1, 4)
+    return verts, quads
+
+
+def check_poses(util, cv_poses, blender_poses, failures):
+    rot = cv_poses[:, :3, :3]
+    if not np.allclose(np.einsum("nji,njk->nik", rot, rot), np.eye(3), atol=1e-6):
+        failures.append("look_at rotations are not orthonormal")
+    # OpenCV cameras look down +z: the origin must be straight ahead
+    to_origin = util.normalize(-cv_poses[:, :3, 3])
+    if not np.allclose(np.einsum("ni,ni->n", cv_poses[:, :3, 2], to_origin), 1., atol=1e-6):
+        failures.append("look_at cameras do not face the target")
+    # Blender pose -> world2cam written by render() -> inverse must give back the OpenCV pose
+    camera = bpy_stub.Object("Camera", type="CAMERA")
+    for cv, bl in zip(cv_poses[:8], blender_poses[:8]):
+        camera.matrix_world = bl
+        cam2world = np.array(util.get_world2cam_from_blender_cam(camera).inverted())
+        if not np.allclose(cam2world, cv, atol=1e-6):
+            failures.append("cv -> blender -> cv pose round trip differs")
+            break
+
+
+def main(args):
+    start = time.perf_counter()
+    in_stub = bpy_stub.install()
+    import util
+    import blender_interface
+    import render_driver
+    startup = time.perf_counter() - start
+    print(f"[INFO] bpy {'stub' if in_stub else 'real'}; imported util, blender_interface, render_driver "
+          f"in {startup * 1000:.0f} ms")
+
+    failures = []
+    rows = []
+
+    np.random.seed(0)
+    locs = util.sample_spherical(args.views, 2.0)
+    t, cv_poses = timeit(lambda: util.look_at(locs, np.zeros((1, 3))))
+    rows.append(("look_at", args.views, t))
+    t, spiral = timeit(lambda: util.get_archimedean_spiral(2.0, 250))
+    rows.append(("get_archimedean_spiral", 250, t))
+    t, blender_poses = timeit(lambda: util.get_blender_poses(locs), repeat=2)
+    rows.append(("get_blender_poses", args.views, t))
+
+    verts, quads = sphere_mesh()
+    mesh = bpy_stub.mesh_data("sphere", verts, quads)
+    t, (points, tris) = timeit(lambda: util.get_mesh_arrays(mesh))
+    rows.append(("get_mesh_arrays", len(quads), t))
+    t, near_far = timeit(lambda: util.compute_near_far(blender_poses, points))
+    rows.append(("compute_near_far", args.views, t))
+    K = np.array([[262.5, 0., 128.], [0., 262.5, 128.], [0., 0., 1.]])
+    t, (coverage, in_frame) = timeit(lambda: util.compute_view_coverage(blender_poses, points[::4], K, (256, 256)))
+    rows.append(("compute_view_coverage", args.views, t))
+    # An off-center ellipsoid: its bounding box corners overestimate the radius by ~sqrt(3)
+    blob = points * np.array([1.0, 0.6, 0.3]) + np.array([0.5, -0.2, 0.1])
+    t, (center, radius) = timeit(lambda: util.bounding_sphere(blob))
+    rows.append(("bounding_sphere", len(blob), t))
+
+    work = tempfile.mkdtemp(prefix="headless_")
+    try:
+        mesh_dir = os.path.join(work, "meshes")
+        os.makedirs(mesh_dir)
+        for i in range(args.meshes):
+            open(os.path.join(mesh_dir, f"pollen_{i:05d}.stl"), "wb").close()
+        names = render_driver.list_meshes(mesh_dir)
+        t, splits = timeit(lambda: render_driver.generate_splits(names, os.path.join(work, "splits.json")))
+        rows.append(("generate_splits", args.meshes, t))
+
+        config = {"mesh_dir": mesh_dir, "renders": [
+            {"output_dir": os.path.join(work, f"out_{r}"), "resolution": r} for r in (128, 256)]}
+        t, (graph, stats) = timeit(lambda: render_driver.build_job_graph(render_driver.expand_renders(config)),
+                                   repeat=1)
+        rows.append(("build_job_graph", stats["requested"], t))
+
+        def session():
+            bpy_stub.reset()
+            renderer = blender_interface.BlenderInterface(resolution=256, profile="throughput", threads=2,
+                                                          verbose=False)
+            obj = bpy_stub.add_mesh_object("sphere", verts, quads)
+            if args.bake:
+                renderer.bake_lighting(obj)
+            renderer.render(os.path.join(work, "render"), blender_poses, write_cam_params=True)
+            return renderer
+        t, _ = timeit(session, repeat=1)
+        rows.append(("BlenderInterface render (stub)", args.views, t))
+        n_renders = sum(1 for c in bpy_stub.calls if c[0] == "render.render")
+        n_bakes = sum(1 for c in bpy_stub.calls if c[0] == "object.bake_image")
+
+        if args.check:
+            check_poses(util, cv_poses, blender_poses, failures)
+            # The drivers and verify_renders size spiral/orthogonal renders from FIXED_VIEWS
+            if len(spiral) != FIXED_VIEWS["spiral"] or not np.allclose(np.linalg.norm(spiral, axis=1), 2.0):
+                failures.append(f"spiral has {len(spiral)} poses, FIXED_VIEWS says {FIXED_VIEWS['spiral']}")
+            if len(util.get_camera_locations("orthogonal", 0, 2.0)) != FIXED_VIEWS["orthogonal"]:
+                failures.append("orthogonal rig does not match FIXED_VIEWS")
+            depths = np.einsum("npi,ni->np", points[None] - locs[:, None], cv_poses[:, :3, 2])
+            if np.any(near_far[:, 0] > depths.min(1) + 1e-6) or np.any(near_far[:, 1] < depths.max(1) - 1e-6):
+                failures.append("near/far does not bracket the geometry")
+            if np.linalg.norm(blob - center, axis=1).max() > radius * (1 + 1e-9) or abs(radius - 1.0) > 0.01:
+                failures.append(f"bounding sphere of the ellipsoid should enclose it with radius ~1, got {radius:.4f}")
+            if np.any(in_frame < 0.5) or np.any(coverage < 0.5):
+                failures.append("unit sphere seen from radius 2 should fill most of the frame")
+            flat = sorted(sum(splits.values(), []))
+            if flat != sorted(names) or splits != render_driver.generate_splits(names, os.path.join(work, "s2.json")):
+                failures.append("splits are not a deterministic partition of the meshes")
+            if stats["duplicates"] or len(graph) != args.meshes or any(len(v) != 2 for v in graph.values()):
+                failures.append("job graph should hold one job with two targets per mesh")
+            if n_renders != args.views:
+                failures.append(f"expected {args.views} recorded renders, got {n_renders}")
+            # The lighting bake is per object, never per view
+            if n_bakes != (1 if args.bake else 0):
+                failures.append(f"expected {int(args.bake)} lighting bake(s), got {n_bakes}")
+            n_poses = len(os.listdir(os.path.join(work, "render", "pose")))
+            if n_poses != args.views:
+                failures.append(f"expected {args.views} pose files, got {n_poses}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{'step':<32}{'items':>8}{'ms':>10}")
+    for name, n, t in rows:
+        print(f"{name:<32}{n:>8}{t * 1000:>10.2f}")
+    if args.check:
+        for f in failures:
+            print(f"[FAIL] {f}")
+        print("[OK] all checks passed" if not failures else f"[FAIL] {len(failures)} check(s) failed")
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmark/check the pipeline's pure parts without Blender.")
+    p.add_argument("--views", type=int, default=128)
+    p.add_argument("--meshes", type=int, default=2000)
+    p.add_argument("--check", action="store_true", help="Assert invariants and exit 1 on failure.")
+    p.add_argument("--bake", action="store_true", help="Bake the lighting before the recorded render session.")
+    sys.exit(main(p.parse_args()))
@@ -0,0 +1,165 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, features
+
+from export_tensors import list_views
+
+# Storage and decode cost of the view image formats, measured on real renders (--render_dir)
+# or on synthetic gray-on-white views:
+#
+#   python benchmark_image_formats.py --render_dir 128_views/256_res --num_views 256
+#
+# Per option: bytes/view, encode ms/view, decode ms/view (to the uint8 RGB array the readers
+# use) and whether the decoded pixels equal the source. PNG zlib levels map to Blender's
+# compression setting as level = compression * 9 / 100 (Blender's default 15 is level 1).
+# WebP and palette PNG are host-side conversions only: Blender 2.79 cannot write them.
+
+
+def sample_views(render_dir, num_views):
+    views = []
+    for split in sorted(os.listdir(render_dir)):
+        split_dir = os.path.join(render_dir, split)
+        if not (split.startswith("pollen_") and os.path.isdir(split_dir)):
+            continue
+        for obj in sorted(os.listdir(split_dir)):
+            object_dir = os.path.join(split_dir, obj)
+            for v in list_views(object_dir):
+                with Image.open(os.path.join(object_dir, "rgb", v + ".png")) as img:
+                    views.append(np.asarray(img.convert("RGBA")))
+                if len(views) >= num_views:
+                    return views
+    return views
+
+
+def synthetic_views(num_views, resolution, seed=0):
+    """Lambert-shaded gray blobs on white, like the flat-shaded pollen renders."""
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[-1:1:resolution * 1j, -1:1:resolution * 1j]
+    views = []
+    for _ in range(num_views):
+        r = 0.5 + 0.1 * np.sin(rng.uniform(3, 9) * np.arctan2(y, x) + rng.uniform(0, np.pi))
+        inside = x ** 2 + y ** 2 < r ** 2
+        z = np.sqrt(np.clip(r ** 2 - x ** 2 - y ** 2, 0, None))
+        light = rng.normal(size=3)
+        light /= np.linalg.norm(light)
+        shade = np.clip((x * light[0] + y * light[1] + z * light[2]) / np.maximum(r, 1e-6), 0, 1)
+        # Flat shading quantizes to few gray levels per facet
+        gray = np.where(inside, np.round((0.3 + 0.6 * shade) * 255 / 4) * 4, 255).astype(np.uint8)
+        views.append(np.dstack([gray, gray, gray, np.full_like(gray, 255)]))
+    return views
+
+
+def _png(mode, level, bits=8):
+    def encode(view, path):
+        rgb = view[..., :3]
+        if mode == "P":
+            img = Image.fromarray(rgb).quantize(colors=256, method=Image.MEDIANCUT, dither=Image.NONE)
+        elif bits == 16:
+            img = Image.fromarray(rgb[..., 0].astype(np.uint16) * 257)
+        else:
+            img = Image.fromarray(view if mode in ("RGBA", "LA") else rgb).convert(mode)
+        img.save(path, format="PNG", compress_level=level)
+    return encode
+
+
+def _webp(view, path):
+    Image.fromarray(view[..., :3]).save(path, format="WEBP", lossless=True, quality=100, method=4)
+
+
+def decode_image(path):
+    with Image.open(path) as img:
+        if img.mode.startswith("I;16"):
+            return np.repeat((np.asarray(img) >> 8).astype(np.uint8)[..., None], 3, axis=-1)
+        return np.asarray(img.convert("RGB"))
+
+
+def bench_files(name, views, encode, ext, work):
+    out_dir = os.path.join(work, name)
+    os.makedirs(out_dir)
+    paths = [os.path.join(out_dir, "%06d%s" % (i, ext)) for i in range(len(views))]
+    start = time.perf_counter()
+    for view, path in zip(views, paths):
+        encode(view, path)
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = [decode_image(p) for p in paths]
+    decode_s = time.perf_counter() - start
+    lossless = all(np.array_equal(d, v[..., :3]) for d, v in zip(decoded, views))
+    size = sum(os.path.getsize(p) for p in paths)
+    return size, encode_s, decode_s, lossless
+
+
+def bench_raw(channels, views, work):
+    """One uint8 [N, H, W, C] .npy per object (export_tensors.pack_rgb), read through a memmap."""
+    path = os.path.join(work, "rgb_%d.npy" % channels)
+    start = time.perf_counter()
+    pack = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8,
+                                     shape=(len(views),) + views[0].shape[:2] + (channels,))
+    for i, v in enumerate(views):
+        pack[i] = v[..., :channels] if channels > 1 else v[..., :1]
+    pack.flush()
+    del pack
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    pack = np.load(path, mmap_mode="r")
+    decoded = [np.array(pack[i]) for i in range(len(views))]
+    decode_s = time.perf_counter() - start
+    lossless = all(np.array_equal(np.broadcast_to(d[..., :3] if channels > 1 else d, v[..., :3].shape), v[..., :3])
+                   for d, v in zip(decoded, views))
+    del pack
+    return os.path.getsize(path), encode_s, decode_s, lossless
+
+
+def main(args):
+    views = sample_views(args.render_dir, args.num_views) if args.render_dir else \
+        synthetic_views(args.num_views, args.resolution)
+    if not views:
+        raise SystemExit("[ERROR] no views found")
+    gray = all(np.array_equal(v[..., 0], v[..., 1]) and np.array_equal(v[..., 0], v[..., 2]) for v in views)
+    print(f"[INFO] {len(views)} views of {views[0].shape[1]}x{views[0].shape[0]} "
+          f"({'real renders' if args.render_dir else 'synthetic'}, {'gray' if gray else 'color'})")
+
+    options = [
+        ("png RGBA z1 (blender default)", _png("RGBA", 1), ".png"),
+        ("png RGBA z6", _png("RGBA", 6), ".png"),
+        ("png RGB z0 (compression 0)", _png("RGB", 0), ".png"),
+        ("png RGB z1", _png("RGB", 1), ".png"),
+        ("png RGB z6", _png("RGB", 6), ".png"),
+        ("png RGB z9", _png("RGB", 9), ".png"),
+        ("png BW z1", _png("L", 1), ".png"),
+        ("png BW z6", _png("L", 6), ".png"),
+        ("png BW 16-bit z6", _png("L", 6, bits=16), ".png"),
+        ("png palette z6 (host)", _png("P", 6), ".png"),
+    ]
+    if features.check("webp"):
+        options.append(("webp lossless (host)", _webp, ".webp"))
+    else:
+        print("[WARN] Pillow built without WebP — skipping it")
+
+    work = tempfile.mkdtemp(prefix="img_formats_")
+    rows = []
+    try:
+        for i, (name, encode, ext) in enumerate(options):
+            rows.append((name,) + bench_files(f"opt{i}", views, encode, ext, work))
+        rows.append(("raw rgb.npy RGB (memmap)",) + bench_raw(3, views, work))
+        rows.append(("raw rgb.npy L (memmap)",) + bench_raw(1, views, work))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    n = len(views)
+    print(f"{'option':<32}{'bytes/view':>12}{'encode ms':>11}{'decode ms':>11}{'lossless':>10}")
+    for name, size, enc, dec, lossless in rows:
+        print(f"{name:<32}{size / n:>12.0f}{enc / n * 1000:>11.3f}{dec / n * 1000:>11.3f}{'yes' if lossless else 'NO':>10}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Compare view image formats: size, encode and decode time.")
+    p.add_argument("--render_dir", default=None, help="Render output dir with pollen_{split} folders.")
+    p.add_argument("--num_views", type=int, default=128)
+    p.add_argument("--resolution", type=int, default=256, help="Synthetic views only.")
+    main(p.parse_args())
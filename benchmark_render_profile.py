@@ -0,0 +1,130 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Measures rendered views/second for each BlenderInterface profile with the same pool
+# layout parallel.py uses: num_processes Blender processes, each rendering one mesh.
+#
+#   python benchmark_render_profile.py --blender "C:\Program Files\Blender2.7\blender.exe" \
+#       --mesh_dir <meshes> --num_meshes 24 --num_processes 12
+#
+# The baked row renders with --bake_lighting; views are seeded per object, so its images are
+# compared pixel by pixel with the throughput row's (mean / max absolute difference, 0-255).
+
+
+def count_views(output_dir):
+    total = 0
+    for root, _, files in os.walk(output_dir):
+        if os.path.basename(root) == "rgb":
+            total += sum(1 for f in files if f.endswith(".png"))
+    return total
+
+
+def image_difference(dir_a, dir_b):
+    """:return: (mean, max) absolute RGB difference over the views both directories hold."""
+    if Image is None:
+        return None
+    total, count, worst = 0., 0, 0
+    for root, _, files in os.walk(dir_a):
+        if os.path.basename(root) != "rgb":
+            continue
+        other = os.path.join(dir_b, os.path.relpath(root, dir_a))
+        for f in files:
+            if not f.endswith(".png") or not os.path.exists(os.path.join(other, f)):
+                continue
+            a = np.asarray(Image.open(os.path.join(root, f)).convert("RGB"), dtype=np.int16)
+            b = np.asarray(Image.open(os.path.join(other, f)).convert("RGB"), dtype=np.int16)
+            diff = np.abs(a - b)
+            total += diff.mean()
+            count += 1
+            worst = max(worst, int(diff.max()))
+    return (total / count, worst) if count else None
+
+
+def render_one(mesh_path, blender_path, script_path, output_dir, profile, threads, num_observations, resolution,
+               bake_lighting=False):
+    mesh_name = os.path.splitext(os.path.basename(mesh_path))[0]
+    cmd = [
+        blender_path,
+        "--background",
+        "--python", script_path,
+        "--addons", "io_mesh_stl",
+        "--",
+        "--mesh_fpath", mesh_path,
+        "--output_dir", output_dir,
+        "--split_name", "train",
+        "--object_name", mesh_name,
+        "--num_observations", str(num_observations),
+        "--resolution", str(resolution),
+        "--profile", profile,
+    ]
+    if threads is not None:
+        cmd += ["--threads", str(threads)]
+    if bake_lighting:
+        cmd.append("--bake_lighting")
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+
+def run_profile(profile, threads, meshes, args, bake_lighting=False, keep=False):
+    output_dir = tempfile.mkdtemp(prefix=f"bench_{profile}_")
+    worker = partial(render_one, blender_path=args.blender, script_path=args.script, output_dir=output_dir,
+                     profile=profile, threads=threads, num_observations=args.num_observations,
+                     resolution=args.resolution, bake_lighting=bake_lighting)
+    start = time.perf_counter()
+    with Pool(processes=args.num_processes) as pool:
+        codes = pool.map(worker, meshes)
+    elapsed = time.perf_counter() - start
+    views = count_views(output_dir)
+    if not keep:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        output_dir = None
+    return views, elapsed, sum(1 for c in codes if c != 0), output_dir
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    p = argparse.ArgumentParser(description="Benchmark render profiles at the parallel.py pool size.")
+    p.add_argument("--blender", required=True, help="Path to the Blender 2.7x executable.")
+    p.add_argument("--mesh_dir", required=True)
+    p.add_argument("--script", default=os.path.join(here, "shapenet_spherical_renderer_multi_core.py"))
+    p.add_argument("--num_meshes", type=int, default=24)
+    p.add_argument("--num_processes", type=int, default=12, help="Pool size (parallel.py uses 12).")
+    p.add_argument("--num_observations", type=int, default=32)
+    p.add_argument("--resolution", type=int, default=256)
+    args = p.parse_args()
+
+    meshes = sorted(
+        os.path.join(args.mesh_dir, f) for f in os.listdir(args.mesh_dir)
+        if f.lower().endswith((".stl", ".obj"))
+    )[:args.num_meshes]
+    budget = max(1, (os.cpu_count() or 1) // args.num_processes)
+
+    print(f"[INFO] {len(meshes)} meshes x {args.num_observations} views, {args.num_processes} processes, "
+          f"{os.cpu_count()} cores")
+    print(f"{'profile':<12}{'threads':>9}{'views':>8}{'seconds':>10}{'views/s':>10}{'failed':>8}")
+    kept = {}
+    for label, profile, threads, bake in [("default", "default", None, False),
+                                          ("throughput", "throughput", budget, False),
+                                          ("baked", "throughput", budget, True)]:
+        views, elapsed, failed, kept[label] = run_profile(profile, threads, meshes, args, bake_lighting=bake,
+                                                          keep=profile == "throughput")
+        print(f"{label:<12}{str(threads or 'auto'):>9}{views:>8}{elapsed:>10.1f}{views / elapsed:>10.2f}{failed:>8}")
+
+    diff = image_difference(kept["throughput"], kept["baked"])
+    if diff is not None:
+        print(f"[INFO] baked vs lit images: mean abs difference {diff[0]:.2f}, max {diff[1]} (0-255)")
+    for output_dir in kept.values():
+        if output_dir is not None:
+            shutil.rmtree(output_dir, ignore_errors=True)
@@ -1,12 +1,24 @@
+import math
 import os
+import numpy as np
 import util
 import bpy
 from mathutils import Vector
 
 
+RENDER_PROFILES = ('default', 'throughput')
+# PNG channel layouts Blender can write; images are gray meshes on an opaque background
+# (alpha_mode 'SKY'), so 'BW' and 'RGB' lose nothing while RGBA stores a constant alpha
+PNG_COLOR_MODES = ('BW', 'RGB', 'RGBA')
+
+
 class BlenderInterface():
-    def __init__(self, resolution=256, background_color=(1,1,1)):
+    def __init__(self, resolution=256, background_color=(1,1,1), profile='default', threads=None,
+                 verbose=True):
         self.resolution = resolution
+        self.profile = profile
+        # verbose=False skips the util.dump attribute listing on every import
+        self.verbose = verbose
 
         # Delete the default cube
         bpy.ops.object.delete()
@@ -54,8 +66,70 @@ class BlenderInterface():
         self.camera.data.sensor_height = self.camera.data.sensor_width
         util.set_camera_focal_length_in_world_units(self.camera.data, 525./512*resolution)
 
+        if profile == 'throughput':
+            self.apply_throughput_profile(threads)
+        elif threads is not None:
+            self.blender_renderer.threads_mode = 'FIXED'
+            self.blender_renderer.threads = threads
+
         bpy.ops.object.select_all(action='DESELECT')
 
+    def set_image_format(self, color_mode='RGBA', color_depth='8', compression=15):
+        '''
+        PNG layout of the written views. compression is Blender's 0-100 (zlib level ~ compression * 9 / 100):
+        lower values encode faster and decode at the same speed, at some cost in file size.
+        '''
+        settings = self.blender_renderer.image_settings
+        settings.file_format = 'PNG'
+        settings.color_mode = color_mode
+        settings.color_depth = str(color_depth)
+        settings.compression = int(compression)
+
+    def set_resolution(self, resolution):
+        '''Switch the output resolution between renders of one session, keeping the field of view.'''
+        self.resolution = resolution
+        self.blender_renderer.resolution_x = resolution
+        self.blender_renderer.resolution_y = resolution
+        util.set_camera_focal_length_in_world_units(self.camera.data, 525./512*resolution)
+        if self.profile == 'throughput':
+            self.blender_renderer.tile_x = resolution
+            self.blender_renderer.tile_y = max(16, resolution // self.blender_renderer.threads)
+
+    def apply_throughput_profile(self, threads=None):
+        '''
+        Settings for headless batch rendering of a flat-shaded mesh: switch off every pipeline
+        stage the images do not use and pin the thread count, so pool processes x threads
+        does not oversubscribe the machine. Output images are unchanged.
+        '''
+        r = self.blender_renderer
+        threads = threads or 1
+        r.threads_mode = 'FIXED'
+        r.threads = threads
+        # One full-width stripe per thread; a single tile when rendering single-threaded
+        r.tile_x = self.resolution
+        r.tile_y = max(16, self.resolution // threads)
+
+        # Environment light is gathered with raytracing, so keep it only while it is in use
+        r.use_raytrace = bpy.context.scene.world.light_settings.use_environment_light
+        r.octree_resolution = '64'
+        r.use_shadows = False
+        r.use_sss = False
+        r.use_envmaps = False
+        r.use_motion_blur = False
+        r.use_edge_enhance = False
+        r.use_freestyle = False
+        r.use_compositing = False
+        r.use_sequencer = False
+        r.use_border = False
+        r.use_stamp = False
+        r.use_save_buffers = False
+        r.use_free_image_textures = True
+        r.use_overwrite = True
+        r.use_placeholder = False
+
+        # Every bpy.ops call otherwise pushes an undo step
+        bpy.context.user_preferences.edit.use_global_undo = False
+
     def import_mesh(self, fpath, scale=1., object_world_matrix=None):
         ext = os.path.splitext(fpath)[-1]
         if ext == '.obj':
@@ -66,7 +140,15 @@ class BlenderInterface():
             bpy.ops.import_mesh.ply(filepath=str(fpath))
 
         obj = bpy.context.selected_objects[0]
-        util.dump(bpy.context.selected_objects)
+        if self.verbose:
+            util.dump(bpy.context.selected_objects)
+        self.setup_object(obj, scale=scale, object_world_matrix=object_world_matrix)
+
+    def setup_object(self, obj, scale=1., object_world_matrix=None):
+        # Shared by import_mesh and callers that build the mesh in memory (e.g. fused augmentation)
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select = True
+        bpy.context.scene.objects.active = obj
 
         if object_world_matrix is not None:
             obj.matrix_world = object_world_matrix
@@ -100,7 +182,149 @@ class BlenderInterface():
             except:
                 continue
 
-    def render(self, output_dir, blender_cam2world_matrices, write_cam_params=False, object_radius=1.0):
+    def bake_lighting(self, obj):
+        '''
+        Bake the static lighting (the three sun lamps plus environment light) into a vertex color
+        layer of obj and make its materials shadeless vertex-color materials. The lamps have no
+        shadows or specular, so the shading is view independent: it is computed once here and
+        every view afterwards is plain rasterization. With flat shading (STL imports) the sun
+        terms are exact per face; environment light is sampled at the face corners.
+        '''
+        scene = bpy.context.scene
+        r = self.blender_renderer
+        mesh = obj.data
+        for mat in mesh.materials:
+            # A re-bake (e.g. after setup_object on a new variant) must see the lit material
+            mat.use_shadeless = False
+            mat.use_vertex_color_paint = False
+
+        layer = mesh.vertex_colors.get('BakedLight') or mesh.vertex_colors.new(name='BakedLight')
+        mesh.vertex_colors.active = layer
+
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select = True
+        scene.objects.active = obj
+        r.bake_type = 'FULL'
+        r.use_bake_to_vertex_color = True
+        r.use_bake_selected_to_active = False
+        # Environment light is gathered with raytracing during the bake only
+        r.use_raytrace = scene.world.light_settings.use_environment_light
+        bpy.ops.object.bake_image()
+
+        for mat in mesh.materials:
+            mat.use_shadeless = True
+            mat.use_vertex_color_paint = True
+        # Shadeless views need neither the octree nor raytracing
+        r.use_raytrace = False
+
+    def get_scene_vertices(self):
+        '''World-space vertices of the selected mesh objects (the ones about to be rendered).'''
+        bpy.context.scene.update()
+        verts = [util.get_vertices(ob.data, ob.matrix_world)
+                 for ob in bpy.context.selected_objects if ob.type == 'MESH']
+        return np.concatenate(verts) if verts else np.zeros((0, 3))
+
+    def visible_radius(self, camera_distance):
+        '''
+        Radius of the largest origin-centered sphere that a camera at camera_distance looking at
+        the origin sees completely, i.e. that no view can clip. Independent of the resolution.
+        '''
+        K = util.get_calibration_matrix_K_from_blender(self.camera.data)
+        tan_half_fov = min(K[0][2], K[1][2]) / K[0][0]
+        return camera_distance * math.sin(math.atan(tan_half_fov))
+
+    def object_radius(self, method, camera_distance):
+        '''
+        Default normalized radius of a method: 1 for 'bbox' (the unit sphere of the legacy
+        renders), visible_radius(camera_distance) for the tight 'sphere' fit.
+        '''
+        return self.visible_radius(camera_distance) if method == 'sphere' else 1.0
+
+    def normalize_object(self, obj, method='bbox', radius=1.0):
+        '''
+        Center obj at the origin and scale it to radius.
+        - 'bbox': the sphere around its 8 bound_box corners (the scale of every render made
+          before normalization.txt existed).
+        - 'sphere': the near-minimal bounding sphere of its vertices (util.bounding_sphere),
+          up to sqrt(3) tighter; with visible_radius it fills the frame without clipping.
+        :return: the bounding radius before scaling; obj was scaled by radius / it.
+        '''
+        if method not in util.NORMALIZATIONS:
+            raise ValueError('Unknown normalization {}, expected one of {}'.format(method, util.NORMALIZATIONS))
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select = True
+        bpy.context.scene.objects.active = obj
+        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
+        obj.location = (0., 0., 0.)
+        bpy.context.scene.update()
+
+        if method == 'bbox':
+            bbox_corners = [obj.matrix_world * Vector(corner) for corner in obj.bound_box]
+            center = sum(bbox_corners, Vector((0.0, 0.0, 0.0))) / 8.0
+            bound_radius = max((v - center).length for v in bbox_corners)
+            center = (0., 0., 0.)  # the origin is already at the bound_box center
+        else:
+            center, bound_radius = util.bounding_sphere(util.get_vertices(obj.data, obj.matrix_world))
+        if bound_radius > 0:
+            # Scaling acts about the origin (= obj.location), so the center moves with it
+            factor = radius / bound_radius
+            obj.scale = [s * factor for s in obj.scale]
+            obj.location = [-c * factor for c in center]
+            bpy.context.scene.update()
+        return bound_radius
+
+    def screen_views(self, blender_cam2world_matrices, indices, points, resample_pose=None,
+                     min_coverage=0.02, min_in_frame=0.5, max_resample=20):
+        '''
+        Reject views where the object falls (mostly) off-frame, judged from the projected
+        vertices before anything is rendered, and replace them with poses from resample_pose.
+        Views without a sampler (fixed spiral/orthogonal rigs) are kept and only reported.
+        :return: (poses, stats) with the screened pose list and rejection counts.
+        '''
+        poses = list(blender_cam2world_matrices)
+        K = np.array(util.get_calibration_matrix_K_from_blender(self.camera.data))
+        size = (self.resolution, self.resolution)
+        # A few thousand vertices are plenty to judge coverage
+        points = points[::max(1, len(points) // 5000)]
+
+        def acceptable(mats):
+            coverage, in_frame = util.compute_view_coverage(mats, points, K, size)
+            return (coverage >= min_coverage) & (in_frame >= min_in_frame)
+
+        stats = {'tried': len(indices), 'rejected': 0, 'replaced': 0, 'kept_invalid': 0}
+        if not indices:
+            return poses, stats
+        ok = acceptable([poses[i] for i in indices])
+        for i in [idx for idx, good in zip(indices, ok) if not good]:
+            stats['rejected'] += 1
+            for _ in range(max_resample if resample_pose is not None else 0):
+                candidate = resample_pose()
+                stats['tried'] += 1
+                if acceptable([candidate])[0]:
+                    poses[i] = candidate
+                    stats['replaced'] += 1
+                    break
+                stats['rejected'] += 1
+            else:
+                stats['kept_invalid'] += 1
+        return poses, stats
+
+    def render(self, output_dir, blender_cam2world_matrices, write_cam_params=False, object_radius=None, views=None,
+               resample_pose=None, min_coverage=0.02, keep_objects=False, normalization=None):
+        '''
+        :param object_radius: if given, near/far are camera distance -/+ this radius (legacy);
+                              by default they are the tight depth range of the selected meshes.
+        :param views: optional indices to (re-)render even if their image exists, e.g. from a
+                      verify_renders repair job. Intrinsics and near_far are always rewritten.
+        :param resample_pose: callable returning a fresh blender cam2world matrix; views about to
+                              be rendered whose projected object covers less than min_coverage
+                              of the frame are replaced with samples from it (see screen_views).
+        :param keep_objects: leave the rendered meshes in the scene, e.g. to render them again
+                             at another resolution or view count.
+        :param normalization: (method, radius) the meshes were normalized with; recorded in
+                              normalization.txt once every pending view is written, so an
+                              interrupted render still reads as the previous normalization.
+        '''
 
         if write_cam_params:
             img_dir = os.path.join(output_dir, 'rgb')
@@ -111,6 +335,22 @@ class BlenderInterface():
             img_dir = output_dir
             util.cond_mkdir(img_dir)
 
+        if views is not None:
+            pending = [i for i in range(len(blender_cam2world_matrices)) if i in views]
+        else:
+            pending = [i for i in range(len(blender_cam2world_matrices))
+                       if not os.path.exists(os.path.join(img_dir, '%06d.png' % i))]
+
+        points = self.get_scene_vertices()
+        if len(points) == 0 and object_radius is None:
+            object_radius = 1.0
+        if min_coverage is not None and len(points) > 0:
+            blender_cam2world_matrices, stats = self.screen_views(
+                blender_cam2world_matrices, pending, points, resample_pose, min_coverage=min_coverage)
+            print('[views] {0}: rejected {1}/{2} poses ({3:.1%}), replaced {4}, kept {5} invalid fixed views'.format(
+                os.path.basename(os.path.normpath(output_dir)), stats['rejected'], stats['tried'],
+                stats['rejected'] / float(max(stats['tried'], 1)), stats['replaced'], stats['kept_invalid']))
+
         if write_cam_params:
             # Save intrinsics
             K = util.get_calibration_matrix_K_from_blender(self.camera.data)
@@ -128,24 +368,24 @@ class BlenderInterface():
             #with open(os.path.join(output_dir, 'near_far.txt'), 'w') as nf_file:
             #    nf_file.write('%.6f %.6f\n' % (near, far))
                 
-            # Compute per-view near/far from camera distance to origin
-            cam_locs = [mat.to_translation() for mat in blender_cam2world_matrices]
-            near_far_lines = []
-            for loc in cam_locs:
-                dist = (loc - Vector((0.0, 0.0, 0.0))).length
-                # Use actual object radius with safe padding
-                near = max(0.1, dist - object_radius)
-                far = dist + object_radius
-                near_far_lines.append("{:.6f} {:.6f}".format(near, far))
+            if object_radius is not None:
+                # Compute per-view near/far from camera distance to origin
+                cam_locs = [mat.to_translation() for mat in blender_cam2world_matrices]
+                near_far = []
+                for loc in cam_locs:
+                    dist = (loc - Vector((0.0, 0.0, 0.0))).length
+                    # Use actual object radius with safe padding
+                    near_far.append((max(0.1, dist - object_radius), dist + object_radius))
+            else:
+                # Project the actual geometry into every camera in one vectorized pass
+                near_far = util.compute_near_far(blender_cam2world_matrices, points)
+            near_far_lines = ["{:.6f} {:.6f}".format(near, far) for near, far in near_far]
 
             with open(os.path.join(output_dir, 'near_far.txt'), 'w') as nf_file:
                 nf_file.write("\n".join(near_far_lines))
 
-        for i, mat in enumerate(blender_cam2world_matrices):
-            self.camera.matrix_world = mat
-
-            if os.path.exists(os.path.join(img_dir, '%06d.png' % i)):
-                continue
+        for i in pending:
+            self.camera.matrix_world = blender_cam2world_matrices[i]
 
             self.blender_renderer.filepath = os.path.join(img_dir, '%06d.png' % i)
             bpy.ops.render.render(write_still=True)
@@ -157,6 +397,12 @@ class BlenderInterface():
                     matrix_flat = [cam2world[j][k] for j in range(4) for k in range(4)]
                     pose_file.write(' '.join(map(str, matrix_flat)) + '\n')
 
+        if write_cam_params and normalization is not None:
+            util.write_normalization(output_dir, normalization)
+
+        if keep_objects:
+            return
+
         # Clean up
         meshes_to_remove = []
         for ob in bpy.context.selected_objects:
@@ -0,0 +1,253 @@
+import json
+import os
+import random
+import struct
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Runs a Blender child with stdout and stderr merged into one pipe that a reader thread
+# drains line by line into a per-job rotating log file. Only the last `tail_lines` lines are
+# kept in memory (for error reports), so the driver's memory stays flat however much the
+# child prints, and the child never blocks on a full pipe.
+#
+# A watchdog kills the child when it exceeds its time budget (scaled by face and view count)
+# or stops making progress (no image written for hang_seconds). Failed attempts are retried
+# with exponential backoff, and meshes that fail every attempt go to a quarantine list
+# that later runs skip.
+
+BlenderResult = namedtuple("BlenderResult", ["returncode", "tail", "log_path", "status", "peak_rss"])
+
+# Time budget: BASE + views * PER_VIEW * (1 + faces / FACE_SCALE) seconds
+BASE_SECONDS = 120.
+PER_VIEW_SECONDS = 2.
+FACE_SCALE = 100000.
+MIN_HANG_SECONDS = 300.
+
+
+class RotatingLog:
+    """Append-only text log that rolls over to <path>.1 .. <path>.<backup_count> at max_bytes."""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=2):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._size = 0
+
+    def write(self, line):
+        if self._size + len(line) > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._size += len(line)
+
+    def close(self):
+        self._file.close()
+
+
+def log_path_for(log_dir, job_name):
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in job_name)
+    return os.path.join(log_dir, safe + ".log")
+
+
+def _pump(stream, log, tail):
+    for line in stream:
+        log.write(line)
+        tail.append(line)
+    stream.close()
+
+
+def mesh_face_count(path):
+    """Face count read from the file without loading it: binary STL header, else counted lines."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, "rb") as f:
+            if ext == ".stl":
+                header = f.read(84)
+                if len(header) == 84 and not header.lstrip().startswith(b"solid"):
+                    return struct.unpack("<I", header[80:84])[0]
+                f.seek(0)
+                return sum(1 for line in f if line.lstrip().startswith(b"facet"))
+            if ext == ".obj":
+                return sum(1 for line in f if line.startswith(b"f "))
+    except OSError:
+        pass
+    return 0
+
+
+def job_limits(face_count, num_views):
+    """:return: (timeout, hang_seconds) for a job rendering num_views views of a face_count mesh."""
+    per_view = PER_VIEW_SECONDS * (1. + face_count / FACE_SCALE)
+    timeout = BASE_SECONDS + num_views * per_view
+    # Allow several slow views (and the initial import) between two new images
+    hang_seconds = max(MIN_HANG_SECONDS, BASE_SECONDS + 10 * per_view)
+    return timeout, hang_seconds
+
+
+def png_progress(*dirs):
+    """
+    Progress probe for run_blender: (images, newest image mtime). The mtime also moves when
+    existing images are overwritten (repair, incremental and full re-renders).
+    """
+    def probe():
+        total, newest = 0, 0
+        for d in dirs:
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        if e.name.endswith(".png"):
+                            total += 1
+                            try:
+                                newest = max(newest, e.stat().st_mtime_ns)
+                            except OSError:
+                                pass
+            except OSError:
+                pass
+        return total, newest
+    return probe
+
+
+def file_progress(path):
+    """Progress probe for run_blender: size of a file the child keeps writing (e.g. its log)."""
+    def size():
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    return size
+
+
+def run_blender(cmd, log_path, tail_lines=200, max_bytes=10 * 1024 * 1024, backup_count=2,
+                timeout=None, progress=None, hang_seconds=None, poll_seconds=5.):
+    """
+    Run cmd, streaming its combined output to log_path.
+    :param timeout: kill the child after this many seconds (status 'timeout').
+    :param progress: callable whose return value changes whenever the child makes progress
+                     (e.g. png_progress); unchanged for hang_seconds kills it (status 'hung').
+    :return: BlenderResult(returncode, tail, log_path, status, peak_rss); tail is the last
+             tail_lines lines as one string, status is 'ok', 'failed', 'timeout' or 'hung',
+             peak_rss the child's largest sampled RSS in bytes (None without psutil).
+    """
+    log = RotatingLog(log_path, max_bytes=max_bytes, backup_count=backup_count)
+    log.write("$ " + subprocess.list2cmdline(cmd) + "\n")
+    tail = deque(maxlen=tail_lines)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, encoding="utf-8", errors="replace", bufsize=1)
+    reader = threading.Thread(target=_pump, args=(proc.stdout, log, tail), daemon=True)
+    reader.start()
+
+    start = last_progress = time.monotonic()
+    last_value = progress() if progress is not None else None
+    status = None
+    peak_rss = None
+    child = None
+    if psutil is not None:
+        try:
+            child = psutil.Process(proc.pid)
+        except psutil.Error:
+            pass
+    try:
+        while True:
+            try:
+                proc.wait(timeout=poll_seconds)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            now = time.monotonic()
+            if child is not None:
+                try:
+                    peak_rss = max(peak_rss or 0, child.memory_info().rss)
+                except psutil.Error:
+                    pass
+            if progress is not None:
+                value = progress()
+                if value != last_value:
+                    last_value, last_progress = value, now
+            if timeout is not None and now - start > timeout:
+                status = "timeout"
+            elif progress is not None and hang_seconds is not None and now - last_progress > hang_seconds:
+                status = "hung"
+            if status is not None:
+                proc.kill()
+                proc.wait()
+                break
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        reader.join()
+        if status is not None:
+            log.write(f"[watchdog] killed after {time.monotonic() - start:.0f}s: {status}\n")
+        log.write(f"[exit {proc.returncode}]\n")
+        log.close()
+    if status is None:
+        status = "ok" if proc.returncode == 0 else "failed"
+    return BlenderResult(proc.returncode, "".join(tail), log_path, status, peak_rss)
+
+
+def run_with_retries(cmd, log_path, name, max_retries=3, backoff_seconds=30., **watchdog):
+    """
+    run_blender with up to max_retries attempts, sleeping backoff_seconds * 2^(attempt-1)
+    (with jitter) between them.
+    :return: the last BlenderResult.
+    """
+    for attempt in range(1, max_retries + 1):
+        print(f"[INFO] {name} (attempt {attempt})")
+        result = run_blender(cmd, log_path, **watchdog)
+        if result.status == "ok":
+            return result
+        print(f"[ERROR] {name} {result.status} (attempt {attempt}), log: {result.log_path}")
+        print(result.tail)
+        if attempt < max_retries:
+            delay = backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.75, 1.25)
+            print(f"[RETRY] {name} in {delay:.0f}s")
+            time.sleep(delay)
+    return result
+
+
+class Quarantine:
+    """
+    Meshes that failed every attempt, as JSON lines in <output_dir>/quarantine.jsonl.
+    Appends are single short writes, so pool workers can share the file.
+    """
+    FILE = "quarantine.jsonl"
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, self.FILE)
+
+    def entries(self):
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry["mesh"]] = entry
+        return entries
+
+    def __contains__(self, mesh):
+        return mesh in self.entries()
+
+    def add(self, mesh, reason, log_path=None):
+        line = json.dumps({"mesh": mesh, "reason": reason, "log": log_path, "time": time.time()})
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
@@ -0,0 +1,393 @@
+import sys
+import types
+
+import numpy as np
+
+# Stand-in for Blender's bpy and mathutils modules, for importing, profiling and checking
+# the pipeline on plain CPython:
+#
+#   import bpy_stub
+#   bpy_stub.install()          # no-op inside Blender
+#   import util, blender_interface
+#
+# mathutils.Matrix/Vector are small NumPy-backed implementations with Blender 2.7 semantics
+# (`*` is the matrix product), so the camera convention code in util.py computes real poses.
+# bpy is a recorder: operators append (name, args, kwargs) to `calls` and return
+# {'FINISHED'}, properties are plain attributes with Blender's default values where the
+# code reads them, and nothing is rendered.
+
+calls = []
+
+
+# --------------------------------------------------------------------------- mathutils
+
+class Vector(object):
+    def __init__(self, seq=(0., 0., 0.)):
+        self._v = np.array(seq, dtype=np.float64).reshape(-1)
+
+    def __len__(self):
+        return len(self._v)
+
+    def __iter__(self):
+        return iter(float(x) for x in self._v)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(float(x) for x in self._v[i])
+        return float(self._v[i])
+
+    def __setitem__(self, i, value):
+        self._v[i] = value
+
+    def __array__(self, dtype=None, copy=None):
+        return self._v.astype(dtype) if dtype is not None else self._v.copy()
+
+    def __add__(self, other):
+        return Vector(self._v + np.asarray(other, dtype=np.float64))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vector(self._v - np.asarray(other, dtype=np.float64))
+
+    def __rsub__(self, other):
+        return Vector(np.asarray(other, dtype=np.float64) - self._v)
+
+    def __neg__(self):
+        return Vector(-self._v)
+
+    def __mul__(self, other):
+        if isinstance(other, Vector):
+            return float(np.dot(self._v, other._v))
+        return Vector(self._v * other)
+
+    def __rmul__(self, other):
+        return Vector(other * self._v)
+
+    def __truediv__(self, other):
+        return Vector(self._v / other)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector) and np.array_equal(self._v, other._v)
+
+    def __repr__(self):
+        return 'Vector(({}))'.format(', '.join('%.4f' % x for x in self._v))
+
+    @property
+    def length(self):
+        return float(np.linalg.norm(self._v))
+
+    @property
+    def x(self):
+        return float(self._v[0])
+
+    @property
+    def y(self):
+        return float(self._v[1])
+
+    @property
+    def z(self):
+        return float(self._v[2])
+
+    def normalized(self):
+        return Vector(self._v / (np.linalg.norm(self._v) or 1.))
+
+    def dot(self, other):
+        return float(np.dot(self._v, np.asarray(other, dtype=np.float64)))
+
+    def cross(self, other):
+        return Vector(np.cross(self._v, np.asarray(other, dtype=np.float64)))
+
+    def to_tuple(self):
+        return tuple(self)
+
+
+class Quaternion(object):
+    '''Only what Matrix.decompose() callers use: the rotation as a matrix.'''
+
+    def __init__(self, rotation):
+        self._rot = np.array(rotation, dtype=np.float64)
+
+    def to_matrix(self):
+        return Matrix(self._rot)
+
+
+class Matrix(object):
+    def __init__(self, rows=None):
+        self._m = np.identity(4) if rows is None else np.array([list(r) for r in rows], dtype=np.float64)
+
+    @classmethod
+    def Identity(cls, n):
+        return cls(np.identity(n))
+
+    @classmethod
+    def Translation(cls, vec):
+        m = np.identity(4)
+        m[:3, 3] = list(vec)[:3]
+        return cls(m)
+
+    def __len__(self):
+        return self._m.shape[0]
+
+    def __iter__(self):
+        return iter(Vector(r) for r in self._m)
+
+    def __getitem__(self, i):
+        return Vector(self._m[i])
+
+    def __setitem__(self, i, row):
+        self._m[i] = list(row)
+
+    def __array__(self, dtype=None, copy=None):
+        return self._m.astype(dtype) if dtype is not None else self._m.copy()
+
+    def __mul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(np.dot(self._m, other._m))
+        if isinstance(other, Vector):
+            v = other._v
+            if len(v) == self._m.shape[1]:
+                return Vector(np.dot(self._m, v))
+            if self._m.shape == (4, 4) and len(v) == 3:
+                # Blender applies a 4x4 matrix to a 3D vector as a point (w = 1)
+                return Vector(np.dot(self._m, np.append(v, 1.))[:3])
+            raise ValueError('matrix * vector: size mismatch')
+        return Matrix(self._m * other)
+
+    def __rmul__(self, other):
+        return Matrix(other * self._m)
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and np.array_equal(self._m, other._m)
+
+    def __repr__(self):
+        return 'Matrix({})'.format(self._m.tolist())
+
+    def transposed(self):
+        return Matrix(self._m.T)
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self._m))
+
+    def to_3x3(self):
+        return Matrix(self._m[:3, :3])
+
+    def to_4x4(self):
+        m = np.identity(4)
+        n = min(4, self._m.shape[0])
+        m[:n, :n] = self._m[:n, :n]
+        return Matrix(m)
+
+    def to_translation(self):
+        return Vector(self._m[:3, 3])
+
+    def to_scale(self):
+        return Vector(np.linalg.norm(self._m[:3, :3], axis=0))
+
+    def decompose(self):
+        '''(location, rotation, scale), as Blender's Matrix.decompose().'''
+        scale = np.linalg.norm(self._m[:3, :3], axis=0)
+        rotation = self._m[:3, :3] / np.where(scale > 0, scale, 1.)
+        return Vector(self._m[:3, 3]), Quaternion(rotation), Vector(scale)
+
+
+# --------------------------------------------------------------------------- bpy
+
+class Struct(object):
+    '''Attribute bag; unknown attributes spring into existence as nested Structs.'''
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        child = Struct()
+        setattr(self, name, child)
+        return child
+
+    def __repr__(self):
+        return 'Struct({})'.format(', '.join(sorted(self.__dict__)))
+
+
+class EnumStruct(Struct):
+    '''Struct whose enum properties only accept their identifier strings, as bpy raises TypeError otherwise.'''
+
+    def __init__(self, enums, **attrs):
+        self.__dict__['_enums'] = enums
+        Struct.__init__(self, **attrs)
+
+    def __setattr__(self, name, value):
+        items = self._enums.get(name)
+        if items is not None and (not isinstance(value, str) or value not in items):
+            raise TypeError('bpy_struct: item.attr = val: enum "{}" not found in {}'.format(value, items))
+        Struct.__setattr__(self, name, value)
+
+
+class Object(Struct):
+    def __init__(self, name, type='MESH', data=None, **attrs):
+        Struct.__init__(self, name=name, type=type, data=data if data is not None else Struct(materials=[]),
+                        location=Vector(), scale=Vector((1., 1., 1.)), rotation_euler=[0., 0., 0.],
+                        matrix_world=Matrix.Identity(4), bound_box=[(0., 0., 0.)] * 8,
+                        select=False, hide_render=False, **attrs)
+
+
+class PropertyArray(object):
+    '''mesh.vertices / loops / polygons backed by NumPy arrays, readable with foreach_get.'''
+
+    def __init__(self, **arrays):
+        self._arrays = arrays
+        self._len = len(next(iter(arrays.values())))
+
+    def __len__(self):
+        return self._len
+
+    def foreach_get(self, attr, out):
+        out[:] = self._arrays[attr].reshape(-1)
+
+
+def mesh_data(name, verts, faces):
+    '''Mesh datablock for (V, 3) vertices and (F, k) polygon vertex indices.'''
+    verts = np.asarray(verts, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    k = faces.shape[1]
+    return Struct(name=name, materials=[], users=1, vertex_colors=Collection(),
+                  vertices=PropertyArray(co=verts),
+                  loops=PropertyArray(vertex_index=faces.reshape(-1)),
+                  polygons=PropertyArray(loop_start=np.arange(len(faces)) * k,
+                                         loop_total=np.full(len(faces), k)))
+
+
+def add_mesh_object(name, verts, faces):
+    '''Put a mesh object into the stub scene and select it, as an import operator would.'''
+    import bpy
+    obj = Object(name, data=mesh_data(name, verts, faces))
+    bpy.data.objects._items[name] = obj
+    bpy.data.meshes._items[name] = obj.data
+    obj.select = True
+    bpy.context.selected_objects = [obj]
+    bpy.context.scene.objects.active = obj
+    return obj
+
+
+class Collection(object):
+    '''bpy.data.<collection>: name lookup that creates missing entries, plus new()/remove().'''
+
+    def __init__(self, factory=None):
+        self._items = {}
+        self._factory = factory or (lambda name: Struct(name=name))
+
+    def __getitem__(self, name):
+        if name not in self._items:
+            self._items[name] = self._factory(name)
+        return self._items[name]
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, name, default=None):
+        return self._items.get(name, default)
+
+    def new(self, name='', *args, **kwargs):
+        calls.append(('data.new', (name,) + args, kwargs))
+        item = self._factory(name)
+        self._items[name] = item
+        return item
+
+    def remove(self, item, *args, **kwargs):
+        calls.append(('data.remove', (getattr(item, 'name', item),), kwargs))
+        self._items.pop(getattr(item, 'name', None), None)
+
+
+class Operator(object):
+    '''bpy.ops.<module>.<op>(...): records the call and reports success.'''
+
+    def __init__(self, path):
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Operator(self._path + '.' + name if self._path else name)
+
+    def __call__(self, *args, **kwargs):
+        calls.append((self._path, args, kwargs))
+        return {'FINISHED'}
+
+
+def _make_bpy():
+    bpy = types.ModuleType('bpy')
+    bpy.__stub__ = True
+    bpy.app = Struct(version=(2, 79, 0), background=True, binary_path='blender')
+    bpy.ops = Operator('')
+
+    camera = Object('Camera', type='CAMERA',
+                    data=Struct(lens=35., sensor_width=32., sensor_height=18., sensor_fit='AUTO'))
+    image_settings = EnumStruct({'file_format': ('BMP', 'PNG', 'JPEG', 'OPEN_EXR', 'TIFF'),
+                                 'color_mode': ('BW', 'RGB', 'RGBA'),
+                                 'color_depth': ('8', '16')},
+                                file_format='PNG', color_mode='RGBA', color_depth='8', compression=15)
+    render = EnumStruct({'threads_mode': ('AUTO', 'FIXED'),
+                         'octree_resolution': ('64', '128', '256', '512')},
+                        resolution_x=1920, resolution_y=1080, resolution_percentage=50,
+                        pixel_aspect_x=1., pixel_aspect_y=1., threads=1, threads_mode='AUTO',
+                        octree_resolution='128', tile_x=64, tile_y=64, filepath='', image_settings=image_settings)
+    world = Struct(horizon_color=(0.05, 0.05, 0.05),
+                   light_settings=Struct(use_environment_light=False, environment_color='PLAIN',
+                                         environment_energy=1.))
+    scene = Struct(render=render, world=world, camera=camera, objects=Struct(active=None),
+                   update=lambda: None)
+
+    bpy.data = Struct(
+        objects=Collection(lambda name: Object(name)),
+        meshes=Collection(lambda name: Struct(name=name, materials=[], users=0)),
+        materials=Collection(),
+        textures=Collection(),
+        images=Collection(),
+        lattices=Collection(),
+        lamps=Collection(),
+        cameras=Collection(),
+    )
+    bpy.data.objects._items['Camera'] = camera
+    bpy.context = Struct(scene=scene, selected_objects=[], active_object=None,
+                         user_preferences=Struct(edit=Struct(use_global_undo=True)))
+    bpy.types = Struct()
+    return bpy
+
+
+def _make_mathutils():
+    mathutils = types.ModuleType('mathutils')
+    mathutils.__stub__ = True
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    mathutils.Quaternion = Quaternion
+    return mathutils
+
+
+def install(force=False):
+    '''
+    Register the stubs as 'bpy' and 'mathutils' unless the real modules are importable
+    (i.e. we run inside Blender). force=True replaces them regardless.
+    :return: True if the stubs are in use.
+    '''
+    if not force:
+        try:
+            import bpy  # noqa: F401
+            return bool(getattr(bpy, '__stub__', False))
+        except ImportError:
+            pass
+    sys.modules['bpy'] = _make_bpy()
+    sys.modules['mathutils'] = _make_mathutils()
+    del calls[:]
+    return True
+
+
+def reset():
+    '''Fresh scene state and an empty call log (stubs must be installed).'''
+    install(force=True)
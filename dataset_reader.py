@@ -0,0 +1,249 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from export_tensors import list_views, load_rgb_pack, read_intrinsics, read_near_far, read_pose, read_view, to_pytorch3d
+from pose_index import OBJECTS_FILE, PoseIndex
+from util import object_dirs
+
+# On-demand reader for the render layout pollen_{split}/<object>/{rgb,pose,intrinsics.txt,near_far.txt}.
+# The object list is scanned once; per-object metadata is read on first use, and only the
+# views a caller asks for are decoded. Decoded images live in a byte-bounded LRU cache, and
+# prefetch() decodes upcoming views on a thread pool (PIL releases the GIL while decoding),
+# so memory and latency scale with the views a training step samples, not with the 128-251
+# views rendered per object. Objects in the split's pose index (pose_index.py) take their
+# view ids, poses, K and near/far from it instead of the text files, and objects with an
+# rgb.npy pack (export_tensors.pack_rgb) are read from it without PNG decoding.
+#
+#   reader = RenderDataset(render_dir, 'train', cache_mb=512)
+#   obj = reader.objects[0]
+#   ids = reader.sample_view_ids(obj, 3)
+#   batch = reader.load_views(obj, ids)   # images [3, H, W, 3] uint8, cam2world, K, R, T, ...
+
+
+def _convert(image, mode):
+    """uint8 [H, W], [H, W, 3] or [H, W, 4] to mode's channels, as PIL's convert would."""
+    if image.ndim == 2:
+        image = np.repeat(image[..., None], 3, axis=-1)
+    if mode == 'RGB':
+        return np.ascontiguousarray(image[..., :3])
+    if image.shape[-1] == 3:
+        return np.concatenate([image, np.full(image.shape[:2] + (1,), 255, np.uint8)], axis=-1)
+    return image
+
+
+class ImageCache:
+    """Thread-safe LRU of decoded images, bounded by total bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._items.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._items[key] = image
+            self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+class RenderDataset:
+    """
+    Lazy view-level access to one rendered split.
+    - objects: object names, scanned once at construction; '<object>/<view set>' for objects
+      rendered with named view sets, each read as an object of its own.
+    - load_views(obj, view_ids): decodes only those views (through the LRU cache) and returns
+      the images with their OpenCV cam2world, K, PyTorch3D R/T/NDC intrinsics and near/far,
+      the same fields export_tensors writes.
+    - prefetch(obj, view_ids): schedules decoding in the background; a later load_views
+      for the same views waits on those decodes instead of repeating them.
+    """
+
+    def __init__(self, render_dir, split, cache_mb=512, num_workers=4, rgb=True):
+        self.split_dir = os.path.join(render_dir, 'pollen_{}'.format(split))
+        self.objects = object_dirs(self.split_dir)
+        self.index = PoseIndex(self.split_dir) if os.path.exists(os.path.join(self.split_dir, OBJECTS_FILE)) else None
+        self.mode = 'RGB' if rgb else 'RGBA'
+        self.cache = ImageCache(int(cache_mb * 1024 * 1024))
+        self._meta = {}
+        self._meta_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=num_workers) if num_workers > 0 else None
+
+    def __len__(self):
+        return len(self.objects)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def meta(self, obj):
+        """View ids, K, image size and near/far of one object, read once and kept (a few KB)."""
+        meta = self._meta.get(obj)
+        if meta is None and self.index is not None and obj in self.index:
+            K, image_size = self.index.intrinsics(obj)
+            view_ids, poses, near_far = self.index.views(obj)
+            dense = np.zeros((int(view_ids.max()) + 1 if len(view_ids) else 0, 2), dtype=np.float32)
+            dense[view_ids] = near_far
+            meta = {
+                'dir': os.path.join(self.split_dir, obj),
+                'view_ids': [int(v) for v in view_ids],
+                'K': K,
+                'image_size': image_size,
+                'near_far': dense,
+                'poses': {int(v): np.array(p) for v, p in zip(view_ids, poses)},
+            }
+            with self._meta_lock:
+                meta = self._meta.setdefault(obj, meta)
+        elif meta is None:
+            object_dir = os.path.join(self.split_dir, obj)
+            K, image_size = read_intrinsics(os.path.join(object_dir, 'intrinsics.txt'))
+            meta = {
+                'dir': object_dir,
+                'view_ids': [int(v) for v in list_views(object_dir)],
+                'K': K,
+                'image_size': image_size,
+                'near_far': read_near_far(os.path.join(object_dir, 'near_far.txt')),
+                'poses': {},
+            }
+            with self._meta_lock:
+                meta = self._meta.setdefault(obj, meta)
+        return meta
+
+    def view_ids(self, obj):
+        return self.meta(obj)['view_ids']
+
+    def sample_view_ids(self, obj, n, rng=None):
+        ids = self.view_ids(obj)
+        rng = rng if rng is not None else np.random
+        return sorted(int(i) for i in rng.choice(ids, size=min(n, len(ids)), replace=False))
+
+    def _pack(self, obj):
+        meta = self.meta(obj)
+        if 'pack' not in meta:
+            meta['pack'] = load_rgb_pack(meta['dir'])
+        return meta['pack']
+
+    def _decode(self, obj, view_id):
+        key = (obj, view_id)
+        image = self.cache.get(key)
+        pack = self._pack(obj) if image is None else None
+        if pack is not None and view_id in pack[1]:
+            image = _convert(np.array(pack[0][pack[1][view_id]]), self.mode)
+            self.cache.put(key, image)
+        elif image is None:
+            path = os.path.join(self.meta(obj)['dir'], 'rgb', '%06d.png' % view_id)
+            image = read_view(path, self.mode)
+            self.cache.put(key, image)
+        with self._pending_lock:
+            self._pending.pop(key, None)
+        return image
+
+    def prefetch(self, obj, view_ids):
+        if self._pool is None:
+            return
+        with self._pending_lock:
+            for v in view_ids:
+                key = (obj, int(v))
+                if key not in self._pending and key not in self.cache:
+                    self._pending[key] = self._pool.submit(self._decode, obj, int(v))
+
+    def image(self, obj, view_id):
+        with self._pending_lock:
+            future = self._pending.get((obj, view_id))
+        if future is not None:
+            return future.result()
+        return self._decode(obj, view_id)
+
+    def pose(self, obj, view_id):
+        poses = self.meta(obj)['poses']
+        if view_id not in poses:
+            poses[view_id] = read_pose(os.path.join(self.meta(obj)['dir'], 'pose', '%06d.txt' % view_id))
+        return poses[view_id]
+
+    def load_views(self, obj, view_ids):
+        meta = self.meta(obj)
+        view_ids = [int(v) for v in view_ids]
+        images = np.stack([self.image(obj, v) for v in view_ids])
+        cam2world = np.stack([self.pose(obj, v) for v in view_ids])
+        R, T, focal, principal = to_pytorch3d(cam2world, meta['K'], meta['image_size'])
+        return {
+            'object': obj,
+            'view_ids': np.array(view_ids, dtype=np.int64),
+            'images': images,
+            'cam2world': cam2world,
+            'K': meta['K'],
+            'R': R,
+            'T': T,
+            'focal_length': focal,
+            'principal_point': principal,
+            'image_size': np.array(meta['image_size'], dtype=np.int64),
+            'near_far': meta['near_far'][view_ids],
+        }
+
+
+if __name__ == '__main__':
+    # Latency/memory check: sample a few views per step like a training loop would
+    p = argparse.ArgumentParser(description='Benchmark on-demand view loading from a rendered split.')
+    p.add_argument('--render_dir', required=True)
+    p.add_argument('--split', default='train')
+    p.add_argument('--steps', type=int, default=200)
+    p.add_argument('--views_per_step', type=int, default=3)
+    p.add_argument('--cache_mb', type=float, default=512)
+    p.add_argument('--num_workers', type=int, default=4)
+    args = p.parse_args()
+
+    rng = np.random.RandomState(0)
+    with RenderDataset(args.render_dir, args.split, args.cache_mb, args.num_workers) as reader:
+        start = time.perf_counter()
+        plan = [(reader.objects[rng.randint(len(reader))],) for _ in range(args.steps)]
+        plan = [(obj, reader.sample_view_ids(obj, args.views_per_step, rng)) for (obj,) in plan]
+        print('[INFO] {} objects, index + plan in {:.2f}s'.format(len(reader), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        for step, (obj, ids) in enumerate(plan):
+            if step + 1 < len(plan):
+                reader.prefetch(*plan[step + 1])
+            reader.load_views(obj, ids)
+        elapsed = time.perf_counter() - start
+        print('[INFO] {} steps x {} views: {:.1f} ms/step, cache {} images / {:.1f} MB, hit rate {:.1%}'.format(
+            args.steps, args.views_per_step, elapsed / args.steps * 1000, len(reader.cache),
+            reader.cache.nbytes / 2 ** 20, reader.cache.hits / float(max(1, reader.cache.hits + reader.cache.misses))))
@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from util import object_dirs
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# Export rendered objects (pollen_{split}/<object>/{rgb,pose,intrinsics.txt,near_far.txt})
+# straight into training-ready bundles for SparseFusion/CO3D-style loaders.
+# Per object the bundle holds:
+#   images          uint8   [N, H, W, 3]
+#   cam2world       float32 [N, 4, 4]  OpenCV convention, as written by the renderer
+#   K               float32 [3, 3]     pixel intrinsics
+#   R, T            float32 [N, 3, 3], [N, 3]  PyTorch3D world-to-view (X_cam = X_world @ R + T)
+#   focal_length    float32 [N, 2]     PyTorch3D NDC
+#   principal_point float32 [N, 2]     PyTorch3D NDC
+#   near_far        float32 [N, 2]     per-view ray-distance bounds (near, far)
+# Objects are streamed one at a time (or one shard at a time), so memory stays bounded.
+
+MANIFEST_FILE = 'export_manifest.json'
+# Optional raw pack of an object's views: uint8 [N, H, W, C] plus the view id of every row.
+# np.load(..., mmap_mode='r') maps it, so a view costs a page-in instead of a PNG decode.
+RGB_PACK_FILE = 'rgb.npy'
+RGB_PACK_IDS_FILE = 'rgb_view_ids.npy'
+PACK_MODES = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+# OpenCV (x right, y down, z forward) -> PyTorch3D (x left, y up, z forward)
+CV_TO_P3D = np.diag([-1., -1., 1.]).astype(np.float32)
+
+
+def read_intrinsics(path):
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()
+    f_px, cx, cy = [float(x) for x in lines[0].split()[:3]]
+    height, width = [int(x) for x in lines[3].split()]
+    K = np.array([[f_px, 0., cx], [0., f_px, cy], [0., 0., 1.]], dtype=np.float32)
+    return K, (height, width)
+
+
+def read_pose(path):
+    with open(path, 'r') as f:
+        return np.array(f.read().split(), dtype=np.float32).reshape(4, 4)
+
+
+def read_near_far(path):
+    return np.loadtxt(path, dtype=np.float32, ndmin=2)
+
+
+def read_view(path, mode='RGB'):
+    """
+    One view as uint8 in PIL mode ('L', 'RGB', 'RGBA'). 16-bit grayscale PNGs ('BW' renders
+    at color_depth 16) open as 'I;16', which convert() clips to white; they keep their high byte.
+    """
+    with Image.open(path) as img:
+        if img.mode.startswith('I'):
+            gray = (np.asarray(img).astype(np.uint32) >> 8).astype(np.uint8)
+            return np.asarray(Image.fromarray(gray, 'L').convert(mode))
+        return np.asarray(img.convert(mode))
+
+
+def list_views(object_dir):
+    rgb_dir = os.path.join(object_dir, 'rgb')
+    if not os.path.isdir(rgb_dir):
+        return []
+    with os.scandir(rgb_dir) as it:
+        return sorted(os.path.splitext(e.name)[0] for e in it if e.name.endswith('.png'))
+
+
+def is_complete(object_dir, num_views=None, settle_seconds=0.):
+    """An object is exportable once every image has a pose and near_far covers all of them."""
+    views = list_views(object_dir)
+    if not views or (num_views is not None and len(views) < num_views):
+        return False
+    pose_dir = os.path.join(object_dir, 'pose')
+    if not all(os.path.exists(os.path.join(pose_dir, v + '.txt')) for v in views):
+        return False
+    nf_path = os.path.join(object_dir, 'near_far.txt')
+    if not os.path.exists(os.path.join(object_dir, 'intrinsics.txt')) or not os.path.exists(nf_path):
+        return False
+    if settle_seconds > 0:
+        # Still being rendered if the newest image is too fresh
+        newest = os.path.getmtime(os.path.join(object_dir, 'rgb', views[-1] + '.png'))
+        if time.time() - newest < settle_seconds:
+            return False
+    return len(read_near_far(nf_path)) >= len(views)
+
+
+def to_pytorch3d(cam2world, K, image_size):
+    """Convert OpenCV cam2world + pixel K into PyTorch3D R, T and NDC focal/principal point."""
+    height, width = image_size
+    world2cam = np.linalg.inv(cam2world)
+    R = np.einsum('ij,njk->nik', CV_TO_P3D, world2cam[:, :3, :3]).transpose(0, 2, 1)
+    T = np.einsum('ij,nj->ni', CV_TO_P3D, world2cam[:, :3, 3])
+
+    s = min(height, width) / 2.
+    n = len(cam2world)
+    focal = np.tile([[K[0, 0] / s, K[1, 1] / s]], (n, 1))
+    principal = np.tile([[-(K[0, 2] - width / 2.) / s, -(K[1, 2] - height / 2.) / s]], (n, 1))
+    return R.astype(np.float32), T.astype(np.float32), focal.astype(np.float32), principal.astype(np.float32)
+
+
+def load_object(object_dir, name=None):
+    views = list_views(object_dir)
+    view_ids = [int(v) for v in views]
+    K, image_size = read_intrinsics(os.path.join(object_dir, 'intrinsics.txt'))
+    near_far = read_near_far(os.path.join(object_dir, 'near_far.txt'))
+
+    images = np.empty((len(views), image_size[0], image_size[1], 3), dtype=np.uint8)
+    for i, v in enumerate(views):
+        images[i] = read_view(os.path.join(object_dir, 'rgb', v + '.png'))
+    cam2world = np.stack([read_pose(os.path.join(object_dir, 'pose', v + '.txt')) for v in views])
+    R, T, focal, principal = to_pytorch3d(cam2world, K, image_size)
+
+    return {
+        'object': name or os.path.basename(os.path.normpath(object_dir)),
+        'view_ids': np.array(view_ids, dtype=np.int64),
+        'images': images,
+        'cam2world': cam2world,
+        'K': K,
+        'R': R,
+        'T': T,
+        'focal_length': focal,
+        'principal_point': principal,
+        'image_size': np.array(image_size, dtype=np.int64),
+        'near_far': near_far[view_ids],
+    }
+
+
+def pack_rgb(object_dir, mode='RGB'):
+    """Write <object_dir>/rgb.npy (uint8 [N, H, W, C], C from mode 'L'/'RGB'/'RGBA') next to the PNGs."""
+    views = list_views(object_dir)
+    with Image.open(os.path.join(object_dir, 'rgb', views[0] + '.png')) as img:
+        width, height = img.size
+    shape = (len(views), height, width) + ((PACK_MODES[mode],) if PACK_MODES[mode] > 1 else ())
+    pack_path = os.path.join(object_dir, RGB_PACK_FILE)
+    tmp_path = pack_path + '.tmp'
+    # Written through a memmap so one object's views are never all in memory at once
+    pack = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=shape)
+    for i, v in enumerate(views):
+        pack[i] = read_view(os.path.join(object_dir, 'rgb', v + '.png'), mode)
+    pack.flush()
+    del pack
+    ids_path = os.path.join(object_dir, RGB_PACK_IDS_FILE)
+    with open(ids_path + '.tmp', 'wb') as f:
+        np.save(f, np.array([int(v) for v in views], dtype=np.int64))
+    os.replace(ids_path + '.tmp', ids_path)
+    os.replace(tmp_path, pack_path)
+    return pack_path
+
+
+def load_rgb_pack(object_dir):
+    """(memmapped uint8 views, {view_id: row}) or None if the object has no up-to-date pack."""
+    pack_path = os.path.join(object_dir, RGB_PACK_FILE)
+    ids_path = os.path.join(object_dir, RGB_PACK_IDS_FILE)
+    if not (os.path.exists(pack_path) and os.path.exists(ids_path)):
+        return None
+    # Every render session rewrites near_far.txt, so a newer one means re-rendered (repaired) views
+    for path in (os.path.join(object_dir, 'rgb'), os.path.join(object_dir, 'near_far.txt')):
+        if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(pack_path):
+            return None
+    ids = np.load(ids_path)
+    return np.load(pack_path, mmap_mode='r'), {int(v): i for i, v in enumerate(ids)}
+
+
+def save_bundle(data, out_path):
+    tmp_path = out_path + '.tmp'
+    if torch is not None:
+        torch.save(_to_torch(data), tmp_path)
+    else:
+        if isinstance(data, list):
+            # Shards: flatten to '<object>/<key>' entries
+            data = {'{}/{}'.format(d['object'], k): v for d in data for k, v in d.items()}
+        # Through a file handle, as np.savez appends .npz to bare paths
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **data)
+    os.replace(tmp_path, out_path)
+
+
+def _to_torch(data):
+    if isinstance(data, np.ndarray):
+        return torch.from_numpy(data)
+    if isinstance(data, dict):
+        return {k: _to_torch(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_to_torch(v) for v in data]
+    return data
+
+
+def export_object(object_dir, out_path, name=None):
+    """Export one rendered object; usable straight after the renderer finished it."""
+    save_bundle(load_object(object_dir, name), out_path)
+    return out_path
+
+
+class SplitExporter:
+    """
+    Streams the objects of one rendered split into .pt bundles (.npz without torch).
+    - shard_size=1 writes one '<object>.pt' per object ('<object>/<view set>.pt' per view
+      set), larger values write 'shard_XXXXX.pt' files holding a list of objects; memory is
+      bounded by one shard.
+    - Exported objects are tracked in 'export_manifest.json' so runs resume and can poll
+      a split that is still being rendered.
+    """
+
+    def __init__(self, split_dir, out_dir, shard_size=1, num_views=None, settle_seconds=30.):
+        self.split_dir = split_dir
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.num_views = num_views
+        self.settle_seconds = settle_seconds
+        self.ext = '.pt' if torch is not None else '.npz'
+        os.makedirs(out_dir, exist_ok=True)
+        self.manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+        self.manifest = self._load_manifest()
+        self._pending = []
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        return {'objects': {}, 'next_shard': 0}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def ready_objects(self):
+        return [n for n in object_dirs(self.split_dir)
+                if n not in self.manifest['objects']
+                and n not in self._pending
+                and is_complete(os.path.join(self.split_dir, n), self.num_views, self.settle_seconds)]
+
+    def _flush(self):
+        if not self._pending:
+            return
+        shard_name = 'shard_{:05d}{}'.format(self.manifest['next_shard'], self.ext)
+        save_bundle([load_object(os.path.join(self.split_dir, n), n) for n in self._pending],
+                    os.path.join(self.out_dir, shard_name))
+        for n in self._pending:
+            self.manifest['objects'][n] = shard_name
+        self.manifest['next_shard'] += 1
+        self._pending = []
+        self._save_manifest()
+
+    def export_ready(self, final=False):
+        """Export every complete, not yet exported object. Returns how many were written."""
+        count = 0
+        for name in self.ready_objects():
+            if self.shard_size == 1:
+                file_name = name + self.ext
+                out_path = os.path.join(self.out_dir, *file_name.split('/'))
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                export_object(os.path.join(self.split_dir, name), out_path, name)
+                self.manifest['objects'][name] = file_name
+                self._save_manifest()
+            else:
+                self._pending.append(name)
+                if len(self._pending) >= self.shard_size:
+                    self._flush()
+            count += 1
+        if final:
+            self._flush()
+        return count
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Export rendered splits to SparseFusion/CO3D-style tensor bundles.')
+    p.add_argument('--render_dir', required=True, help='Render output dir containing pollen_{split} folders.')
+    p.add_argument('--out_dir', required=True, help='Where the .pt bundles go (one subfolder per split).')
+    p.add_argument('--splits', nargs='+', default=['train', 'val', 'test'])
+    p.add_argument('--shard_size', type=int, default=1, help='Objects per bundle file.')
+    p.add_argument('--num_views', type=int, default=None, help='Only export objects with at least this many views.')
+    p.add_argument('--watch', action='store_true', help='Keep polling while rendering is still running.')
+    p.add_argument('--poll_seconds', type=float, default=60.)
+    p.add_argument('--idle_exit_seconds', type=float, default=None)
+    p.add_argument('--pack_rgb', type=str, default=None, choices=sorted(PACK_MODES),
+                   help='Instead of bundles, write a raw rgb.npy of this mode into every object dir.')
+    args = p.parse_args()
+
+    if args.pack_rgb:
+        for s in args.splits:
+            split_dir = os.path.join(args.render_dir, 'pollen_{}'.format(s))
+            if not os.path.isdir(split_dir):
+                continue
+            objects = [os.path.join(split_dir, n) for n in object_dirs(split_dir)]
+            objects = [d for d in objects if is_complete(d)]
+            for object_dir in objects:
+                pack_rgb(object_dir, args.pack_rgb)
+            print('[DONE] {}: {} objects packed'.format(split_dir, len(objects)))
+        raise SystemExit(0)
+
+    if torch is None:
+        print('[WARN] torch not installed — writing .npz bundles instead of .pt')
+
+    exporters = [
+        SplitExporter(os.path.join(args.render_dir, 'pollen_{}'.format(s)), os.path.join(args.out_dir, s),
+                      shard_size=args.shard_size, num_views=args.num_views,
+                      settle_seconds=30. if args.watch else 0.)
+        for s in args.splits
+        if os.path.isdir(os.path.join(args.render_dir, 'pollen_{}'.format(s)))
+    ]
+    if args.watch:
+        last_progress = time.time()
+        while True:
+            if sum(e.export_ready() for e in exporters):
+                last_progress = time.time()
+            elif args.idle_exit_seconds is not None and time.time() - last_progress > args.idle_exit_seconds:
+                break
+            time.sleep(args.poll_seconds)
+    for e in exporters:
+        n = e.export_ready(final=True)
+        print('[DONE] {}: {} objects exported, {} total'.format(e.split_dir, n, len(e.manifest['objects'])))
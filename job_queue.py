@@ -0,0 +1,441 @@
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from blender_process import job_limits, log_path_for, mesh_face_count, png_progress, run_blender
+from verify_renders import FIXED_VIEWS
+
+# Coordinator-free work queue on a shared POSIX filesystem.
+#
+#   <queue>/pending/<job>.json   waiting jobs
+#   <queue>/leased/<job>.json    claimed jobs; the file's mtime is the worker's heartbeat
+#   <queue>/done/<job>.json      finished jobs
+#   <queue>/failed/<job>.json    jobs that used up max_attempts
+#
+# A worker claims a job by renaming it from pending/ to leased/ (atomic, exactly one
+# worker wins), touches the lease while it works and renames it to done/ at the end.
+# Any worker re-queues leases whose heartbeat is older than the TTL, so jobs of crashed
+# nodes are picked up again. Timestamps are compared against the filesystem's own clock,
+# which keeps nodes with skewed clocks consistent.
+
+STATES = ("pending", "leased", "done", "failed")
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, root, lease_ttl=600., max_attempts=3):
+        self.root = root
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        for state in STATES:
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+
+    def _path(self, state, job_id):
+        return os.path.join(self.root, state, job_id + ".json")
+
+    def _write_atomic(self, path, data):
+        tmp_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def fs_now(self):
+        """Current time as seen by the shared filesystem."""
+        probe = os.path.join(self.root, f".clock.{socket.gethostname()}.{os.getpid()}")
+        with open(probe, "w"):
+            pass
+        now = os.stat(probe).st_mtime
+        os.remove(probe)
+        return now
+
+    def submit(self, job_id, payload):
+        """Add a job unless it is already known in any state."""
+        if any(os.path.exists(self._path(s, job_id)) for s in STATES):
+            return False
+        self._write_atomic(self._path("pending", job_id), {"id": job_id, "attempts": 0, "payload": payload})
+        return True
+
+    def counts(self):
+        return {s: sum(1 for f in os.listdir(os.path.join(self.root, s)) if f.endswith(".json")) for s in STATES}
+
+    def claim(self, worker_id):
+        """Lease one pending job. Returns the job dict or None when nothing is pending."""
+        pending = [f for f in os.listdir(os.path.join(self.root, "pending")) if f.endswith(".json")]
+        # Random order spreads workers over the queue instead of racing for the same file
+        random.shuffle(pending)
+        for fname in pending:
+            job_id = fname[:-5]
+            pending_path = self._path("pending", job_id)
+            lease_path = self._path("leased", job_id)
+            try:
+                # Rename keeps the mtime, so start the heartbeat before the lease becomes
+                # visible: a stale mtime would let requeue_expired reap it right away
+                os.utime(pending_path, None)
+                os.rename(pending_path, lease_path)
+                with open(lease_path, "r") as f:
+                    job = json.load(f)
+            except FileNotFoundError:
+                continue
+            job["worker"] = worker_id
+            job["lease"] = uuid.uuid4().hex
+            job["attempts"] += 1
+            # Record the owner in the lease, so complete()/fail() never move another worker's re-claim
+            self._write_atomic(lease_path, job)
+            return job
+        return None
+
+    def heartbeat(self, job_id):
+        try:
+            os.utime(self._path("leased", job_id), None)
+        except FileNotFoundError:
+            raise LeaseLost(job_id)
+
+    def _take_lease(self, job, tmp_path):
+        """Move our lease of job to tmp_path; LeaseLost if it expired (and maybe was claimed again)."""
+        lease_path = self._path("leased", job["id"])
+        try:
+            with open(lease_path, "r") as f:
+                lease = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise LeaseLost(job["id"])
+        if lease.get("worker") != job.get("worker") or lease.get("lease") != job.get("lease"):
+            raise LeaseLost(job["id"])
+        try:
+            # Fresh mtime, so requeue_expired leaves the private name alone while we finish
+            os.utime(lease_path, None)
+            os.rename(lease_path, tmp_path)
+        except FileNotFoundError:
+            raise LeaseLost(job["id"])
+
+    def complete(self, job):
+        # On LeaseLost the job was re-queued; it will simply run again (renders are idempotent)
+        tmp_path = os.path.join(self.root, "done", f".{job['id']}.{uuid.uuid4().hex}.tmp")
+        self._take_lease(job, tmp_path)
+        self._write_atomic(tmp_path, job)
+        os.replace(tmp_path, self._path("done", job["id"]))
+
+    def fail(self, job, error=None):
+        """Give the job back, or move it to failed/ once it used up its attempts."""
+        job["last_error"] = error
+        state = "failed" if job["attempts"] >= self.max_attempts else "pending"
+        tmp_path = os.path.join(self.root, state, f".{job['id']}.{uuid.uuid4().hex}.tmp")
+        self._take_lease(job, tmp_path)
+        job.pop("worker", None)
+        job.pop("lease", None)
+        self._write_atomic(tmp_path, job)
+        os.replace(tmp_path, self._path(state, job["id"]))
+
+    def _expire(self, job):
+        """Turn a dead worker's lease into a pending (or failed) job; returns the target state."""
+        # claim() records the attempt together with the lease token; without a token the
+        # worker died between the rename and that write, so count its attempt here
+        if "lease" not in job:
+            job["attempts"] += 1
+        job["last_error"] = "lease expired"
+        job.pop("worker", None)
+        job.pop("lease", None)
+        return "failed" if job["attempts"] >= self.max_attempts else "pending"
+
+    def _recover_moves(self, now):
+        """
+        Finish moves left under a private .<job>.<token>.{tmp,reap} name by a process killed
+        between its two renames, once the name is older than the TTL.
+        """
+        recovered = 0
+        for state in STATES:
+            state_dir = os.path.join(self.root, state)
+            for fname in os.listdir(state_dir):
+                if not fname.startswith(".") or not fname.endswith((".tmp", ".reap")):
+                    continue
+                path = os.path.join(state_dir, fname)
+                try:
+                    if now - os.stat(path).st_mtime < self.lease_ttl:
+                        continue
+                except FileNotFoundError:
+                    continue
+                parts = fname[1:].rsplit(".", 2)
+                if len(parts) < 3:
+                    # Orphan of _write_atomic; the job itself is still under its previous name
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                job_id, suffix = parts[0], parts[2]
+                own_path = os.path.join(state_dir, f".{job_id}.{uuid.uuid4().hex}.{suffix}")
+                try:
+                    os.utime(path, None)
+                    os.rename(path, own_path)
+                except FileNotFoundError:
+                    continue
+                with open(own_path, "r") as f:
+                    job = json.load(f)
+                if suffix == "reap":
+                    # A reaper died; redo its work unless it already rewrote the job
+                    target = self._expire(job) if "worker" in job else \
+                        ("failed" if job["attempts"] >= self.max_attempts else "pending")
+                else:
+                    # complete() or fail() died; the directory is the state it was moving to
+                    target = state
+                    if target != "done":
+                        job.pop("worker", None)
+                        job.pop("lease", None)
+                self._write_atomic(own_path, job)
+                os.replace(own_path, self._path(target, job_id))
+                recovered += 1
+        return recovered
+
+    def requeue_expired(self):
+        """
+        Return leases whose heartbeat is older than the TTL to pending/ (or failed/), and
+        finish moves that a killed worker or reaper left half done.
+        """
+        now = self.fs_now()
+        requeued = self._recover_moves(now)
+        leased_dir = os.path.join(self.root, "leased")
+        for fname in os.listdir(leased_dir):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                if now - os.stat(os.path.join(leased_dir, fname)).st_mtime < self.lease_ttl:
+                    continue
+            except FileNotFoundError:
+                continue
+            job_id = fname[:-5]
+            # Move to a private name first so only one reaper handles this lease
+            # (with a fresh mtime, so _recover_moves leaves it alone while we finish)
+            tmp_path = os.path.join(leased_dir, f".{job_id}.{uuid.uuid4().hex}.reap")
+            try:
+                os.utime(self._path("leased", job_id), None)
+                os.rename(self._path("leased", job_id), tmp_path)
+            except FileNotFoundError:
+                continue
+            with open(tmp_path, "r") as f:
+                job = json.load(f)
+            state = self._expire(job)
+            self._write_atomic(tmp_path, job)
+            os.replace(tmp_path, self._path(state, job_id))
+            requeued += 1
+        return requeued
+
+    def work(self, handler, worker_id=None, heartbeat_interval=None, idle_exit=True, poll_seconds=10.):
+        """
+        Process jobs until the queue is drained.
+        :param handler: callable(payload) -> True on success.
+        """
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        heartbeat_interval = heartbeat_interval or self.lease_ttl / 4.
+        processed = 0
+        while True:
+            self.requeue_expired()
+            job = self.claim(worker_id)
+            if job is None:
+                c = self.counts()
+                if idle_exit and c["pending"] == 0 and c["leased"] == 0:
+                    return processed
+                time.sleep(poll_seconds)
+                continue
+
+            stop = threading.Event()
+
+            def beat():
+                while not stop.wait(heartbeat_interval):
+                    try:
+                        self.heartbeat(job["id"])
+                    except LeaseLost:
+                        return
+
+            beater = threading.Thread(target=beat, daemon=True)
+            beater.start()
+            try:
+                ok, error = bool(handler(job["payload"])), None
+            except Exception as e:
+                ok, error = False, repr(e)
+            finally:
+                stop.set()
+                beater.join()
+
+            try:
+                if ok:
+                    self.complete(job)
+                else:
+                    self.fail(job, error)
+            except LeaseLost:
+                print(f"[WARN] Lease on {job['id']} expired while working; it was re-queued")
+            processed += 1
+
+
+def blender_handler(blender_path, script_path):
+    def handle(payload):
+        cmd = [
+            blender_path,
+            "--background",
+            "--python", script_path,
+            "--addons", "io_mesh_stl",
+            "--",
+            "--mesh_fpath", payload["mesh_fpath"],
+            "--output_dir", payload["output_dir"],
+            "--split_name", payload["split_name"],
+            "--object_name", payload["object_name"],
+            "--num_observations", str(payload["num_observations"]),
+            "--resolution", str(payload["resolution"]),
+            "--quiet",
+        ]
+        if payload.get("cam_style") == "orthogonal":
+            cmd.append("--orthogonal")
+        print(f"[INFO] [{payload['split_name']}] {payload['object_name']}")
+        log_path = log_path_for(os.path.join(payload["output_dir"], "logs"),
+                                f"{payload['split_name']}_{payload['object_name']}")
+        # Hung jobs are killed here; the queue's attempt count and failed/ handle retry and quarantine
+        num_views = FIXED_VIEWS.get(payload.get("cam_style"), int(payload["num_observations"]))
+        timeout, hang_seconds = job_limits(mesh_face_count(payload["mesh_fpath"]), num_views)
+        rgb_dir = os.path.join(payload["output_dir"], f"pollen_{payload['split_name']}", payload["object_name"], "rgb")
+        result = run_blender(cmd, log_path, timeout=timeout, progress=png_progress(rgb_dir), hang_seconds=hang_seconds)
+        if result.status != "ok":
+            print(f"[ERROR] {payload['object_name']} {result.status}, log: {log_path}\n{result.tail}")
+        return result.status == "ok"
+    return handle
+
+
+def _run_worker(root, lease_ttl, blender_path, script_path, idle_exit):
+    JobQueue(root, lease_ttl=lease_ttl).work(blender_handler(blender_path, script_path), idle_exit=idle_exit)
+
+
+def enqueue_splits(queue, mesh_dir, splits, output_dir, num_observations, resolution, split_camera_style):
+    added = 0
+    for split, mesh_names in splits.items():
+        for mesh_name in mesh_names:
+            mesh_path = os.path.join(mesh_dir, mesh_name)
+            if not os.path.exists(mesh_path):
+                continue
+            object_name = os.path.splitext(mesh_name)[0]
+            added += queue.submit(f"{split}__{object_name}", {
+                "mesh_fpath": mesh_path,
+                "output_dir": output_dir,
+                "split_name": split,
+                "object_name": object_name,
+                "cam_style": split_camera_style[split],
+                "num_observations": num_observations,
+                "resolution": resolution,
+            })
+    return added
+
+
+def _simulated_worker(root, crash_rate, seed):
+    """Worker for the crash simulation: sometimes dies mid-job without cleaning up."""
+    rng = random.Random(seed)
+    queue = JobQueue(root, lease_ttl=1.0, max_attempts=100)
+
+    def handle(payload):
+        time.sleep(rng.uniform(0.01, 0.05))
+        if rng.random() < crash_rate:
+            os._exit(1)
+        with open(os.path.join(root, "executions.log"), "a") as f:
+            f.write(payload["name"] + "\n")
+        return True
+
+    queue.work(handle, heartbeat_interval=0.2, poll_seconds=0.2)
+
+
+def simulate(root, num_jobs=200, num_workers=4, crash_rate=0.05, timeout=120.):
+    """
+    Local multi-process run that kills workers mid-job, like crashed nodes, and respawns
+    them. Checks that every job ends up in done/ and none is lost or failed.
+    """
+    import multiprocessing
+
+    queue = JobQueue(root, lease_ttl=1.0, max_attempts=100)
+    for i in range(num_jobs):
+        queue.submit(f"job{i:05d}", {"name": f"job{i:05d}"})
+
+    start = time.time()
+    spawned = 0
+    workers = []
+    while time.time() - start < timeout:
+        workers = [w for w in workers if w.is_alive()]
+        c = queue.counts()
+        if c["pending"] == 0 and c["leased"] == 0 and not workers:
+            break
+        while len(workers) < num_workers and (c["pending"] or c["leased"]):
+            w = multiprocessing.Process(target=_simulated_worker, args=(root, crash_rate, spawned))
+            w.start()
+            workers.append(w)
+            spawned += 1
+        time.sleep(0.1)
+
+    c = queue.counts()
+    with open(os.path.join(root, "executions.log"), "r") as f:
+        executed = f.read().split()
+    missing = num_jobs - len(set(executed))
+    print(f"[SIM] {num_jobs} jobs, {spawned} worker processes ({spawned - num_workers} replacements after crashes)")
+    print(f"[SIM] states: {c}; {len(executed)} executions for {len(set(executed))} distinct jobs")
+    ok = c["done"] == num_jobs and c["failed"] == 0 and missing == 0
+    print("[SIM] OK" if ok else "[SIM] FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Shared-filesystem render job queue.")
+    sub = p.add_subparsers(dest="command")
+
+    e = sub.add_parser("enqueue", help="Add one render job per mesh of splits.json.")
+    e.add_argument("--queue", required=True)
+    e.add_argument("--mesh_dir", required=True)
+    e.add_argument("--splits_file", required=True)
+    e.add_argument("--output_dir", required=True)
+    e.add_argument("--num_observations", type=int, default=128)
+    e.add_argument("--resolution", type=int, default=256)
+
+    w = sub.add_parser("work", help="Pull and render jobs until the queue is empty.")
+    w.add_argument("--queue", required=True)
+    w.add_argument("--blender", required=True)
+    w.add_argument("--script", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    "shapenet_spherical_renderer_multi_core.py"))
+    w.add_argument("--lease_ttl", type=float, default=600.)
+    w.add_argument("--processes", type=int, default=1, help="Worker processes on this node.")
+    w.add_argument("--wait", action="store_true", help="Keep polling instead of exiting when idle.")
+
+    s = sub.add_parser("status", help="Print job counts per state.")
+    s.add_argument("--queue", required=True)
+
+    sim = sub.add_parser("simulate", help="Local crash simulation of several workers.")
+    sim.add_argument("--queue", default=None, help="Scratch directory (default: a temp dir).")
+    sim.add_argument("--jobs", type=int, default=200)
+    sim.add_argument("--workers", type=int, default=4)
+    sim.add_argument("--crash_rate", type=float, default=0.05)
+
+    args = p.parse_args()
+    if args.command == "enqueue":
+        with open(args.splits_file, "r") as f:
+            splits = json.load(f)
+        camera_style = {"train": "spherical", "val": "spiral", "test": "orthogonal"}
+        n = enqueue_splits(JobQueue(args.queue), args.mesh_dir, splits, args.output_dir,
+                           args.num_observations, args.resolution, camera_style)
+        print(f"[INFO] Enqueued {n} new jobs")
+    elif args.command == "work":
+        from multiprocessing import Pool
+        q = JobQueue(args.queue, lease_ttl=args.lease_ttl)
+        handler = blender_handler(args.blender, args.script)
+        if args.processes == 1:
+            q.work(handler, idle_exit=not args.wait)
+        else:
+            with Pool(processes=args.processes) as pool:
+                pool.starmap(_run_worker, [(args.queue, args.lease_ttl, args.blender, args.script, not args.wait)]
+                             * args.processes)
+    elif args.command == "status":
+        print(JobQueue(args.queue).counts())
+    elif args.command == "simulate":
+        import tempfile
+        root = args.queue or tempfile.mkdtemp(prefix="job_queue_sim_")
+        sys.exit(0 if simulate(root, args.jobs, args.workers, args.crash_rate) else 1)
+    else:
+        p.print_help()
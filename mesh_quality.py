@@ -0,0 +1,98 @@
+import numpy as np
+
+# Vectorized sanity checks for augmented meshes.
+# Everything works on plain (V, 3) vertex and (F, 3) triangle arrays so it runs the
+# same inside Blender (see util.get_mesh_arrays) and in plain Python.
+
+DEFAULT_THRESHOLDS = {
+    'min_volume_ratio': 0.5,      # variant volume / base volume
+    'max_volume_ratio': 2.0,
+    'max_aspect_growth': 1.6,     # variant aspect ratio / base aspect ratio
+    'min_thickness_ratio': 0.5,   # variant min width / base min width
+    'max_new_non_manifold': 0,    # non-manifold edges beyond what the base already had
+}
+
+
+def fibonacci_directions(n=64):
+    '''Roughly uniform unit vectors on the upper hemisphere (widths are symmetric).'''
+    i = np.arange(n) + 0.5
+    z = i / n
+    phi = np.pi * (1 + 5 ** 0.5) * i
+    r = np.sqrt(1 - z ** 2)
+    return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=-1)
+
+
+def volume(verts, tris):
+    '''Enclosed volume via the divergence theorem; meaningful for closed meshes.'''
+    a, b, c = verts[tris[:, 0]], verts[tris[:, 1]], verts[tris[:, 2]]
+    return abs(np.einsum('ij,ij->i', a, np.cross(b, c)).sum()) / 6.0
+
+
+def principal_extents(verts):
+    '''Extents along the principal axes, largest first (rotation invariant).'''
+    centered = verts - verts.mean(axis=0)
+    _, _, axes = np.linalg.svd(np.dot(centered.T, centered))
+    proj = np.dot(centered, axes.T)
+    return proj.max(axis=0) - proj.min(axis=0)
+
+
+def non_manifold_edge_count(tris):
+    '''Edges not shared by exactly two triangles.'''
+    edges = np.concatenate((tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]))
+    edges.sort(axis=1)
+    keys = edges[:, 0].astype(np.int64) * (int(tris.max()) + 1) + edges[:, 1]
+    _, counts = np.unique(keys, return_counts=True)
+    return int((counts != 2).sum())
+
+
+def min_thickness(verts, directions=None):
+    '''Smallest width of the vertex set over a fan of probe directions.'''
+    if directions is None:
+        directions = fibonacci_directions()
+    proj = np.dot(verts, directions.T)
+    return float((proj.max(axis=0) - proj.min(axis=0)).min())
+
+
+def mesh_stats(verts, tris):
+    verts = np.asarray(verts, dtype=np.float64)
+    tris = np.asarray(tris, dtype=np.int64)
+    extents = principal_extents(verts)
+    return {
+        'volume': float(volume(verts, tris)),
+        'aspect': float(extents[0] / max(extents[-1], 1e-12)),
+        'non_manifold_edges': non_manifold_edge_count(tris),
+        'min_thickness': min_thickness(verts),
+    }
+
+
+def check(stats, base_stats, thresholds=None):
+    '''
+    Compare a variant against its base mesh.
+    :return: dict with 'valid', the ratios that were tested and the failed criteria.
+    '''
+    th = dict(DEFAULT_THRESHOLDS)
+    th.update(thresholds or {})
+
+    volume_ratio = stats['volume'] / max(base_stats['volume'], 1e-12)
+    aspect_growth = stats['aspect'] / max(base_stats['aspect'], 1e-12)
+    thickness_ratio = stats['min_thickness'] / max(base_stats['min_thickness'], 1e-12)
+    new_non_manifold = stats['non_manifold_edges'] - base_stats['non_manifold_edges']
+
+    failed = []
+    if not th['min_volume_ratio'] <= volume_ratio <= th['max_volume_ratio']:
+        failed.append('volume_ratio')
+    if aspect_growth > th['max_aspect_growth']:
+        failed.append('aspect')
+    if thickness_ratio < th['min_thickness_ratio']:
+        failed.append('min_thickness')
+    if new_non_manifold > th['max_new_non_manifold']:
+        failed.append('non_manifold_edges')
+
+    return {
+        'valid': not failed,
+        'failed': failed,
+        'volume_ratio': round(volume_ratio, 4),
+        'aspect_growth': round(aspect_growth, 4),
+        'thickness_ratio': round(thickness_ratio, 4),
+        'new_non_manifold_edges': int(new_non_manifold),
+    }
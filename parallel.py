@@ -1,10 +1,15 @@
 import os
-import subprocess
-from multiprocessing import Pool
 import json
 import random
+import time
 from functools import partial
 
+import render_pool
+import util
+from render_metrics import RenderMetrics, job_result, job_started
+from blender_process import Quarantine, job_limits, log_path_for, mesh_face_count, png_progress, run_with_retries
+from verify_renders import FIXED_VIEWS
+
 # === CONFIGURATION ===
 blender_path = r"C:\Program Files\Blender2.7\blender.exe"
 script_path = r"C:\Users\super\Documents\GitHub\shapenet_renderer\shapenet_spherical_renderer_multi_core.py"
@@ -12,7 +17,50 @@ mesh_dir = r"C:\Users\super\Documents\Github\sequoia\data\processed\interim"
 output_dir = r"C:\Users\super\Documents\GitHub\shapenet_renderer\128_views\256_res"
 num_observations = "128"
 resolution = "256"
-num_processes = 12
+# None = size automatically from the usable cores; each worker is pinned to its own core set
+num_processes = None
+threads_per_process = None
+num_processes, threads_per_process, core_sets = render_pool.plan_pool(num_processes, threads_per_process)
+# Headless render settings; Blender gets exactly the threads of its worker's core set
+render_profile = "throughput"
+blender_threads = str(threads_per_process)
+# PNG layout: 'RGB' or 'BW' drop the constant alpha channel of the opaque renders losslessly;
+# lower compression (Blender's 0-100) encodes faster. See benchmark_image_formats.py
+png_color_mode = "RGBA"
+png_color_depth = "8"
+png_compression = "15"
+# 'L', 'RGB' or 'RGBA': also pack each object's views into a raw uint8 <object>/rgb.npy
+pack_rgb = None
+# Set to a directory to write a SparseFusion-style .pt bundle per object right after it renders
+export_pt_dir = None
+# Add every finished object to pollen_{split}/poses.bin, the memory-mapped pose index
+index_poses = True
+# Bake the static three-sun + environment lighting into vertex colors once per mesh and
+# render every view shadeless (see BlenderInterface.bake_lighting)
+bake_lighting = False
+# Object scale: 'bbox' (unit bounding-box sphere, the scale of every earlier render) or
+# 'sphere' (tight vertex sphere fitted to the frame). Objects rendered at another scale are
+# re-rendered completely, also by repair and incremental runs (see util.normalization_changed)
+normalization = "bbox"
+object_radius = None  # None = the normalization's default radius
+# Reuse existing views whose pose is still requested (e.g. after raising num_observations)
+incremental = False
+# Extra named view sets per object, rendered after the same import into <object>/<name>/,
+# e.g. "train:128:spherical,canon:4:orthogonal" (None = one set per split as above)
+view_sets = None
+# Set to a verify_renders.py job list to re-render only the broken views it names
+repair_jobs_file = None
+
+# Blender output is streamed to one rotating log per job; only a tail is kept for errors
+log_dir = os.path.join(output_dir, "logs")
+quiet_blender = True
+# Hung/slow jobs are killed by a watchdog and retried after backoff_seconds * 2^attempt;
+# meshes failing every attempt are listed in <output_dir>/quarantine.jsonl and skipped later
+backoff_seconds = 30.
+quarantine = Quarantine(output_dir)
+# Progress/throughput/ETA go to <output_dir>/render_status.json; set a port (e.g. 9101) to also
+# serve them as Prometheus text on http://127.0.0.1:<port>/metrics
+metrics_port = None
 
 # Ensure the output directory exists
 os.makedirs(output_dir, exist_ok=True)
@@ -33,39 +81,104 @@ def generate_splits(mesh_list, split_path):
     return splits
 
 
-def render_single_mesh(mesh_path, split_name, cam_style, max_retries=3):
+def export_rendered_object(name, split_name):
+    """name is the object dir relative to the split dir: '<object>' or '<object>/<view set>'."""
+    import export_tensors
+
+    ext = ".pt" if export_tensors.torch is not None else ".npz"
+    out_path = os.path.join(export_pt_dir, split_name, *name.split("/")) + ext
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    instance_dir = os.path.join(output_dir, f"pollen_{split_name}", *name.split("/"))
+    try:
+        export_tensors.export_object(instance_dir, out_path, name)
+    except Exception as e:
+        print(f"[ERROR] Tensor export failed for {name}: {e}")
+
+
+def render_single_mesh(mesh_path, split_name, cam_style, max_retries=3, views=None):
     mesh_name = os.path.splitext(os.path.basename(mesh_path))[0]
-    attempt = 0
-    while attempt < max_retries:
-        cmd = [
-            blender_path,
-            "--background",
-            "--python", script_path,
-            "--addons", "io_mesh_stl",
-            "--",
-            "--mesh_fpath", mesh_path,
-            "--output_dir", output_dir,
-            "--split_name", split_name,
-            "--object_name", mesh_name,
-            "--num_observations", num_observations,
-            "--resolution", resolution,
-        ]
+    if mesh_name in quarantine:
+        print(f"[SKIP] Quarantined: {mesh_name}")
+        return job_result(mesh_name, split_name, "skipped", group=cam_style)
+    job_started(output_dir, mesh_name, split_name, cam_style)
 
-        if cam_style == "orthogonal":
-            cmd.append("--orthogonal")
+    cmd = [
+        blender_path,
+        "--background",
+        "--python", script_path,
+        "--addons", "io_mesh_stl",
+        "--",
+        "--mesh_fpath", mesh_path,
+        "--output_dir", output_dir,
+        "--split_name", split_name,
+        "--object_name", mesh_name,
+        "--num_observations", num_observations,
+        "--resolution", resolution,
+        "--profile", render_profile,
+        "--threads", blender_threads,
+        "--color_mode", png_color_mode,
+        "--color_depth", png_color_depth,
+        "--compression", png_compression,
+        "--normalization", normalization,
+    ]
+    if object_radius is not None:
+        cmd += ["--object_radius", str(object_radius)]
+    if cam_style == "orthogonal":
+        cmd.append("--orthogonal")
+    if quiet_blender:
+        cmd.append("--quiet")
+    if bake_lighting:
+        cmd.append("--bake_lighting")
+    if view_sets is not None and views is None:
+        cmd += ["--view_sets", view_sets]
+    if incremental and views is None:
+        cmd.append("--incremental")
+    if views is not None:
+        cmd.append("--views=" + ",".join(str(v) for v in views))
+
+    object_dir = os.path.join(output_dir, f"pollen_{split_name}", mesh_name)
+    if views is not None:
+        num_views, rgb_dirs = len(views), [os.path.join(object_dir, "rgb")]
+    elif view_sets is not None:
+        sets = util.parse_view_sets(view_sets)
+        num_views = sum(FIXED_VIEWS.get(v["cam_style"], v["num_observations"]) for v in sets)
+        rgb_dirs = [os.path.join(object_dir, v["name"], "rgb") for v in sets]
+    else:
+        num_views, rgb_dirs = FIXED_VIEWS.get(cam_style, int(num_observations)), [os.path.join(object_dir, "rgb")]
+    timeout, hang_seconds = job_limits(mesh_face_count(mesh_path), num_views)
+    stages = {}
+    start = time.perf_counter()
+    result = run_with_retries(cmd, log_path_for(log_dir, f"{split_name}_{mesh_name}"),
+                              f"{mesh_name} [split={split_name}, cam={cam_style}]", max_retries, backoff_seconds,
+                              timeout=timeout, progress=png_progress(*rgb_dirs), hang_seconds=hang_seconds)
+    stages["blender"] = time.perf_counter() - start
 
-        print(f"[INFO] Launching Blender for: {mesh_name} [split={split_name}, cam={cam_style}] (attempt {attempt+1})")
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.status == "ok":
+        print(f"[DONE] Finished: {mesh_name}")
+        start = time.perf_counter()
+        split_dir = os.path.join(output_dir, f"pollen_{split_name}")
+        names = [f"{mesh_name}/{v['name']}" for v in util.parse_view_sets(view_sets)] \
+            if view_sets is not None and views is None else [mesh_name]
+        if index_poses:
+            import pose_index
+            for name in names:
+                pose_index.index_object(split_dir, name)
+        if pack_rgb is not None:
+            import export_tensors
+            for name in names:
+                export_tensors.pack_rgb(os.path.join(split_dir, name), pack_rgb)
+        if export_pt_dir is not None:
+            for name in names:
+                export_rendered_object(name, split_name)
+        stages["postprocess"] = time.perf_counter() - start
+        return job_result(mesh_name, split_name, "done", cam_style, num_views, stages, result.peak_rss, output_dir)
+    print(f"[FAIL] All attempts failed for {mesh_name} — quarantined")
+    quarantine.add(mesh_name, result.status, result.log_path)
+    return job_result(mesh_name, split_name, "failed", cam_style, 0, stages, result.peak_rss, output_dir)
 
-        if result.returncode == 0:
-            print(f"[DONE] Finished: {mesh_name}")
-            return
-        else:
-            print(f"[ERROR] Rendering failed for {mesh_name} (attempt {attempt+1})")
-            print("STDERR:\n", result.stderr)
-            attempt += 1
 
-    print(f"[FAIL] All attempts failed for {mesh_name}")
+def render_repair_job(args):
+    return render_single_mesh(*args)
 
 
 if __name__ == "__main__":
@@ -89,22 +202,63 @@ if __name__ == "__main__":
         "test": "orthogonal"
     }
 
+    if repair_jobs_file is not None:
+        with open(repair_jobs_file, "r") as f:
+            repair_jobs = json.load(f)
+        mesh_paths = {os.path.splitext(os.path.basename(p))[0]: p for p in all_mesh_files}
+        repair_args = [
+            (mesh_paths[job["object"]], job["split"], split_camera_style[job["split"]], 3, job["views"])
+            for job in repair_jobs if job["object"] in mesh_paths
+        ]
+        # '<object>/<view set>' jobs: drop the broken views, then one view-set render per object
+        # re-renders exactly the missing ones (and rewrites every set's metadata)
+        set_repairs = {}
+        for job in repair_jobs:
+            obj, _, set_name = job["object"].partition("/")
+            if not set_name or obj not in mesh_paths:
+                continue
+            if view_sets is None:
+                print(f"[WARN] {job['object']} belongs to a view set, but view_sets is not set; skipping it")
+                continue
+            set_dir = os.path.join(output_dir, f"pollen_{job['split']}", obj, set_name)
+            for i in job["views"]:
+                for path in (os.path.join(set_dir, "rgb", "%06d.png" % i), os.path.join(set_dir, "pose", "%06d.txt" % i)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            set_repairs[(obj, job["split"])] = set_repairs.get((obj, job["split"]), 0) + len(job["views"])
+        print(f"[INFO] Repairing {sum(len(a[-1]) for a in repair_args) + sum(set_repairs.values())} views in "
+              f"{len(repair_args) + len(set_repairs)} objects")
+        repair_args += [(mesh_paths[obj], split, split_camera_style[split], 3, None)
+                        for obj, split in sorted(set_repairs)]
+        with RenderMetrics(output_dir, port=metrics_port) as metrics:
+            metrics.add_jobs(len(repair_args))
+            with render_pool.make_pool(num_processes, core_sets) as pool:
+                for result in pool.imap_unordered(render_repair_job, repair_args):
+                    metrics.record(result)
+        raise SystemExit(0)
+
+    split_meshes = {}
     for split_name in ["train", "val", "test"]:
-        print(f"\n===== STARTING SPLIT: {split_name.upper()} =====")
         selected_names = set(splits[split_name])
-        mesh_files = [
+        split_meshes[split_name] = [
             os.path.join(mesh_dir, f)
             for f in os.listdir(mesh_dir)
             if f in selected_names
         ]
 
-        print(f"[INFO] Found {len(mesh_files)} mesh files for split: {split_name}")
-        cam_style = split_camera_style[split_name]
+    with RenderMetrics(output_dir, port=metrics_port) as metrics:
+        # All splits are queued up front so the ETA covers the whole run
+        metrics.add_jobs(sum(len(m) for m in split_meshes.values()))
+        for split_name, mesh_files in split_meshes.items():
+            print(f"\n===== STARTING SPLIT: {split_name.upper()} =====")
+            print(f"[INFO] Found {len(mesh_files)} mesh files for split: {split_name}")
+            cam_style = split_camera_style[split_name]
 
-        # Use partial to freeze args for multiprocessing
-        render_fn = partial(render_single_mesh, split_name=split_name, cam_style=cam_style)
+            # Use partial to freeze args for multiprocessing
+            render_fn = partial(render_single_mesh, split_name=split_name, cam_style=cam_style)
 
-        with Pool(processes=num_processes) as pool:
-            pool.map(render_fn, mesh_files)
+            with render_pool.make_pool(num_processes, core_sets) as pool:
+                for result in pool.imap_unordered(render_fn, mesh_files):
+                    metrics.record(result)
 
-        print(f"[INFO] Completed rendering for split: {split_name}")
+            print(f"[INFO] Completed rendering for split: {split_name}")
@@ -1,21 +1,53 @@
 import os
-import subprocess
-from multiprocessing import Pool
 import json
+import time
 from functools import partial
 
+import render_pool
+from blender_process import (Quarantine, file_progress, job_limits, log_path_for, mesh_face_count, png_progress,
+                             run_with_retries)
+from augmentation_index import AugmentationIndex
+from render_metrics import RenderMetrics, job_result, job_started
+from verify_renders import FIXED_VIEWS, has_expected_views
+
 # === CONFIGURATION ===
 blender_path    = r"C:\Program Files\Blender2.7\blender.exe"
 script_path     = r"C:\Users\super\Documents\GitHub\shapenet_renderer\shapenet_spherical_renderer_multi_core.py"
+fused_script_path = r"C:\Users\super\Documents\GitHub\shapenet_renderer\render_augmented_fused.py"
 
 augmentation_root = r"C:\Users\super\Documents\GitHub\shapenet_renderer\augmentation"
+base_mesh_dir     = r"C:\Users\super\Documents\Github\sequoia\data\processed\meshes_repaired"
 output_dir        = r"C:\Users\super\Documents\GitHub\shapenet_renderer\128_views\256_res"
 split_file        = os.path.join(output_dir, "splits.json")
 progress_file     = os.path.join(output_dir, "render_progress.json")
+log_dir           = os.path.join(output_dir, "logs")   # one rotating Blender log per job
+quiet_blender     = True
+backoff_seconds   = 30.   # retry delay doubles per attempt for killed/failed jobs
+quarantine        = Quarantine(output_dir)   # meshes failing every attempt; skipped by later runs
+metrics_port      = None  # e.g. 9101: Prometheus text on 127.0.0.1; render_status.json is always written
 
 num_observations = "128"
 resolution       = "256"
-num_processes    = 12
+num_processes    = None   # None = size from the usable cores
+threads_per_process = None
+num_processes, threads_per_process, core_sets = render_pool.plan_pool(num_processes, threads_per_process)
+render_profile   = "throughput"
+blender_threads  = str(threads_per_process)
+
+# Fused mode: augment each base mesh in memory and render all its variants in one
+# Blender session instead of rendering pre-exported STLs one process at a time.
+fused             = False
+num_augmentations = "5"
+export_stl        = False
+png_color_mode    = "RGBA"  # 'RGB' / 'BW' are lossless here (opaque background, gray mesh) and smaller
+png_color_depth   = "8"
+png_compression   = "15"    # Blender's 0-100; lower encodes faster (see benchmark_image_formats.py)
+pack_rgb          = None    # 'L' / 'RGB' / 'RGBA': also write a raw rgb.npy per object (not in fused mode)
+index_poses       = True  # build pollen_{split}/poses.bin (memory-mapped pose index) after each split
+bake_lighting     = False # bake lighting into vertex colors once per variant, shadeless views
+normalization     = "bbox"  # 'bbox' (legacy unit sphere) or 'sphere' (tight fit to the frame); see parallel.py
+object_radius     = None    # None = the normalization's default radius
+num_deformations  = 7     # FastPollenAugmentor.deformations, sizes the fused watchdog budget
 
 split_camera_style = {
     "train": "spherical",
@@ -30,43 +62,60 @@ def load_splits(path):
 
 
 def collect_augmented_meshes(splits):
-    split_sets = {s: set(splits[s]) for s in splits}
+    """Group augmented meshes by split, reading the augmentation index when present."""
+    index = AugmentationIndex(augmentation_root)
+    if len(index) == 0:
+        print("[INFO] No augmentation index found — scanning augmentation_root")
+        return scan_augmented_meshes(splits)
+
+    split_of_base = {base: s for s in splits for base in splits[s]}
+    collected = {s: [] for s in splits}
+    for entry in index:
+        if not AugmentationIndex.is_valid(entry):
+            continue
+        split = split_of_base.get(entry["base"])
+        if split is not None:
+            collected[split].append(os.path.join(augmentation_root, *entry["file"].split("/")))
+    return collected
+
+
+def scan_augmented_meshes(splits):
+    """Fallback for augmentation trees written before the index existed."""
+    split_of_base = {base: s for s in splits for base in splits[s]}
     collected = {s: [] for s in splits}
 
-    for aug_type in os.listdir(augmentation_root):
-        aug_dir = os.path.join(augmentation_root, aug_type)
-        if not os.path.isdir(aug_dir):
+    for aug_entry in os.scandir(augmentation_root):
+        if not aug_entry.is_dir():
             continue
+        marker = f"_{aug_entry.name}_"
 
-        for fn in os.listdir(aug_dir):
-            if not fn.lower().endswith(".stl"):
+        for f in os.scandir(aug_entry.path):
+            if not f.name.lower().endswith(".stl") or marker not in f.name:
                 continue
+            split = split_of_base.get(f.name.split(marker)[0] + ".stl")
+            if split is not None:
+                collected[split].append(f.path)
+    return collected
 
-            marker = f"_{aug_type}_"
-            if marker not in fn:
-                continue
-            base = fn.split(marker)[0] + ".stl"
 
-            for split in split_sets:
-                if base in split_sets[split]:
-                    collected[split].append(os.path.join(aug_dir, fn))
-                    break
-    return collected
+def expected_views(cam_style):
+    return FIXED_VIEWS.get(cam_style, int(num_observations))
 
 
 def infer_completed_renders():
-    """Scan output directory and infer which meshes are already rendered."""
+    """Scan output directory and collect the meshes whose views are all present."""
     completed = {"train": [], "val": [], "test": []}
     if not os.path.exists(output_dir):
         return completed
 
     for split in completed:
-        split_path = os.path.join(output_dir, split)
+        split_path = os.path.join(output_dir, f"pollen_{split}")
         if not os.path.exists(split_path):
             continue
-        for fn in os.listdir(split_path):
-            if os.path.isdir(os.path.join(split_path, fn)):
-                completed[split].append(fn)
+        expected = expected_views(split_camera_style[split])
+        with os.scandir(split_path) as it:
+            completed[split] = [e.name for e in it
+                                if e.is_dir() and has_expected_views(e.path, expected)]
     return completed
 
 
@@ -89,58 +138,169 @@ def save_progress(progress):
 
 def render_single_mesh(mesh_path, split_name, cam_style, progress):
     mesh_name = os.path.splitext(os.path.basename(mesh_path))[0]
+    # Augmented meshes live in augmentation_root/<deformation>/, so metrics are grouped by deformation
+    group = os.path.basename(os.path.dirname(mesh_path))
     if mesh_name in progress.get(split_name, []):
         print(f"[SKIP] Already rendered: {mesh_name}")
-        return
-
-    for attempt in range(1, 4):
-        cmd = [
-            blender_path,
-            "--background",
-            "--python", script_path,
-            "--addons", "io_mesh_stl",
-            "--",
-            "--mesh_fpath", mesh_path,
-            "--output_dir", output_dir,
-            "--split_name", split_name,
-            "--object_name", mesh_name,
-            "--num_observations", num_observations,
-            "--resolution", resolution,
-        ]
-        if cam_style == "orthogonal":
-            cmd.append("--orthogonal")
-
-        print(f"[INFO] [{split_name}][{cam_style}] {mesh_name} (attempt {attempt})")
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        if result.returncode == 0:
-            print(f"[DONE] {mesh_name}")
-            progress[split_name].append(mesh_name)
-            save_progress(progress)
-            return
-        else:
-            print(f"[ERROR] {mesh_name} failed (attempt {attempt})")
-            print(result.stderr)
-
-    print(f"[FAIL] {mesh_name} after 3 attempts")
+        return job_result(mesh_name, split_name, "skipped", group)
+    if mesh_name in quarantine:
+        print(f"[SKIP] Quarantined: {mesh_name}")
+        return job_result(mesh_name, split_name, "skipped", group)
+    job_started(output_dir, mesh_name, split_name, group)
+
+    cmd = [
+        blender_path,
+        "--background",
+        "--python", script_path,
+        "--addons", "io_mesh_stl",
+        "--",
+        "--mesh_fpath", mesh_path,
+        "--output_dir", output_dir,
+        "--split_name", split_name,
+        "--object_name", mesh_name,
+        "--num_observations", num_observations,
+        "--resolution", resolution,
+        "--profile", render_profile,
+        "--threads", blender_threads,
+        "--color_mode", png_color_mode,
+        "--color_depth", png_color_depth,
+        "--compression", png_compression,
+        "--normalization", normalization,
+    ]
+    if object_radius is not None:
+        cmd += ["--object_radius", str(object_radius)]
+    if cam_style == "orthogonal":
+        cmd.append("--orthogonal")
+    if bake_lighting:
+        cmd.append("--bake_lighting")
+    if quiet_blender:
+        cmd.append("--quiet")
+
+    timeout, hang_seconds = job_limits(mesh_face_count(mesh_path), expected_views(cam_style))
+    rgb_dir = os.path.join(output_dir, f"pollen_{split_name}", mesh_name, "rgb")
+    start = time.perf_counter()
+    result = run_with_retries(cmd, log_path_for(log_dir, f"{split_name}_{mesh_name}"),
+                              f"[{split_name}][{cam_style}] {mesh_name}", 3, backoff_seconds,
+                              timeout=timeout, progress=png_progress(rgb_dir), hang_seconds=hang_seconds)
+    stages = {"blender": time.perf_counter() - start}
+
+    if result.status == "ok":
+        print(f"[DONE] {mesh_name}")
+        progress[split_name].append(mesh_name)
+        save_progress(progress)
+        if pack_rgb is not None:
+            import export_tensors
+            start = time.perf_counter()
+            export_tensors.pack_rgb(os.path.dirname(rgb_dir), pack_rgb)
+            stages["postprocess"] = time.perf_counter() - start
+        return job_result(mesh_name, split_name, "done", group, expected_views(cam_style), stages,
+                          result.peak_rss, output_dir)
+    print(f"[FAIL] {mesh_name} after 3 attempts — quarantined")
+    quarantine.add(mesh_name, result.status, result.log_path)
+    return job_result(mesh_name, split_name, "failed", group, 0, stages, result.peak_rss, output_dir)
+
+
+def render_fused_base(base_name, split_name, cam_style):
+    mesh_path = os.path.join(base_mesh_dir, base_name)
+    if base_name in quarantine:
+        print(f"[SKIP] Quarantined: {base_name}")
+        return job_result(base_name, split_name, "skipped", "fused")
+    job_started(output_dir, base_name, split_name, "fused")
+
+    cmd = [
+        blender_path,
+        "--background",
+        "--python", fused_script_path,
+        "--addons", "io_mesh_stl",
+        "--",
+        "--mesh_fpath", mesh_path,
+        "--augmentation_dir", augmentation_root,
+        "--output_dir", output_dir,
+        "--split_name", split_name,
+        "--num_augmentations", num_augmentations,
+        "--num_observations", num_observations,
+        "--resolution", resolution,
+        "--profile", render_profile,
+        "--threads", blender_threads,
+        "--color_mode", png_color_mode,
+        "--color_depth", png_color_depth,
+        "--compression", png_compression,
+        "--normalization", normalization,
+    ]
+    if object_radius is not None:
+        cmd += ["--object_radius", str(object_radius)]
+    if cam_style == "orthogonal":
+        cmd.append("--orthogonal")
+    if export_stl:
+        cmd.append("--export_stl")
+    if bake_lighting:
+        cmd.append("--bake_lighting")
+    if quiet_blender:
+        cmd.append("--quiet")
+
+    # Variant directories are only named inside Blender, so the log growing is the progress signal
+    num_views = num_deformations * int(num_augmentations) * expected_views(cam_style)
+    timeout, hang_seconds = job_limits(mesh_face_count(mesh_path), num_views)
+    log_path = log_path_for(log_dir, f"{split_name}_fused_{os.path.splitext(base_name)[0]}")
+    start = time.perf_counter()
+    result = run_with_retries(cmd, log_path, f"[{split_name}][{cam_style}][fused] {base_name}", 3, backoff_seconds,
+                              timeout=timeout, progress=file_progress(log_path), hang_seconds=hang_seconds)
+    stages = {"blender": time.perf_counter() - start}
+
+    if result.status == "ok":
+        print(f"[DONE] {base_name}")
+        return job_result(base_name, split_name, "done", "fused", num_views, stages, result.peak_rss, output_dir)
+    print(f"[FAIL] {base_name} after 3 attempts — quarantined")
+    quarantine.add(base_name, result.status, result.log_path)
+    return job_result(base_name, split_name, "failed", "fused", 0, stages, result.peak_rss, output_dir)
 
 
 if __name__ == "__main__":
     splits = load_splits(split_file)
+
+    if fused:
+        split_bases = {split: [b for b in splits[split] if os.path.exists(os.path.join(base_mesh_dir, b))]
+                       for split in ["train", "val", "test"]}
+        with RenderMetrics(output_dir, port=metrics_port) as metrics:
+            metrics.add_jobs(sum(len(b) for b in split_bases.values()))
+            for split, bases in split_bases.items():
+                cam_style = split_camera_style[split]
+                print(f"\n=== SPLIT={split} has {len(bases)} base meshes → fused, cam={cam_style}")
+
+                worker = partial(render_fused_base, split_name=split, cam_style=cam_style)
+                with render_pool.make_pool(num_processes, core_sets) as pool:
+                    for result in pool.imap_unordered(worker, bases):
+                        metrics.record(result)
+
+                print(f"[INFO] Done rendering split {split}")
+                if index_poses:
+                    import pose_index
+                    # Variant directories are named inside Blender, so index whatever completed
+                    n = pose_index.build(os.path.join(output_dir, f"pollen_{split}"))
+                    print(f"[INFO] Indexed poses of {n} objects")
+        raise SystemExit(0)
+
     mesh_groups = collect_augmented_meshes(splits)
     progress = load_progress()
 
-    for split in ["train", "val", "test"]:
-        meshes = mesh_groups[split]
-        cam_style = split_camera_style[split]
-        print(f"\n=== SPLIT={split} has {len(meshes)} augmented meshes → cam={cam_style}")
+    with RenderMetrics(output_dir, port=metrics_port) as metrics:
+        metrics.add_jobs(sum(len(mesh_groups[s]) for s in ["train", "val", "test"]))
+        for split in ["train", "val", "test"]:
+            meshes = mesh_groups[split]
+            cam_style = split_camera_style[split]
+            print(f"\n=== SPLIT={split} has {len(meshes)} augmented meshes → cam={cam_style}")
 
-        worker = partial(render_single_mesh,
-                         split_name=split,
-                         cam_style=cam_style,
-                         progress=progress)
+            worker = partial(render_single_mesh,
+                             split_name=split,
+                             cam_style=cam_style,
+                             progress=progress)
 
-        with Pool(processes=num_processes) as pool:
-            pool.map(worker, meshes)
+            with render_pool.make_pool(num_processes, core_sets) as pool:
+                for result in pool.imap_unordered(worker, meshes):
+                    metrics.record(result)
 
-        print(f"[INFO] Done rendering split {split}")
+            print(f"[INFO] Done rendering split {split}")
+            if index_poses:
+                import pose_index
+                n = pose_index.build(os.path.join(output_dir, f"pollen_{split}"))
+                print(f"[INFO] Indexed poses of {n} objects")
@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+
+from export_tensors import is_complete, list_views, read_intrinsics, read_near_far, read_pose
+from util import object_dirs
+
+# Binary camera index of one rendered split, so readers look up any view's pose without
+# parsing the per-view text files:
+#
+#   pollen_{split}/poses.bin           fixed-size RECORD rows (object_id, view_id, pose, near, far),
+#                                      one contiguous block per object sorted by view_id, append-only
+#   pollen_{split}/poses_objects.bin   OBJECT table: name, first row and row count of the object's
+#                                      block, K and image size
+#
+# poses.bin is read through numpy.memmap and the table (a few hundred bytes per object) is
+# loaded whole, so a lookup is one dict access plus one row read. The drivers index each
+# object right after it rendered; re-indexing an object (repair, re-render) appends a new
+# block and repoints its table entry, and compact() drops the superseded blocks. Writers
+# serialize on a lock file, so pool workers of one split can share an index.
+#
+#   index = PoseIndex(split_dir)
+#   cam2world, near, far = index.view('pollen_00042', 17)
+
+RECORDS_FILE = 'poses.bin'
+OBJECTS_FILE = 'poses_objects.bin'
+LOCK_FILE = 'poses.lock'
+
+RECORD = np.dtype([
+    ('object_id', '<u4'),
+    ('view_id', '<u4'),
+    ('pose', '<f4', (4, 4)),    # OpenCV cam2world, as in pose/%06d.txt
+    ('near', '<f4'),
+    ('far', '<f4'),
+])
+OBJECT = np.dtype([
+    ('name', 'S128'),           # object dir relative to the split dir, e.g. 'obj' or 'obj/canon'
+    ('start', '<u8'),
+    ('count', '<u4'),
+    ('K', '<f4', (3, 3)),
+    ('image_size', '<u4', (2,)),  # height, width
+])
+
+
+@contextlib.contextmanager
+def _locked(path, stale_seconds=60., poll_seconds=0.05):
+    """Exclusive lock file; a lock older than stale_seconds is taken to belong to a dead writer."""
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_seconds:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(poll_seconds)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def object_records(object_dir):
+    """(records, K, image_size) of one rendered object read from its text files."""
+    view_ids = [int(v) for v in list_views(object_dir)]
+    K, image_size = read_intrinsics(os.path.join(object_dir, 'intrinsics.txt'))
+    near_far = read_near_far(os.path.join(object_dir, 'near_far.txt'))
+    records = np.zeros(len(view_ids), dtype=RECORD)
+    records['view_id'] = view_ids
+    for i, v in enumerate(view_ids):
+        records['pose'][i] = read_pose(os.path.join(object_dir, 'pose', '%06d.txt' % v))
+    records['near'] = near_far[view_ids, 0]
+    records['far'] = near_far[view_ids, 1]
+    return records, K, image_size
+
+
+class PoseIndex:
+    """
+    Reader and incremental writer of a split's pose index.
+    - view(name, view_id): (cam2world float32 [4, 4], near, far) in O(1) when the object's view
+      ids are 0..n-1 (the renderer's layout), O(log n) otherwise.
+    - views(name): (view_ids, cam2world [N, 4, 4], near_far [N, 2]) as memmap slices.
+    - add_object(name): (re)index one rendered object from its text files.
+    """
+
+    def __init__(self, split_dir):
+        self.split_dir = split_dir
+        self.records_path = os.path.join(split_dir, RECORDS_FILE)
+        self.objects_path = os.path.join(split_dir, OBJECTS_FILE)
+        self.lock_path = os.path.join(split_dir, LOCK_FILE)
+        self._table_stamp = None
+        self.reload()
+
+    def reload(self):
+        """Pick up objects other processes indexed since the last load."""
+        if os.path.exists(self.objects_path):
+            self._table_stamp = self._stamp()
+            self.table = np.fromfile(self.objects_path, dtype=OBJECT)
+        else:
+            self._table_stamp = None
+            self.table = np.zeros(0, dtype=OBJECT)
+        self.ids = {n.decode('utf-8'): i for i, n in enumerate(self.table['name'])}
+        size = os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+        self.records = np.memmap(self.records_path, dtype=RECORD, mode='r', shape=(size // RECORD.itemsize,)) \
+            if size >= RECORD.itemsize else np.zeros(0, dtype=RECORD)
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.objects_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh_if_changed(self):
+        if self._stamp() != self._table_stamp:
+            self.reload()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, name):
+        if name not in self.ids:
+            self._refresh_if_changed()
+        return name in self.ids
+
+    @property
+    def objects(self):
+        return list(self.ids)
+
+    def _entry(self, name):
+        if name not in self:
+            raise KeyError('{} is not in the pose index of {}'.format(name, self.split_dir))
+        return self.table[self.ids[name]]
+
+    def _block(self, name):
+        entry = self._entry(name)
+        start = int(entry['start'])
+        return self.records[start:start + int(entry['count'])]
+
+    def intrinsics(self, name):
+        """(K float32 [3, 3], (height, width))"""
+        entry = self._entry(name)
+        return np.array(entry['K']), tuple(int(x) for x in entry['image_size'])
+
+    def view(self, name, view_id):
+        block = self._block(name)
+        i = view_id
+        if i >= len(block) or block['view_id'][i] != view_id:
+            i = int(np.searchsorted(block['view_id'], view_id))
+            if i >= len(block) or block['view_id'][i] != view_id:
+                raise KeyError('{} has no view {} in the pose index'.format(name, view_id))
+        record = block[i]
+        return np.array(record['pose']), float(record['near']), float(record['far'])
+
+    def views(self, name):
+        block = self._block(name)
+        return block['view_id'], block['pose'], np.stack([block['near'], block['far']], axis=-1)
+
+    def add_object(self, name, object_dir=None):
+        """Index (or re-index) one object; name is its directory relative to the split dir."""
+        name = name.replace(os.sep, '/')
+        records, K, image_size = object_records(object_dir or os.path.join(self.split_dir, name))
+        with _locked(self.lock_path):
+            self.reload()
+            object_id = self.ids.get(name, len(self.table))
+            records['object_id'] = object_id
+            size = os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+            start = size // RECORD.itemsize
+            with open(self.records_path, 'ab') as f:
+                if size % RECORD.itemsize:
+                    # Drop a partial row left by a writer killed mid-append
+                    f.truncate(start * RECORD.itemsize)
+                f.write(records.tobytes())
+
+            entry = np.zeros(1, dtype=OBJECT)
+            entry['name'] = name.encode('utf-8')
+            entry['start'] = start
+            entry['count'] = len(records)
+            entry['K'] = K
+            entry['image_size'] = image_size
+            table = self.table.copy()
+            if object_id < len(table):
+                table[object_id] = entry[0]
+            else:
+                table = np.concatenate([table, entry])
+            self._write_table(table)
+            self.reload()
+
+    def _write_table(self, table):
+        tmp_path = self.objects_path + '.tmp'
+        table.tofile(tmp_path)
+        os.replace(tmp_path, self.objects_path)
+
+    def compact(self):
+        """
+        Rewrite poses.bin without superseded blocks. Run it while no reader has the index
+        open: the records file is replaced, which Windows refuses for mapped files.
+        """
+        with _locked(self.lock_path):
+            self.reload()
+            blocks = [np.array(self.records[int(e['start']):int(e['start']) + int(e['count'])]) for e in self.table]
+            table = self.table.copy()
+            start = 0
+            for entry, block in zip(table, blocks):
+                entry['start'] = start
+                start += len(block)
+            self.records = np.zeros(0, dtype=RECORD)  # release the map before replacing the file
+            tmp_path = self.records_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                for block in blocks:
+                    f.write(block.tobytes())
+            os.replace(tmp_path, self.records_path)
+            self._write_table(table)
+            self.reload()
+
+
+def index_object(split_dir, name):
+    """Driver hook: index one object straight after it rendered. Errors are reported, not raised."""
+    try:
+        PoseIndex(split_dir).add_object(name)
+    except Exception as e:
+        print('[ERROR] Pose index update failed for {}: {}'.format(name, e))
+
+
+def build(split_dir, rebuild=False):
+    """Index every complete object of a split that is not indexed yet. Returns how many were added."""
+    index = PoseIndex(split_dir)
+    count = 0
+    for name in object_dirs(split_dir):
+        if (rebuild or name not in index) and is_complete(os.path.join(split_dir, name)):
+            index.add_object(name)
+            count += 1
+    if rebuild:
+        index.compact()
+    return count
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Build or check the binary pose index of rendered splits.')
+    p.add_argument('--render_dir', required=True, help='Render output dir containing pollen_{split} folders.')
+    p.add_argument('--splits', nargs='+', default=['train', 'val', 'test'])
+    p.add_argument('--rebuild', action='store_true', help='Re-index every object and compact the index.')
+    p.add_argument('--check', action='store_true', help='Compare every indexed view with its text files.')
+    args = p.parse_args()
+
+    for split in args.splits:
+        split_dir = os.path.join(args.render_dir, 'pollen_{}'.format(split))
+        if not os.path.isdir(split_dir):
+            continue
+        start = time.perf_counter()
+        n = build(split_dir, args.rebuild)
+        index = PoseIndex(split_dir)
+        print('[DONE] {}: {} objects indexed, {} total, {} views ({:.1f}s)'.format(
+            split_dir, n, len(index), sum(int(e['count']) for e in index.table), time.perf_counter() - start))
+        if args.check:
+            bad = 0
+            for name in index.objects:
+                records, K, _ = object_records(os.path.join(split_dir, name))
+                view_ids, poses, near_far = index.views(name)
+                if not (np.array_equal(view_ids, records['view_id']) and np.allclose(poses, records['pose'])
+                        and np.allclose(near_far[:, 0], records['near']) and np.allclose(near_far[:, 1], records['far'])
+                        and np.allclose(index.intrinsics(name)[0], K)):
+                    print('[FAIL] {} differs from its text files'.format(name))
+                    bad += 1
+            print('[{}] {}: {} objects checked'.format('OK' if not bad else 'FAIL', split_dir, len(index)))
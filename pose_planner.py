@@ -0,0 +1,196 @@
+import os
+import shutil
+
+import numpy as np
+
+import util
+
+# Incremental re-rendering when only the camera set changes (view count, spiral length, ...).
+# The requested OpenCV cam2world poses are compared with the poses recorded next to an
+# object's existing images; every requested view is then either
+#   keep     the image at the same index already shows this pose,
+#   move     another index (or a previously set-aside view) shows it, so the files are renamed,
+#   render   nothing on disk matches.
+# Recorded views the new set does not use are moved to <object>/stale/{rgb,pose} rather than
+# deleted, so shrinking and re-growing a set later costs nothing.
+#
+# Spherical sets are random samples, where any recorded view is as good as the nominal one:
+# match='count' keeps existing views in place and fills missing indices from unused ones,
+# while match='exact' (spiral, orthogonal) only reuses views whose pose agrees within atol.
+
+
+def _view_paths(base_dir, i):
+    return (os.path.join(base_dir, 'rgb', '%06d.png' % i), os.path.join(base_dir, 'pose', '%06d.txt' % i))
+
+
+def _list_indices(base_dir):
+    rgb_dir = os.path.join(base_dir, 'rgb')
+    if not os.path.isdir(rgb_dir):
+        return []
+    return sorted(int(f[:-4]) for f in os.listdir(rgb_dir) if f.endswith('.png') and f[:-4].isdigit())
+
+
+def _next_free(base_dir, start):
+    i = start
+    while os.path.exists(_view_paths(base_dir, i)[0]):
+        i += 1
+    return i
+
+
+def _recover_staged(base_dir):
+    '''
+    Put back views left under their temporary .move_ names by an apply_plan that did not finish:
+    to their target index when it is free, else under <base_dir>/stale. Half-moved views
+    (image without pose) cannot be used and are dropped.
+    '''
+    rgb_dir = os.path.join(base_dir, 'rgb')
+    if not os.path.isdir(rgb_dir):
+        return
+    staged = sorted(f for f in os.listdir(rgb_dir) if f.startswith('.move_') and f.endswith('.png'))
+    stale_dir = os.path.join(base_dir, 'stale')
+    next_stale = 0
+    for f in staged:
+        i = int(f[len('.move_'):-4])
+        tmp = (os.path.join(rgb_dir, f), os.path.join(base_dir, 'pose', '.move_%06d.txt' % i))
+        if not os.path.exists(tmp[1]):
+            os.remove(tmp[0])
+            continue
+        if os.path.exists(_view_paths(base_dir, i)[0]):
+            for sub in ('rgb', 'pose'):
+                util.cond_mkdir(os.path.join(stale_dir, sub))
+            next_stale = _next_free(stale_dir, next_stale)
+            dst = _view_paths(stale_dir, next_stale)
+        else:
+            dst = _view_paths(base_dir, i)
+        for src, d in zip(tmp, dst):
+            os.replace(src, d)
+    pose_dir = os.path.join(base_dir, 'pose')
+    if os.path.isdir(pose_dir):
+        for f in os.listdir(pose_dir):
+            if f.startswith('.move_'):
+                os.remove(os.path.join(pose_dir, f))
+
+
+def recorded_views(base_dir):
+    '''{index: OpenCV cam2world} for every view under base_dir with both an image and a valid pose.'''
+    _recover_staged(base_dir)
+    views = {}
+    for i in _list_indices(base_dir):
+        pose = util.read_pose_file(_view_paths(base_dir, i)[1])
+        if pose is not None:
+            views[i] = pose
+    return views
+
+
+def plan(requested, recorded, stale=None, match='exact', atol=1e-4):
+    '''
+    :param requested: (N, 4, 4) OpenCV cam2world poses of the new view set.
+    :param recorded: {index: pose} of the object's current views (recorded_views).
+    :param stale: {index: pose} of set-aside views (recorded_views of <object>/stale).
+    :return: dict with
+             'keep':   indices already correct,
+             'move':   [(source, j, i)] with source 'current' or 'stale': view j becomes view i,
+             'render': indices to render,
+             'retire': current indices to set aside,
+             'poses':  {i: recorded pose} for every kept or moved view.
+    '''
+    requested = np.asarray(requested, dtype=np.float64)
+    stale = stale or {}
+    candidates = [('current', j, p) for j, p in sorted(recorded.items())] + \
+                 [('stale', j, p) for j, p in sorted(stale.items())]
+    used = set()
+    keep, move, render, poses = [], [], [], {}
+
+    if match == 'count':
+        for i in range(len(requested)):
+            if i in recorded:
+                keep.append(i)
+                used.add(('current', i))
+                poses[i] = recorded[i]
+        spare = [c for c in candidates if (c[0], c[1]) not in used and not (c[0] == 'current' and c[1] < len(requested))]
+        for i in range(len(requested)):
+            if i in recorded:
+                continue
+            if spare:
+                source, j, pose = spare.pop(0)
+                move.append((source, j, i))
+                used.add((source, j))
+                poses[i] = pose
+            else:
+                render.append(i)
+    else:
+        if candidates:
+            cand_poses = np.stack([c[2] for c in candidates])
+            diff = np.abs(requested[:, None] - cand_poses[None]).max(axis=(2, 3))
+        for i in range(len(requested)):
+            if i in recorded and np.abs(recorded[i] - requested[i]).max() <= atol:
+                keep.append(i)
+                used.add(('current', i))
+                poses[i] = recorded[i]
+        for i in range(len(requested)):
+            if i in keep:
+                continue
+            match_k = None
+            if candidates:
+                for k in np.argsort(diff[i]):
+                    if diff[i, k] > atol:
+                        break
+                    if (candidates[k][0], candidates[k][1]) not in used:
+                        match_k = k
+                        break
+            if match_k is None:
+                render.append(i)
+            else:
+                source, j, pose = candidates[match_k]
+                move.append((source, j, i))
+                used.add((source, j))
+                poses[i] = pose
+
+    retire = [j for j in sorted(recorded) if ('current', j) not in used]
+    return {'keep': keep, 'move': move, 'render': render, 'retire': retire, 'poses': poses}
+
+
+def apply_plan(instance_dir, plan):
+    '''
+    Rename files so that every kept or moved view sits at its new index and retired views are
+    under <instance_dir>/stale. Sources are first renamed to temporary names, so permutations
+    (j -> i while i -> j) are safe; recorded_views puts back any left over by an interrupted
+    run. Indices to render are left free.
+    '''
+    stale_dir = os.path.join(instance_dir, 'stale')
+    for sub in ('rgb', 'pose'):
+        util.cond_mkdir(os.path.join(stale_dir, sub))
+    base = {'current': instance_dir, 'stale': stale_dir}
+
+    staged = []
+    for source, j, i in plan['move']:
+        tmp = (os.path.join(instance_dir, 'rgb', '.move_%06d.png' % i), os.path.join(instance_dir, 'pose', '.move_%06d.txt' % i))
+        for src, dst in zip(_view_paths(base[source], j), tmp):
+            os.replace(src, dst)
+        staged.append((tmp, i))
+
+    next_stale = _next_free(stale_dir, 0)
+    for j in plan['retire']:
+        next_stale = _next_free(stale_dir, next_stale)
+        for src, dst in zip(_view_paths(instance_dir, j), _view_paths(stale_dir, next_stale)):
+            os.replace(src, dst)
+
+    # Views about to be rendered must not keep an outdated image under their index
+    for i in plan['render']:
+        for path in _view_paths(instance_dir, i):
+            if os.path.exists(path):
+                os.remove(path)
+
+    for tmp, i in staged:
+        for src, dst in zip(tmp, _view_paths(instance_dir, i)):
+            os.replace(src, dst)
+
+
+def discard_stale(instance_dir):
+    '''Drop the set-aside views, e.g. when they show the object at another scale.'''
+    shutil.rmtree(os.path.join(instance_dir, 'stale'), ignore_errors=True)
+
+
+def summary(plan):
+    return 'keep {0}, move {1}, render {2}, retire {3}'.format(
+        len(plan['keep']), len(plan['move']), len(plan['render']), len(plan['retire']))
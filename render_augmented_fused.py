@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+import bpy
+import util
+import blender_interface
+from augmentation import FastPollenAugmentor
+
+# Fused augmentation + rendering: one Blender session per base mesh.
+# The base is imported once, every variant is deformed in memory, normalized and
+# rendered straight away. Writing the intermediate STL is optional.
+p = argparse.ArgumentParser(description='Augment one base mesh and render all its variants in a single Blender session.')
+p.add_argument('--mesh_fpath', type=str, required=True, help='Base mesh (.stl) to augment.')
+p.add_argument('--augmentation_dir', type=str, required=True, help='Augmentation root holding index.jsonl (and STLs if exported).')
+p.add_argument('--output_dir', type=str, required=True, help='Base output directory for renders.')
+p.add_argument('--split_name', type=str, required=True, help='Split the base mesh belongs to (train/val/test).')
+p.add_argument('--num_augmentations', type=int, default=5)
+p.add_argument('--num_observations', type=int, default=128, help='Number of views per object for training.')
+p.add_argument('--resolution', type=int, default=256, help='Image resolution.')
+p.add_argument('--profile', type=str, default='default', choices=blender_interface.RENDER_PROFILES,
+               help="Render settings profile; 'throughput' for headless batch runs")
+p.add_argument('--threads', type=int, default=None, help='Render threads per Blender process')
+p.add_argument('--quiet', action='store_true', help='Skip the per-import object dump (batch runs)')
+p.add_argument('--bake_lighting', action='store_true',
+               help='Bake the static lighting into vertex colors once per mesh and render views shadeless')
+p.add_argument('--color_mode', type=str, default='RGBA', choices=blender_interface.PNG_COLOR_MODES,
+               help="PNG channels; 'BW' or 'RGB' are lossless for the gray-on-white renders")
+p.add_argument('--color_depth', type=str, default='8', choices=('8', '16'), help="PNG bits per channel ('16' needs 16-bit aware readers)")
+p.add_argument('--compression', type=int, default=15, help='PNG compression 0-100 (Blender default 15)')
+p.add_argument('--normalization', type=str, default='bbox', choices=util.NORMALIZATIONS,
+               help="'bbox': unit sphere around the bounding box corners (legacy scale); "
+                    "'sphere': tight vertex bounding sphere fitted to the frame")
+p.add_argument('--object_radius', type=float, default=None,
+               help="Normalized object radius; default 1 for 'bbox', the largest unclipped sphere for 'sphere'")
+p.add_argument('--seed', type=int, default=42)
+p.add_argument('--orthogonal', action='store_true', help='Use the 4 orthogonal views')
+p.add_argument('--export_stl', action='store_true', help='Also write the augmented STLs to augmentation_dir.')
+
+argv = sys.argv[sys.argv.index("--") + 1:]
+opt = p.parse_args(argv)
+
+if opt.orthogonal:
+    cam_style = 'orthogonal'
+elif opt.split_name == 'train':
+    cam_style = 'spherical'
+else:
+    cam_style = 'spiral'
+sphere_radius = 2.0
+
+renderer = blender_interface.BlenderInterface(resolution=opt.resolution, profile=opt.profile, threads=opt.threads,
+                                              verbose=not opt.quiet)
+renderer.set_image_format(opt.color_mode, opt.color_depth, opt.compression)
+normalization = (opt.normalization, opt.object_radius or renderer.object_radius(opt.normalization, sphere_radius))
+aug = FastPollenAugmentor(os.path.dirname(opt.mesh_fpath), opt.augmentation_dir,
+                          opt.num_augmentations, seed=opt.seed)
+
+fname = os.path.basename(opt.mesh_fpath)
+split_dir = os.path.join(opt.output_dir, "pollen_{}".format(opt.split_name))
+base = aug.import_and_reduce(opt.mesh_fpath)
+base_stats = aug.mesh_stats(base)
+base.hide_render = True
+
+for name in aug.deformations:
+    for i in range(aug.num_augmentations):
+        out_name = '{0}_{1}_{2}.stl'.format(os.path.splitext(fname)[0], name, i + 1)
+        rel_path = '{0}/{1}'.format(name, out_name)
+        instance_dir = os.path.join(split_dir, os.path.splitext(out_name)[0])
+
+        blender_poses = util.get_blender_poses(
+            util.get_camera_locations(cam_style, opt.num_observations, sphere_radius))
+        rgb_dir = os.path.join(instance_dir, 'rgb')
+        # Views at another object scale cannot be completed or mixed with new ones
+        views = set(range(len(blender_poses))) if util.normalization_changed(instance_dir, normalization) else None
+        if views is None and os.path.isdir(rgb_dir) and len(os.listdir(rgb_dir)) >= len(blender_poses):
+            print('[SKIP] Already rendered: {0}'.format(out_name))
+            continue
+
+        entry = aug.index.get(rel_path)
+        if entry is not None and entry.get('seed') is not None:
+            if not aug.index.is_valid(entry):
+                print('[SKIP] Failed quality gate: {0}'.format(out_name))
+                continue
+            # Re-use the recorded recipe so the renders match any exported STL
+            obj = aug.replay(entry, base)
+        else:
+            t = float(i) / (aug.num_augmentations - 1) * 0.4 if aug.num_augmentations > 1 else 0
+            obj, params, seed, quality = aug.generate_variant(base, base_stats, fname, name, i + 1, t)
+            aug.index.add(rel_path, fname, name, i + 1, params, seed, quality)
+            if obj is None:
+                print('[SKIP] Failed quality gate: {0}'.format(out_name))
+                continue
+        obj.hide_render = False
+
+        aug.bake(obj)
+        if opt.export_stl:
+            aug.export(obj, os.path.join(opt.augmentation_dir, name, out_name))
+
+        print('Rendering {0} ({1}/{2})'.format(out_name, i + 1, aug.num_augmentations))
+        # setup_object re-centers on the bounding box, so it has to come before the sphere fit
+        renderer.setup_object(obj)
+        renderer.normalize_object(obj, *normalization)
+        if opt.bake_lighting:
+            renderer.bake_lighting(obj)
+        renderer.render(instance_dir, blender_poses, write_cam_params=True, views=views,
+                        resample_pose=util.get_pose_sampler(cam_style, sphere_radius), normalization=normalization)
+
+print('Fused augmentation + rendering done for {0}'.format(fname))
@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import random
+import time
+from functools import partial
+
+import render_pool
+import util
+from blender_process import Quarantine, job_limits, log_path_for, mesh_face_count, png_progress, run_with_retries
+from augmentation_index import AugmentationIndex
+from render_metrics import RenderMetrics, job_result, job_started
+from verify_renders import FIXED_VIEWS, is_render_complete
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Config-driven replacement for the module constants in parallel.py / parallel_augmented.py.
+# A config lists render configurations; they are expanded into one job graph keyed by mesh,
+# so a mesh used by several configurations (e.g. a resolution sweep) is imported and
+# normalized once, in one Blender process that renders all of its targets in turn.
+# Identical targets are deduplicated and targets whose renders already verify are skipped.
+#
+# render.json (TOML/YAML with the same keys work too; top-level keys are defaults for every render):
+#   {
+#     "blender_path": "C:/Program Files/Blender2.7/blender.exe",
+#     "mesh_dir": "C:/data/processed/interim",
+#     "profile": "throughput",
+#     "image_format": {"color_mode": "RGB", "compression": 5},
+#     "normalization": "bbox",
+#     "renders": [
+#       {"output_dir": "128_views/128_res", "resolution": 128},
+#       {"output_dir": "128_views/256_res", "resolution": 256},
+#       {"output_dir": "aug/256_res", "augmentation_root": "augmentation", "splits": ["train"]},
+#       {"output_dir": "multi", "splits": ["train"], "view_sets": ["train:128:spherical", "canon:4:orthogonal"]}
+#     ]
+#   }
+#
+#   python render_driver.py --config render.json
+#   python render_driver.py --blender <blender.exe> --mesh_dir <meshes> --output_dir <root> \
+#       --resolution 128 256 --num_observations 64 128
+
+DEFAULT_SPLIT_CAMERA_STYLE = {"train": "spherical", "val": "spiral", "test": "orthogonal"}
+RENDER_DEFAULTS = {
+    "num_observations": 128,
+    "resolution": 256,
+    "splits": ["train", "val", "test"],
+    "splits_file": None,
+    "augmentation_root": None,
+    "incremental": False,
+    "view_sets": None,
+}
+IMAGE_FORMAT_KEYS = ("color_mode", "color_depth", "compression")
+
+
+def load_config(path):
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        if ext == ".json":
+            return json.load(f)
+        if ext == ".toml":
+            if tomllib is None:
+                raise SystemExit("[ERROR] TOML configs need Python 3.11+ or the 'tomli' package")
+            return tomllib.load(f)
+        if ext in (".yaml", ".yml"):
+            if yaml is None:
+                raise SystemExit("[ERROR] YAML configs need the 'pyyaml' package")
+            return yaml.safe_load(f)
+    raise SystemExit(f"[ERROR] Unknown config format: {path}")
+
+
+def expand_renders(config):
+    """Merge every render entry with the top-level defaults."""
+    unknown = set(config.get("image_format") or {}) - set(IMAGE_FORMAT_KEYS)
+    if unknown:
+        raise SystemExit(f"[ERROR] Unknown image_format keys {sorted(unknown)}; use {list(IMAGE_FORMAT_KEYS)}")
+    if config.get("normalization", "bbox") not in util.NORMALIZATIONS:
+        raise SystemExit(f"[ERROR] Unknown normalization {config['normalization']!r}; use one of {list(util.NORMALIZATIONS)}")
+    defaults = dict(RENDER_DEFAULTS, **{k: v for k, v in config.items() if k != "renders"})
+    renders = []
+    for entry in config.get("renders") or [{}]:
+        render = dict(defaults, **entry)
+        if not render.get("output_dir") or not render.get("mesh_dir"):
+            raise SystemExit(f"[ERROR] Render needs 'mesh_dir' and 'output_dir': {entry}")
+        render["splits_file"] = render["splits_file"] or os.path.join(render["output_dir"], "splits.json")
+        renders.append(render)
+    return renders
+
+
+def list_meshes(mesh_dir):
+    with os.scandir(mesh_dir) as it:
+        return sorted(e.name for e in it if e.name.lower().endswith((".stl", ".obj")))
+
+
+def generate_splits(mesh_list, split_path):
+    mesh_list = list(mesh_list)
+    random.seed(42)
+    random.shuffle(mesh_list)
+    n = len(mesh_list)
+    splits = {
+        "train": mesh_list[:int(0.7 * n)],
+        "val": mesh_list[int(0.7 * n):int(0.85 * n)],
+        "test": mesh_list[int(0.85 * n):],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(split_path)), exist_ok=True)
+    with open(split_path, "w") as f:
+        json.dump(splits, f, indent=2)
+    return splits
+
+
+def load_splits(render, cache):
+    """
+    Read the render's splits file, or create it. Renders over the same mesh_dir share one
+    split (cache is keyed by mesh_dir), so a sweep never assigns a mesh to two splits.
+    """
+    path = render["splits_file"]
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            splits = json.load(f)
+    elif render["mesh_dir"] in cache:
+        splits = cache[render["mesh_dir"]]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(splits, f, indent=2)
+    else:
+        splits = generate_splits(list_meshes(render["mesh_dir"]), path)
+    cache.setdefault(render["mesh_dir"], splits)
+    return splits
+
+
+def augmented_meshes(augmentation_root, splits):
+    """Exported, quality-gated augmentations grouped by the split of their base mesh."""
+    split_of_base = {base: s for s in splits for base in splits[s]}
+    collected = {s: [] for s in splits}
+    for entry in AugmentationIndex(augmentation_root):
+        split = split_of_base.get(entry["base"])
+        path = os.path.join(augmentation_root, *entry["file"].split("/"))
+        if split is not None and AugmentationIndex.is_valid(entry) and os.path.exists(path):
+            collected[split].append(path)
+    return collected
+
+
+def instance_dir(target):
+    path = os.path.join(target["output_dir"], f"pollen_{target['split_name']}", target["object_name"])
+    return os.path.join(path, target["view_set"]) if target.get("view_set") else path
+
+
+def build_job_graph(renders, split_camera_style=None, skip_complete=True, normalization=None):
+    """
+    :param normalization: (method, radius or None); complete targets rendered at another
+                          object scale are queued again (and then re-rendered in full).
+    :return: ({mesh_path: [target, ...]}, stats). A target is one (output_dir, split, object)
+             render; the same target requested twice is kept once, while two different
+             targets writing the same directory are a configuration error.
+    """
+    split_camera_style = split_camera_style or DEFAULT_SPLIT_CAMERA_STYLE
+    split_cache = {}
+    jobs = {}
+    stats = {"requested": 0, "duplicates": 0, "complete": 0, "quarantined": 0}
+    quarantined = {}
+    for render in renders:
+        splits = load_splits(render, split_cache)
+        if render["augmentation_root"]:
+            meshes = augmented_meshes(render["augmentation_root"], splits)
+        else:
+            meshes = {s: [os.path.join(render["mesh_dir"], m) for m in splits[s]] for s in splits}
+
+        out_dir = os.path.abspath(render["output_dir"])
+        if out_dir not in quarantined:
+            quarantined[out_dir] = set(Quarantine(out_dir).entries())
+
+        # Without view_sets every split gets its own camera style; with them every object of
+        # the split is rendered with each named set, into <object>/<set name>/
+        view_sets = render.get("view_sets")
+        if isinstance(view_sets, (list, tuple)):
+            view_sets = ",".join(view_sets)
+        view_sets = util.parse_view_sets(view_sets) if view_sets else None
+
+        for split in render["splits"]:
+            sets = view_sets or [{"name": None, "cam_style": split_camera_style[split],
+                                  "num_observations": int(render["num_observations"])}]
+            for mesh_path in meshes.get(split, []):
+                object_name = os.path.splitext(os.path.basename(mesh_path))[0]
+                for view_set in sets:
+                    num_observations = FIXED_VIEWS.get(view_set["cam_style"], view_set["num_observations"])
+                    target = {
+                        "output_dir": os.path.abspath(render["output_dir"]),
+                        "split_name": split,
+                        "object_name": object_name,
+                        "cam_style": view_set["cam_style"],
+                        "num_observations": num_observations,
+                        "resolution": int(render["resolution"]),
+                        "incremental": bool(render["incremental"]),
+                    }
+                    if view_set["name"]:
+                        target["view_set"] = view_set["name"]
+                    target_dir = instance_dir(target)
+                    stats["requested"] += 1
+
+                    targets = jobs.setdefault(os.path.abspath(mesh_path), {})
+                    if target_dir in targets:
+                        if targets[target_dir] != target:
+                            raise SystemExit(f"[ERROR] Conflicting render configurations for {target_dir}")
+                        stats["duplicates"] += 1
+                        continue
+                    if object_name in quarantined[out_dir]:
+                        stats["quarantined"] += 1
+                        continue
+                    if skip_complete and os.path.isdir(target_dir) and is_render_complete(target_dir, num_observations) \
+                            and not (normalization and util.normalization_changed(target_dir, normalization)):
+                        stats["complete"] += 1
+                        continue
+                    targets[target_dir] = target
+
+    graph = {mesh: list(targets.values()) for mesh, targets in sorted(jobs.items()) if targets}
+    return graph, stats
+
+
+def render_mesh(job, blender_path, script_path, profile, threads, max_retries=3, backoff_seconds=30.,
+                bake_lighting=False, index_poses=True, metrics_dir=None, image_format=None, pack_rgb=None,
+                normalization=None, object_radius=None):
+    """:return: render_metrics.job_result dict; a job spanning several splits is labelled e.g. 'train+val'."""
+    mesh_path, targets = job
+    mesh_name = os.path.splitext(os.path.basename(mesh_path))[0]
+    split = "+".join(sorted(set(t["split_name"] for t in targets)))
+    num_views = sum(t["num_observations"] for t in targets)
+    if metrics_dir is not None:
+        job_started(metrics_dir, mesh_name, split)
+    cmd = [
+        blender_path,
+        "--background",
+        "--python", script_path,
+        "--addons", "io_mesh_stl",
+        "--",
+        "--mesh_fpath", mesh_path,
+        "--output_dir", targets[0]["output_dir"],
+        "--profile", profile,
+        "--threads", str(threads),
+        "--render_spec", json.dumps(targets),
+        "--quiet",
+    ]
+    if bake_lighting:
+        cmd.append("--bake_lighting")
+    if normalization is not None:
+        cmd += ["--normalization", normalization]
+    if object_radius is not None:
+        cmd += ["--object_radius", str(object_radius)]
+    # {"color_mode": "RGB", "color_depth": "8", "compression": 15}; omitted keys keep the script defaults
+    for key, value in (image_format or {}).items():
+        cmd += [f"--{key}", str(value)]
+    log_path = log_path_for(os.path.join(targets[0]["output_dir"], "logs"), mesh_name)
+    timeout, hang_seconds = job_limits(mesh_face_count(mesh_path), num_views)
+    rgb_dirs = [os.path.join(instance_dir(t), "rgb") for t in targets]
+    start = time.perf_counter()
+    result = run_with_retries(cmd, log_path, f"{mesh_name}: {len(targets)} target(s)", max_retries, backoff_seconds,
+                              timeout=timeout, progress=png_progress(*rgb_dirs), hang_seconds=hang_seconds)
+    stages = {"blender": time.perf_counter() - start}
+    if result.status == "ok":
+        print(f"[DONE] {mesh_name}")
+        start = time.perf_counter()
+        if index_poses:
+            import pose_index
+            for t in targets:
+                split_dir = os.path.join(t["output_dir"], f"pollen_{t['split_name']}")
+                pose_index.index_object(split_dir, os.path.relpath(instance_dir(t), split_dir))
+        if pack_rgb is not None:
+            import export_tensors
+            for t in targets:
+                export_tensors.pack_rgb(instance_dir(t), pack_rgb)
+        stages["postprocess"] = time.perf_counter() - start
+        return job_result(mesh_name, split, "done", None, num_views, stages, result.peak_rss, metrics_dir)
+    print(f"[FAIL] All attempts failed for {mesh_name} — quarantined")
+    for out_dir in sorted(set(t["output_dir"] for t in targets)):
+        Quarantine(out_dir).add(mesh_name, result.status, result.log_path)
+    return job_result(mesh_name, split, "failed", None, 0, stages, result.peak_rss, metrics_dir)
+
+
+def config_from_args(args):
+    if args.config:
+        config = load_config(args.config)
+    else:
+        # Ad-hoc sweep: one render per (num_observations, resolution), laid out like 128_views/256_res
+        config = {
+            "mesh_dir": args.mesh_dir,
+            "renders": [
+                {"output_dir": os.path.join(args.output_dir, f"{n}_views", f"{r}_res"),
+                 "num_observations": n, "resolution": r}
+                for n in args.num_observations for r in args.resolution
+            ],
+        }
+    for key in ("blender_path", "num_processes", "threads_per_process", "metrics_port"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    return config
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    p = argparse.ArgumentParser(description="Render every configuration of a config file as one deduplicated job graph.")
+    p.add_argument("--config", default=None, help="JSON, TOML or YAML render config.")
+    p.add_argument("--blender_path", "--blender", dest="blender_path", default=None)
+    p.add_argument("--mesh_dir", default=None, help="Without --config: mesh directory of the sweep.")
+    p.add_argument("--output_dir", default=None, help="Without --config: root for <N>_views/<R>_res outputs.")
+    p.add_argument("--resolution", type=int, nargs="+", default=[256])
+    p.add_argument("--num_observations", type=int, nargs="+", default=[128])
+    p.add_argument("--num_processes", type=int, default=None)
+    p.add_argument("--threads_per_process", type=int, default=None)
+    p.add_argument("--metrics_port", type=int, default=None,
+                   help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics.")
+    p.add_argument("--no_skip", action="store_true", help="Re-render targets that already verify as complete.")
+    p.add_argument("--dry_run", action="store_true", help="Only print the job graph.")
+    args = p.parse_args()
+    if not args.config and not (args.mesh_dir and args.output_dir):
+        p.error("give --config, or --mesh_dir and --output_dir")
+
+    config = config_from_args(args)
+    renders = expand_renders(config)
+    graph, stats = build_job_graph(renders, config.get("split_camera_style"), skip_complete=not args.no_skip,
+                                   normalization=(config.get("normalization", "bbox"), config.get("object_radius")))
+    n_targets = sum(len(t) for t in graph.values())
+    print(f"[INFO] {len(renders)} render configs: {stats['requested']} targets requested, "
+          f"{stats['duplicates']} duplicates, {stats['complete']} already complete, {stats['quarantined']} quarantined")
+    print(f"[INFO] {n_targets} targets in {len(graph)} Blender invocations")
+    if args.dry_run:
+        for mesh_path, targets in graph.items():
+            print(f"  {os.path.basename(mesh_path)}: " +
+                  ", ".join(f"{t['split_name']}{'/' + t['view_set'] if t.get('view_set') else ''}"
+                            f"@{t['resolution']}px/{t['num_observations']}" for t in targets))
+        raise SystemExit(0)
+    if not config.get("blender_path"):
+        p.error("blender_path missing (config key or --blender_path)")
+
+    num_processes, threads_per_process, core_sets = render_pool.plan_pool(
+        config.get("num_processes"), config.get("threads_per_process"))
+    script_path = config.get("script_path") or os.path.join(here, "shapenet_spherical_renderer_multi_core.py")
+    profile = config.get("profile", "throughput")
+
+    # One status file (and optional localhost endpoint) for the whole graph, next to the first render
+    metrics_dir = config.get("metrics_dir") or renders[0]["output_dir"]
+    failed = []
+    with RenderMetrics(metrics_dir, port=config.get("metrics_port")) as metrics, \
+            render_pool.make_pool(num_processes, core_sets) as pool:
+        metrics.add_jobs(len(graph))
+        worker = partial(render_mesh, blender_path=config["blender_path"], script_path=script_path,
+                         profile=profile, threads=threads_per_process, max_retries=config.get("max_retries", 3),
+                         backoff_seconds=config.get("backoff_seconds", 30.),
+                         bake_lighting=config.get("bake_lighting", False),
+                         index_poses=config.get("index_poses", True), metrics_dir=metrics_dir,
+                         image_format=config.get("image_format"), pack_rgb=config.get("pack_rgb"),
+                         normalization=config.get("normalization"), object_radius=config.get("object_radius"))
+        for i, result in enumerate(pool.imap_unordered(worker, graph.items()), 1):
+            metrics.record(result)
+            if result["status"] != "done":
+                failed.append(result["job"])
+            print(f"[PROGRESS] {i}/{len(graph)} meshes")
+    print(f"[INFO] Done: {len(graph) - len(failed)} meshes rendered, {len(failed)} failed")
+    if failed:
+        print("[FAIL] " + ", ".join(sorted(failed)))
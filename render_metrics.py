@@ -0,0 +1,297 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Progress metrics of a driver run, fed from the results its render_single_mesh workers return.
+#
+#   <output_dir>/render_status.json        rewritten every `interval` seconds and after each job
+#   http://127.0.0.1:<port>/metrics        Prometheus text format (only with port=...)
+#   http://127.0.0.1:<port>/status         the same JSON as the status file
+#
+# Workers announce the job they start in <output_dir>/metrics/worker_<pid>.json (job, start
+# time, RSS), which gives the running count and per-worker memory; everything else comes
+# from the result dicts (job_result) the parent passes to RenderMetrics.record().
+
+STATUS_FILE = "render_status.json"
+WORKER_DIR = "metrics"
+# Upper bounds (seconds) of the per-stage latency histogram buckets
+STAGE_BUCKETS = (1., 5., 15., 30., 60., 120., 300., 600., 1200., 3600., float("inf"))
+
+
+def process_rss(pid=None):
+    """Resident set size in bytes (psutil, else /proc on Linux), None when unavailable."""
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def job_started(output_dir, job, split=None, group=None):
+    """Worker side: mark this worker busy with job (read by RenderMetrics for running/RSS)."""
+    worker_dir = os.path.join(output_dir, WORKER_DIR)
+    os.makedirs(worker_dir, exist_ok=True)
+    _write_json(os.path.join(worker_dir, f"worker_{os.getpid()}.json"),
+                {"pid": os.getpid(), "job": job, "split": split, "group": group,
+                 "started": time.time(), "rss": process_rss()})
+
+
+def job_result(job, split, status, group=None, views=0, stages=None, blender_peak_rss=None, output_dir=None):
+    """
+    Worker side: the dict render_single_mesh returns. status is 'done', 'failed' or 'skipped';
+    stages maps stage name -> seconds. With output_dir the worker is marked idle again.
+    """
+    result = {"job": job, "split": split, "group": group, "status": status, "views": views,
+              "stages": stages or {}, "pid": os.getpid(), "rss": process_rss(),
+              "blender_peak_rss": blender_peak_rss, "time": time.time()}
+    if output_dir is not None and status != "skipped":
+        path = os.path.join(output_dir, WORKER_DIR, f"worker_{os.getpid()}.json")
+        try:
+            _write_json(path, {"pid": result["pid"], "job": None, "split": split, "group": group,
+                               "started": None, "rss": result["rss"], "blender_peak_rss": blender_peak_rss})
+        except OSError:
+            pass
+    return result
+
+
+class Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, out = 0, []
+        for upper, n in zip(self.buckets, self.counts):
+            total += n
+            out.append(("+Inf" if upper == float("inf") else f"{upper:g}", total))
+        return out
+
+
+class RenderMetrics:
+    """
+    Parent side aggregate of one driver run.
+    - add_jobs(n): jobs queued (call before or while submitting them).
+    - record(result): one job_result dict from a worker.
+    - snapshot(): the status dict; prometheus(): the same as Prometheus text.
+    - start()/close(): background status-file writer and optional localhost HTTP endpoint.
+    """
+
+    def __init__(self, output_dir, port=None, interval=30., window=900.):
+        self.output_dir = output_dir
+        self.status_path = os.path.join(output_dir, STATUS_FILE)
+        self.worker_dir = os.path.join(output_dir, WORKER_DIR)
+        self.port = port
+        self.interval = interval
+        self.window = window
+        self.started = time.time()
+        self.total = 0
+        self.counts = {"done": 0, "failed": 0, "skipped": 0}
+        self.views = 0
+        self.by_split = {}
+        self.by_group = {}
+        self.stages = {}
+        self.workers = {}
+        self._recent = deque()  # (time, views) of jobs finished within the window
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+        # Heartbeats of a previous run would count as running workers
+        if os.path.isdir(self.worker_dir):
+            for f in os.listdir(self.worker_dir):
+                if f.startswith("worker_") and f.endswith(".json"):
+                    os.remove(os.path.join(self.worker_dir, f))
+
+    def add_jobs(self, n):
+        with self._lock:
+            self.total += n
+
+    def record(self, result):
+        if result is None:
+            return
+        now = time.time()
+        with self._lock:
+            status = result["status"]
+            self.counts[status] = self.counts.get(status, 0) + 1
+            for key, table in ((result.get("split"), self.by_split), (result.get("group"), self.by_group)):
+                if key is None:
+                    continue
+                row = table.setdefault(key, {"done": 0, "failed": 0, "skipped": 0, "views": 0})
+                row[status] = row.get(status, 0) + 1
+                row["views"] += result.get("views", 0)
+            if status == "skipped":
+                return
+            self.views += result.get("views", 0)
+            self._recent.append((now, result.get("views", 0)))
+            for stage, seconds in result.get("stages", {}).items():
+                self.stages.setdefault(stage, Histogram()).observe(seconds)
+            self.workers[str(result["pid"])] = {"rss": result.get("rss"),
+                                                "blender_peak_rss": result.get("blender_peak_rss"),
+                                                "last_job": result["job"], "last_status": status}
+        self.write_status()
+
+    def _running(self):
+        running = {}
+        if not os.path.isdir(self.worker_dir):
+            return running
+        for f in os.listdir(self.worker_dir):
+            if not (f.startswith("worker_") and f.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.worker_dir, f), "r") as fh:
+                    beat = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            running[str(beat["pid"])] = beat
+        return running
+
+    def snapshot(self):
+        now = time.time()
+        beats = self._running()
+        with self._lock:
+            while self._recent and now - self._recent[0][0] > self.window:
+                self._recent.popleft()
+            elapsed = now - self.started
+            span = min(self.window, elapsed)
+            finished = sum(self.counts.values())
+            running = sum(1 for b in beats.values() if b.get("job") is not None)
+            remaining = max(0, self.total - finished)
+            job_rate = len(self._recent) / span if span > 0 else 0.
+            workers = {}
+            for pid, beat in beats.items():
+                w = dict(self.workers.get(pid, {}))
+                w.update({"job": beat.get("job"), "split": beat.get("split"), "rss": beat.get("rss") or w.get("rss"),
+                          "running_seconds": now - beat["started"] if beat.get("started") else None})
+                workers[pid] = w
+            return {
+                "time": now,
+                "elapsed_seconds": elapsed,
+                "jobs": {"total": self.total, "queued": max(0, remaining - running), "running": running,
+                         **self.counts},
+                "views": self.views,
+                "views_per_second": self.views / elapsed if elapsed > 0 else 0.,
+                "views_per_second_recent": sum(v for _, v in self._recent) / span if span > 0 else 0.,
+                "eta_seconds": remaining / job_rate if job_rate > 0 else None,
+                "by_split": {k: dict(v) for k, v in self.by_split.items()},
+                "by_group": {k: dict(v) for k, v in self.by_group.items()},
+                "stages": {k: {"count": h.count, "sum": h.sum, "buckets": h.cumulative()}
+                           for k, h in self.stages.items()},
+                "workers": workers,
+            }
+
+    def prometheus(self):
+        s = self.snapshot()
+        lines = ["# TYPE render_jobs gauge"]
+        for state in ("queued", "running", "done", "failed", "skipped"):
+            lines.append(f'render_jobs{{state="{state}"}} {s["jobs"][state]}')
+        for label, table in (("split", s["by_split"]), ("group", s["by_group"])):
+            lines.append(f"# TYPE render_jobs_by_{label} gauge")
+            for key, row in sorted(table.items()):
+                for status in ("done", "failed", "skipped"):
+                    lines.append(f'render_jobs_by_{label}{{{label}="{key}",status="{status}"}} {row.get(status, 0)}')
+        lines += ["# TYPE render_views_total counter", f"render_views_total {s['views']}",
+                  "# TYPE render_views_per_second gauge",
+                  f"render_views_per_second {s['views_per_second_recent']:.4f}",
+                  "# TYPE render_eta_seconds gauge",
+                  f"render_eta_seconds {s['eta_seconds'] if s['eta_seconds'] is not None else 'NaN'}",
+                  "# TYPE render_stage_seconds histogram"]
+        for stage, h in sorted(s["stages"].items()):
+            for upper, n in h["buckets"]:
+                lines.append(f'render_stage_seconds_bucket{{stage="{stage}",le="{upper}"}} {n}')
+            lines.append(f'render_stage_seconds_sum{{stage="{stage}"}} {h["sum"]:.3f}')
+            lines.append(f'render_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+        lines.append("# TYPE render_worker_rss_bytes gauge")
+        for pid, w in sorted(s["workers"].items()):
+            if w.get("rss") is not None:
+                lines.append(f'render_worker_rss_bytes{{worker="{pid}"}} {w["rss"]}')
+        lines.append("# TYPE render_blender_peak_rss_bytes gauge")
+        for pid, w in sorted(s["workers"].items()):
+            if w.get("blender_peak_rss") is not None:
+                lines.append(f'render_blender_peak_rss_bytes{{worker="{pid}"}} {w["blender_peak_rss"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_status(self):
+        try:
+            _write_json(self.status_path, self.snapshot())
+        except OSError as e:
+            print(f"[WARN] Could not write {self.status_path}: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.write_status()
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.write_status()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        if self.port is not None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.startswith("/metrics"):
+                        body, ctype = metrics.prometheus().encode(), "text/plain; version=0.0.4"
+                    elif self.path.startswith("/status"):
+                        body, ctype = json.dumps(metrics.snapshot(), indent=2).encode(), "application/json"
+                    else:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", ctype)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            # Localhost only: the endpoint is for a local Prometheus/curl, not the network
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"[INFO] Metrics on http://127.0.0.1:{self.port}/metrics")
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.write_status()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,110 @@
+import glob
+import os
+from multiprocessing import Pool, Value
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Sizing and CPU placement for the Blender render pool.
+# Each pool worker gets its own core set (kept inside one NUMA node where possible) and
+# pins itself to it; the Blender processes it launches inherit the affinity and are told
+# to use exactly that many render threads.
+
+_worker_cores = None
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    if psutil is not None:
+        return sorted(psutil.Process().cpu_affinity())
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpulist(text):
+    cores = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cores.extend(range(int(lo), int(hi) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+
+def numa_nodes(cores):
+    """Group the usable cores by NUMA node (Linux sysfs); one group elsewhere."""
+    usable = set(cores)
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        with open(path, "r") as f:
+            node = [c for c in parse_cpulist(f.read()) if c in usable]
+        if node:
+            nodes.append(node)
+    return nodes or [list(cores)]
+
+
+def plan_pool(num_processes=None, threads_per_process=None):
+    """
+    Split the usable cores into per-worker core sets.
+    :return: (num_processes, threads_per_process, core_sets)
+    """
+    cores = available_cores()
+    if threads_per_process is None:
+        threads_per_process = 1 if num_processes is None else max(1, len(cores) // num_processes)
+
+    # Carve whole core sets out of each node first so no worker straddles two sockets;
+    # the nodes' leftover cores are then combined into sets that do
+    core_sets, leftover = [], []
+    for node in numa_nodes(cores):
+        full = len(node) - len(node) % threads_per_process
+        for start in range(0, full, threads_per_process):
+            core_sets.append(node[start:start + threads_per_process])
+        leftover.extend(node[full:])
+    for start in range(0, len(leftover) - threads_per_process + 1, threads_per_process):
+        core_sets.append(leftover[start:start + threads_per_process])
+    if not core_sets:
+        core_sets = [cores]
+
+    if num_processes is None:
+        num_processes = len(core_sets)
+    elif num_processes > len(core_sets):
+        print(f"[WARN] {num_processes} processes requested but only {len(core_sets)} core sets of "
+              f"{threads_per_process} cores; workers will share cores")
+    return num_processes, threads_per_process, core_sets
+
+
+def pin_current_process(cores):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    elif psutil is not None:
+        psutil.Process().cpu_affinity(list(cores))
+
+
+def _init_worker(counter, core_sets):
+    global _worker_cores
+    with counter.get_lock():
+        slot = counter.value
+        counter.value += 1
+    _worker_cores = core_sets[slot % len(core_sets)]
+    try:
+        pin_current_process(_worker_cores)
+    except OSError as e:
+        print(f"[WARN] Could not pin worker {slot} to cores {_worker_cores}: {e}")
+
+
+def make_pool(num_processes, core_sets):
+    """multiprocessing.Pool whose workers pin themselves (and their Blender children) to core_sets."""
+    return Pool(processes=num_processes, initializer=_init_worker, initargs=(Value("i", 0), core_sets))
+
+
+if __name__ == "__main__":
+    n, t, sets = plan_pool()
+    print(f"[INFO] {len(available_cores())} usable cores in {len(numa_nodes(available_cores()))} NUMA node(s)")
+    print(f"[INFO] Plan: {n} processes x {t} threads")
+    for i, s in enumerate(sets[:n]):
+        print(f"  worker {i:3d}: cores {s}")
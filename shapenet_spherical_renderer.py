@@ -5,7 +5,6 @@ import os
 import sys
 sys.path.append(os.path.dirname(__file__))
 import bpy
-from mathutils import Vector
 import util
 import blender_interface
 
@@ -15,6 +14,12 @@ p.add_argument('--mesh_dir', type=str, required=False, help='Directory of .obj o
 p.add_argument('--output_dir', type=str, required=True, help='Base output directory.')
 p.add_argument('--num_observations', type=int, default=128, help='Number of views per object for training.')
 p.add_argument('--resolution', type=int, default=256, help='Image resolution.')
+p.add_argument('--quiet', action='store_true', help='Skip the per-import object dump (batch runs)')
+p.add_argument('--normalization', type=str, default='bbox', choices=util.NORMALIZATIONS,
+               help="'bbox': unit sphere around the bounding box corners (legacy scale); "
+                    "'sphere': tight vertex bounding sphere fitted to the frame")
+p.add_argument('--object_radius', type=float, default=None,
+               help="Normalized object radius; default 1 for 'bbox', the largest unclipped sphere for 'sphere'")
 p.add_argument('--mesh_fpath', type=str, help='Path to a single mesh file to process')
 argv = sys.argv[sys.argv.index("--") + 1:]
 opt = p.parse_args(argv)
@@ -45,7 +50,9 @@ splits = {
 }
 
 # Renderer
-renderer = blender_interface.BlenderInterface(resolution=opt.resolution)
+renderer = blender_interface.BlenderInterface(resolution=opt.resolution, verbose=not opt.quiet)
+sphere_radius = 2.0  # fixed virtual sphere size
+normalization = (opt.normalization, opt.object_radius or renderer.object_radius(opt.normalization, sphere_radius))
 
 # Per-split rendering
 for split_name, files in splits.items():
@@ -60,27 +67,9 @@ for split_name, files in splits.items():
         mesh_name = os.path.splitext(os.path.basename(mesh_fpath))[0]
         instance_dir = os.path.join(split_output, mesh_name)
 
-        # Import mesh and normalize to fit inside unit sphere
+        # Import mesh and normalize it in place (one import; see BlenderInterface.normalize_object)
         renderer.import_mesh(mesh_fpath, scale=1., object_world_matrix=None)
-        obj = bpy.context.selected_objects[0]
-
-        # Normalize mesh to unit scale
-        bbox_corners = [obj.matrix_world * Vector(corner) for corner in obj.bound_box]
-        center = sum(bbox_corners, Vector((0.0, 0.0, 0.0))) / 8.0
-        radius = max((v - center).length for v in bbox_corners)
-        obj.scale = (1.0 / radius, 1.0 / radius, 1.0 / radius)  # uniform scale        
-        bpy.context.scene.update()
-
-
-        # Recompute center after scaling
-        bbox_corners = [obj.matrix_world * Vector(corner) for corner in obj.bound_box]
-        center = sum(bbox_corners, Vector((0.0, 0.0, 0.0))) / 8.0
-        obj_location = -np.array(center).reshape(1, 3)
-        sphere_radius = 2.0  # fixed virtual sphere size
-
-        bpy.ops.object.select_all(action='DESELECT')
-        obj.select = True
-        bpy.ops.object.delete()
+        renderer.normalize_object(bpy.context.selected_objects[0], *normalization)
 
         # Generate camera views
         if split_name == 'train':
@@ -91,17 +80,12 @@ for split_name, files in splits.items():
         cv_poses = util.look_at(cam_locations, np.zeros((1, 3)))
         blender_poses = [util.cv_cam2world_to_bcam2world(m) for m in cv_poses]
 
-        # Object pose
-        rot_mat = np.eye(3)
-        hom_coords = np.array([[0., 0., 0., 1.]])
-        obj_pose = np.concatenate((rot_mat, obj_location.reshape(3, 1)), axis=-1)
-        obj_pose = np.concatenate((obj_pose, hom_coords), axis=0)
-
-        # Import again with normalization applied
-        renderer.import_mesh(mesh_fpath, scale=1.0 / radius, object_world_matrix=obj_pose)
+        # Views at another object scale cannot be completed with new ones
+        views = set(range(len(blender_poses))) if util.normalization_changed(instance_dir, normalization) else None
 
         # Render (will skip views that result in empty or invalid output)
-        renderer.render(instance_dir, blender_poses, write_cam_params=True, object_radius=sphere_radius)
+        renderer.render(instance_dir, blender_poses, write_cam_params=True, views=views, normalization=normalization,
+                        resample_pose=util.get_pose_sampler('spherical' if split_name == 'train' else 'spiral', sphere_radius))
 
 split_summary = {
     split: [os.path.splitext(os.path.basename(f))[0] for f in files]
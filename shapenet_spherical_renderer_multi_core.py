@@ -1,13 +1,14 @@
 import argparse
+import zlib
 import numpy as np
 import json
 import os
 import sys
 sys.path.append(os.path.dirname(__file__))
 import bpy
-from mathutils import Vector
 import util
 import blender_interface
+import pose_planner
 
 # CLI args
 p = argparse.ArgumentParser(description='Render meshes into PixelNeRF-style train/val/test splits.')
@@ -15,55 +16,167 @@ p.add_argument('--mesh_dir', type=str, required=False, help='Directory of .obj o
 p.add_argument('--output_dir', type=str, required=True, help='Base output directory.')
 p.add_argument('--num_observations', type=int, default=128, help='Number of views per object for training.')
 p.add_argument('--resolution', type=int, default=256, help='Image resolution.')
+p.add_argument('--profile', type=str, default='default', choices=blender_interface.RENDER_PROFILES,
+               help="Render settings profile; 'throughput' for headless batch runs")
+p.add_argument('--threads', type=int, default=None, help='Render threads per Blender process')
+p.add_argument('--quiet', action='store_true', help='Skip the per-import object dump (batch runs)')
+p.add_argument('--bake_lighting', action='store_true',
+               help='Bake the static lighting into vertex colors once per mesh and render views shadeless')
+p.add_argument('--color_mode', type=str, default='RGBA', choices=blender_interface.PNG_COLOR_MODES,
+               help="PNG channels; 'BW' or 'RGB' are lossless for the gray-on-white renders")
+p.add_argument('--color_depth', type=str, default='8', choices=('8', '16'), help="PNG bits per channel ('16' needs 16-bit aware readers)")
+p.add_argument('--compression', type=int, default=15, help='PNG compression 0-100 (Blender default 15)')
+p.add_argument('--normalization', type=str, default='bbox', choices=util.NORMALIZATIONS,
+               help="'bbox': unit sphere around the bounding box corners (legacy scale); "
+                    "'sphere': tight vertex bounding sphere fitted to the frame")
+p.add_argument('--object_radius', type=float, default=None,
+               help="Normalized object radius; default 1 for 'bbox', the largest unclipped sphere for 'sphere'")
 p.add_argument('--mesh_fpath', type=str, help='Path to a single mesh file to process')
 p.add_argument('--split_name', type=str, help='Split name (train/val/testa) for single-mesh rendering') 
 p.add_argument('--modus', type=str, default="train", help='train/val/test')
 p.add_argument('--object_name', type=str, help='Object name for saving folder')
 p.add_argument('--orthogonal', action='store_true', help='Use orthographic camera')
+p.add_argument('--views', type=str, default=None,
+               help='Comma separated view indices to re-render (repair mode); empty string rewrites only metadata')
+p.add_argument('--incremental', action='store_true',
+               help='Reuse existing views whose pose is still requested and render only the difference')
+p.add_argument('--render_spec', type=str, default=None,
+               help='JSON list of render targets for --mesh_fpath (written by render_driver.py)')
+p.add_argument('--view_sets', type=str, default=None,
+               help="Named view sets rendered after one import, each into <object>/<name>/, "
+                    "e.g. 'train:128:spherical,eval:250:spiral,canon:4:orthogonal'")
 
 argv = sys.argv[sys.argv.index("--") + 1:]
 opt = p.parse_args(argv)
 
-if opt.mesh_fpath and opt.split_name and opt.object_name:
-    renderer = blender_interface.BlenderInterface(resolution=opt.resolution)
-    instance_dir = os.path.join(opt.output_dir, "pollen_{}".format(opt.split_name), opt.object_name)
-    os.makedirs(instance_dir, exist_ok=True)
 
-    renderer.import_mesh(opt.mesh_fpath, scale=1.0, object_world_matrix=None)
-    obj = bpy.context.selected_objects[0]
+def plan_incremental(instance_dir, cam_locations, blender_poses, cam_style, object_name):
+    '''
+    Match the requested poses against the views already on disk (see pose_planner), rename
+    reusable views into place and return the indices left to render. blender_poses is updated
+    in place with the recorded poses of reused views so near_far matches the images.
+    '''
+    requested = util.look_at(cam_locations, np.zeros((1, 3)))
+    view_plan = pose_planner.plan(requested, pose_planner.recorded_views(instance_dir),
+                                  pose_planner.recorded_views(os.path.join(instance_dir, 'stale')),
+                                  match='count' if cam_style == 'spherical' else 'exact')
+    pose_planner.apply_plan(instance_dir, view_plan)
+    for i, pose in view_plan['poses'].items():
+        blender_poses[i] = util.cv_cam2world_to_bcam2world(pose)
+    print('[plan] {0}: {1}'.format(object_name, pose_planner.summary(view_plan)))
+    return set(view_plan['render'])
+
 
-    bbox_corners = [obj.matrix_world * Vector(corner) for corner in obj.bound_box]
-    center = sum(bbox_corners, Vector((0.0, 0.0, 0.0))) / 8.0
-    radius = max((v - center).length for v in bbox_corners)
-    obj.scale = (1.0 / radius, 1.0 / radius, 1.0 / radius)
-    bpy.context.scene.update()
+def keep_recorded_poses(instance_dir, blender_poses):
+    '''Views already on disk keep their recorded pose, so near_far matches them (resume, repair).'''
+    for i in range(len(blender_poses)):
+        cv_pose = util.read_pose_file(os.path.join(instance_dir, 'pose', '%06d.txt' % i))
+        if cv_pose is not None:
+            blender_poses[i] = util.cv_cam2world_to_bcam2world(cv_pose)
 
-    bbox_corners = [obj.matrix_world * Vector(corner) for corner in obj.bound_box]
-    center = sum(bbox_corners, Vector((0.0, 0.0, 0.0))) / 8.0
-    obj_location = -np.array(center).reshape(1, 3)
+
+def renormalized_views(instance_dir, normalization, num_views, object_name):
+    '''
+    Every view index when instance_dir holds views rendered under another normalization
+    (util.normalization_changed), so no view at the old scale survives; None otherwise.
+    '''
+    if not util.normalization_changed(instance_dir, normalization):
+        return None
+    print('[normalization] {0}: views on disk use {1}, re-rendering all {2} views with {3}'.format(
+        object_name, util.read_normalization(instance_dir), num_views, normalization))
+    pose_planner.discard_stale(instance_dir)
+    return set(range(num_views))
+
+
+if opt.mesh_fpath and opt.view_sets and not opt.render_spec:
+    # Same session as a render spec with one target per named view set
+    opt.render_spec = json.dumps([
+        {'output_dir': opt.output_dir, 'split_name': opt.split_name, 'object_name': opt.object_name,
+         'resolution': opt.resolution, 'incremental': opt.incremental, 'view_set': v['name'],
+         'cam_style': v['cam_style'], 'num_observations': v['num_observations']}
+        for v in util.parse_view_sets(opt.view_sets)])
+
+if opt.mesh_fpath and opt.render_spec:
+    # Every target (output dir, split, view set, resolution, view count) of this mesh shares
+    # one import and normalization; the mesh stays in the scene until the last target
+    targets = json.loads(opt.render_spec)
+    renderer = blender_interface.BlenderInterface(resolution=targets[0]['resolution'], profile=opt.profile,
+                                                  threads=opt.threads, verbose=not opt.quiet)
+    renderer.set_image_format(opt.color_mode, opt.color_depth, opt.compression)
     sphere_radius = 2.0
+    normalization = (opt.normalization, opt.object_radius or renderer.object_radius(opt.normalization, sphere_radius))
+    renderer.import_mesh(opt.mesh_fpath, scale=1.0, object_world_matrix=None)
+    renderer.normalize_object(bpy.context.selected_objects[0], *normalization)
+    if opt.bake_lighting:
+        # View independent, so one bake serves every target
+        renderer.bake_lighting(bpy.context.selected_objects[0])
 
-    bpy.ops.object.select_all(action='DESELECT')
-    obj.select = True
-    bpy.ops.object.delete()
+    for n, target in enumerate(targets):
+        renderer.set_resolution(target['resolution'])
+        instance_dir = os.path.join(target['output_dir'], "pollen_{}".format(target['split_name']),
+                                    target['object_name'])
+        seed_key = target['object_name']
+        if target.get('view_set'):
+            # Each view set is a complete pose bundle (rgb, pose, intrinsics, near_far) of its own
+            instance_dir = os.path.join(instance_dir, target['view_set'])
+            seed_key += '/' + target['view_set']
+        os.makedirs(instance_dir, exist_ok=True)
+
+        cam_style = target['cam_style']
+        np.random.seed(zlib.crc32(seed_key.encode('utf-8')) & 0xffffffff)
+        cam_locations = util.get_camera_locations(cam_style, target['num_observations'], sphere_radius)
+        blender_poses = util.get_blender_poses(cam_locations)
+        views = renormalized_views(instance_dir, normalization, len(blender_poses), seed_key)
+        if views is None and target.get('incremental'):
+            views = plan_incremental(instance_dir, cam_locations, blender_poses, cam_style, target['object_name'])
+        elif views is None:
+            # Resumed or repaired (broken views deleted by the driver): only missing views render
+            keep_recorded_poses(instance_dir, blender_poses)
+        print('[spec] {0}/{1}: {2} -> {3} ({4}px, {5} {6} views)'.format(
+            n + 1, len(targets), target['object_name'], instance_dir, target['resolution'],
+            len(blender_poses), cam_style))
+        renderer.render(instance_dir, blender_poses, write_cam_params=True, views=views,
+                        resample_pose=util.get_pose_sampler(cam_style, sphere_radius),
+                        keep_objects=n < len(targets) - 1, normalization=normalization)
+    exit(0)
+
+if opt.mesh_fpath and opt.split_name and opt.object_name:
+    renderer = blender_interface.BlenderInterface(resolution=opt.resolution, profile=opt.profile, threads=opt.threads,
+                                                  verbose=not opt.quiet)
+    renderer.set_image_format(opt.color_mode, opt.color_depth, opt.compression)
+    instance_dir = os.path.join(opt.output_dir, "pollen_{}".format(opt.split_name), opt.object_name)
+    os.makedirs(instance_dir, exist_ok=True)
+
+    # One import, normalized in place
+    sphere_radius = 2.0
+    normalization = (opt.normalization, opt.object_radius or renderer.object_radius(opt.normalization, sphere_radius))
+    renderer.import_mesh(opt.mesh_fpath, scale=1.0, object_world_matrix=None)
+    renderer.normalize_object(bpy.context.selected_objects[0], *normalization)
 
     if opt.orthogonal:
-        cam_locations = util.get_orthogonal_camera_positions(sphere_radius, center=(0, 0, 0))
+        cam_style = 'orthogonal'
     elif opt.split_name == 'train':
-        cam_locations = util.sample_spherical(opt.num_observations, sphere_radius)
+        cam_style = 'spherical'
     else:
-        cam_locations = util.get_archimedean_spiral(sphere_radius, 250)
+        cam_style = 'spiral'
 
-    cv_poses = util.look_at(cam_locations, np.zeros((1, 3)))
-    blender_poses = [util.cv_cam2world_to_bcam2world(m) for m in cv_poses]
+    # Seed per object so a re-run reproduces the same random views
+    np.random.seed(zlib.crc32(opt.object_name.encode('utf-8')) & 0xffffffff)
+    cam_locations = util.get_camera_locations(cam_style, opt.num_observations, sphere_radius)
+    blender_poses = util.get_blender_poses(cam_locations)
 
-    rot_mat = np.eye(3)
-    hom_coords = np.array([[0., 0., 0., 1.]])
-    obj_pose = np.concatenate((rot_mat, obj_location.reshape(3, 1)), axis=-1)
-    obj_pose = np.concatenate((obj_pose, hom_coords), axis=0)
+    views = renormalized_views(instance_dir, normalization, len(blender_poses), opt.object_name)
+    if opt.views is not None:
+        if views is None:
+            views = set(int(v) for v in opt.views.split(',') if v.strip())
+        keep_recorded_poses(instance_dir, blender_poses)
+    elif views is None and opt.incremental:
+        views = plan_incremental(instance_dir, cam_locations, blender_poses, cam_style, opt.object_name)
 
-    renderer.import_mesh(opt.mesh_fpath, scale=1.0 / radius, object_world_matrix=obj_pose)
-    renderer.render(instance_dir, blender_poses, write_cam_params=True, object_radius=sphere_radius)
+    if opt.bake_lighting:
+        renderer.bake_lighting(bpy.context.selected_objects[0])
+    renderer.render(instance_dir, blender_poses, write_cam_params=True, views=views,
+                    resample_pose=util.get_pose_sampler(cam_style, sphere_radius), normalization=normalization)
     exit(0)
 
 
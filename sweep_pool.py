@@ -0,0 +1,61 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+
+import render_pool
+from benchmark_render_profile import count_views, render_one
+
+# Finds the best processes x threads split for the render pool on this machine by rendering
+# a sample mesh set once per layout, with the same core pinning the drivers use.
+#
+#   python sweep_pool.py --blender /opt/blender-2.79/blender --mesh_dir <meshes> --num_meshes 64
+
+
+def run_layout(threads, meshes, args):
+    num_processes, threads, core_sets = render_pool.plan_pool(None, threads)
+    output_dir = tempfile.mkdtemp(prefix=f"sweep_{num_processes}x{threads}_")
+    worker = partial(render_one, blender_path=args.blender, script_path=args.script, output_dir=output_dir,
+                     profile=args.profile, threads=threads, num_observations=args.num_observations,
+                     resolution=args.resolution)
+    start = time.perf_counter()
+    with render_pool.make_pool(num_processes, core_sets) as pool:
+        pool.map(worker, meshes, chunksize=1)
+    elapsed = time.perf_counter() - start
+    views = count_views(output_dir)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return num_processes, views / elapsed
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    p = argparse.ArgumentParser(description="Sweep processes x threads layouts for the render pool.")
+    p.add_argument("--blender", required=True, help="Path to the Blender 2.7x executable.")
+    p.add_argument("--mesh_dir", required=True)
+    p.add_argument("--script", default=os.path.join(here, "shapenet_spherical_renderer_multi_core.py"))
+    p.add_argument("--num_meshes", type=int, default=64)
+    p.add_argument("--num_observations", type=int, default=32)
+    p.add_argument("--resolution", type=int, default=256)
+    p.add_argument("--profile", default="throughput")
+    p.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                   help="Threads per process to try; processes fill the remaining cores.")
+    args = p.parse_args()
+
+    meshes = sorted(
+        os.path.join(args.mesh_dir, f) for f in os.listdir(args.mesh_dir)
+        if f.lower().endswith((".stl", ".obj"))
+    )[:args.num_meshes]
+    cores = len(render_pool.available_cores())
+
+    print(f"[INFO] {len(meshes)} meshes x {args.num_observations} views on {cores} cores")
+    print(f"{'processes':>10}{'threads':>9}{'views/s':>10}")
+    results = []
+    for threads in sorted(t for t in args.threads if t <= cores):
+        num_processes, rate = run_layout(threads, meshes, args)
+        results.append((rate, num_processes, threads))
+        print(f"{num_processes:>10}{threads:>9}{rate:>10.2f}")
+
+    rate, num_processes, threads = max(results)
+    print(f"[BEST] num_processes = {num_processes}, threads_per_process = {threads} ({rate:.2f} views/s)")
@@ -1,11 +1,12 @@
 import random
-import bpy
-from mathutils import Matrix, Vector
 import os
 import numpy as np
 import math
 from functools import reduce
 
+# bpy/mathutils are imported inside the functions that need them, so the NumPy helpers
+# (look_at, spirals, near/far, coverage) import on plain CPython too (see bpy_stub.py).
+
 def normalize(vec):
     return vec / (np.linalg.norm(vec, axis=-1, keepdims=True) + 1e-9)
 
@@ -42,6 +43,7 @@ def sample_spherical(n, radius=1.):
 
 
 def set_camera_focal_length_in_world_units(camera_data, focal_length):
+    import bpy
     scene = bpy.context.scene
     resolution_x_in_px = scene.render.resolution_x
     resolution_y_in_px = scene.render.resolution_y
@@ -72,6 +74,7 @@ def cv_cam2world_to_bcam2world(cv_cam2world):
     :cv_cam2world: numpy array.
     :return:
     '''
+    from mathutils import Matrix, Vector
     R_bcam2cv = Matrix(
         ((1, 0, 0),
          (0, -1, 0),
@@ -115,6 +118,7 @@ def cv_cam2world_to_bcam2world(cv_cam2world):
 #       - right-handed: positive z look-at direction
 def get_world2cam_from_blender_cam(cam):
     # bcam stands for blender camera
+    from mathutils import Matrix
     R_bcam2cv = Matrix(
         ((1, 0,  0),
          (0, -1, 0),
@@ -154,6 +158,8 @@ def get_world2cam_from_blender_cam(cam):
 # See notes on this in
 # blender.stackexchange.com/questions/15102/what-is-blenders-camera-projection-matrix-model
 def get_calibration_matrix_K_from_blender(camd):
+    import bpy
+    from mathutils import Matrix
     f_in_mm = camd.lens
     scene = bpy.context.scene
     resolution_x_in_px = scene.render.resolution_x
@@ -189,6 +195,199 @@ def get_calibration_matrix_K_from_blender(camd):
     return K
 
 
+def get_vertices(mesh, matrix_world=None):
+    '''Vertex positions (V, 3) of a bpy mesh via foreach_get, in world space if matrix_world is given.'''
+    verts = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get('co', verts)
+    verts = verts.reshape(-1, 3)
+    if matrix_world is not None:
+        m = np.array(matrix_world)
+        verts = np.dot(verts, m[:3, :3].T) + m[:3, 3]
+    return verts
+
+
+def bounding_sphere(points, iterations=200, directions=64):
+    '''
+    Near-minimal sphere enclosing points (N, 3), e.g. from get_vertices. Ritter's sphere is
+    refined with Badoiu-Clarkson steps (move the center towards the farthest point) on the
+    points that are extreme along `directions` fixed directions, and the final radius is
+    measured against all points, so the sphere always encloses the input. Within 0.5% of the
+    minimal sphere on random point clouds (median 0.02%), where the 8 bound_box corners can
+    overestimate by up to sqrt(3).
+    :return: (center (3,), radius)
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return np.zeros(3), 0.
+    # Only points on the hull can be farthest from a center; these extremes stand in for it
+    # (golden-angle spiral of directions: deterministic and leaves the global RNG untouched)
+    z = np.linspace(1. - 1. / directions, 1. / directions - 1., directions)
+    phi = np.arange(directions) * np.pi * (3. - np.sqrt(5.))
+    dirs = np.stack([np.sqrt(1. - z ** 2) * np.cos(phi), np.sqrt(1. - z ** 2) * np.sin(phi), z], axis=-1)
+    proj = np.dot(dirs, points.T)
+    extremes = points[np.unique(np.concatenate([proj.argmax(1), proj.argmin(1)]))]
+
+    # Ritter: the farthest point from an arbitrary one and the farthest from that span the start sphere
+    a = extremes[np.argmax(((extremes - extremes[0]) ** 2).sum(1))]
+    b = extremes[np.argmax(((extremes - a) ** 2).sum(1))]
+    center = (a + b) / 2.
+    radius = np.linalg.norm(b - a) / 2.
+    # ... grown until it holds the farthest remaining point
+    while True:
+        dist = np.sqrt(((extremes - center) ** 2).sum(1))
+        i = np.argmax(dist)
+        # (rounding can leave the point just grown to a hair outside)
+        if dist[i] <= radius * (1. + 1e-9):
+            break
+        new_radius = (radius + dist[i]) / 2.
+        center = center + (dist[i] - new_radius) / dist[i] * (extremes[i] - center)
+        radius = new_radius
+
+    best_center, best_radius = center, radius
+    c = center.copy()
+    for k in range(1, iterations + 1):
+        dist2 = ((extremes - c) ** 2).sum(1)
+        i = np.argmax(dist2)
+        r = np.sqrt(dist2[i])
+        if r < best_radius:
+            best_center, best_radius = c.copy(), r
+        c += (extremes[i] - c) / (k + 1.)
+    return best_center, float(np.sqrt(((points - best_center) ** 2).sum(1).max()))
+
+
+NORMALIZATIONS = ('bbox', 'sphere')
+NORMALIZATION_FILE = 'normalization.txt'
+# Views rendered before normalization.txt was written all used the unit bound_box sphere
+LEGACY_NORMALIZATION = ('bbox', 1.0)
+
+
+def read_normalization(instance_dir):
+    '''
+    (method, radius) the views of instance_dir were rendered with: normalization.txt, else
+    LEGACY_NORMALIZATION when views exist, else None (nothing rendered yet).
+    '''
+    try:
+        with open(os.path.join(instance_dir, NORMALIZATION_FILE), 'r') as f:
+            method, radius = f.read().split()[:2]
+        return method, float(radius)
+    except (OSError, ValueError):
+        pass
+    rgb_dir = os.path.join(instance_dir, 'rgb')
+    if os.path.isdir(rgb_dir) and any(f.endswith('.png') for f in os.listdir(rgb_dir)):
+        return LEGACY_NORMALIZATION
+    return None
+
+
+def write_normalization(instance_dir, normalization):
+    with open(os.path.join(instance_dir, NORMALIZATION_FILE), 'w') as f:
+        f.write('%s %.6f\n' % (normalization[0], normalization[1]))
+
+
+def normalization_changed(instance_dir, normalization):
+    '''
+    True when instance_dir holds views of the object at another scale than normalization
+    (method, radius): new views cannot be mixed with them, every view has to be re-rendered.
+    A radius of None compares the method only (host side, where the default radius of
+    'sphere' is not known without the Blender camera).
+    '''
+    recorded = read_normalization(instance_dir)
+    return recorded is not None and (recorded[0] != normalization[0] or (
+        normalization[1] is not None and abs(recorded[1] - normalization[1]) > 1e-5))
+
+
+def get_mesh_arrays(mesh, matrix_world=None):
+    '''
+    Vertex positions (V, 3) and fan-triangulated faces (F, 3) of a bpy mesh as numpy arrays,
+    read with foreach_get. Vertices are transformed to world space when matrix_world is given.
+    '''
+    verts = get_vertices(mesh, matrix_world)
+
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get('vertex_index', loop_verts)
+    starts = np.empty(len(mesh.polygons), dtype=np.int64)
+    totals = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get('loop_start', starts)
+    mesh.polygons.foreach_get('loop_total', totals)
+
+    n_tris = totals - 2
+    first = np.repeat(starts, n_tris)
+    offset = np.arange(n_tris.sum()) - np.repeat(np.cumsum(n_tris) - n_tris, n_tris) + 1
+    tris = loop_verts[np.stack((first, first + offset, first + offset + 1), axis=-1)]
+    return verts, tris
+
+
+def compute_near_far(blender_cam2world_matrices, points, padding=0.01, min_near=1e-3, chunk=32):
+    '''
+    Tight per-view ray-distance bounds over the given world-space points (e.g. the normalized
+    mesh vertices), computed in blocks of views. near is the min optical-axis depth, which no
+    ray reaches the object before; far is the max distance from the camera center, so rays
+    towards the image corners are not cut short.
+    :param padding: absolute slack added on both sides.
+    :return: (N, 2) numpy array of near, far.
+    '''
+    mats = np.array([np.array(m) for m in blender_cam2world_matrices], dtype=np.float64)
+    # Blender cameras look down their local -z axis
+    forward = -mats[:, :3, 2]
+    loc = mats[:, :3, 3]
+    offsets = np.einsum('ij,ij->i', loc, forward)
+    points = np.asarray(points, dtype=np.float32)
+    sq_norms = np.einsum('ij,ij->i', points, points)
+
+    near_far = np.empty((len(mats), 2))
+    for start in range(0, len(mats), chunk):
+        block = slice(start, start + chunk)
+        depths = np.dot(points, forward[block].T.astype(np.float32)) - offsets[block]
+        # |p - t|^2 = |p|^2 - 2 p.t + |t|^2
+        sq_dists = sq_norms[:, None] - 2 * np.dot(points, loc[block].T.astype(np.float32)) \
+            + np.einsum('ij,ij->i', loc[block], loc[block])
+        near_far[block, 0] = depths.min(axis=0)
+        near_far[block, 1] = np.sqrt(np.maximum(sq_dists.max(axis=0), 0))
+    near_far[:, 0] = np.maximum(min_near, near_far[:, 0] - padding)
+    near_far[:, 1] += padding
+    return near_far
+
+
+def compute_view_coverage(blender_cam2world_matrices, points, K, image_size):
+    '''
+    Project world-space points into every camera (pinhole K, Blender camera convention).
+    :return: (coverage, in_frame) arrays of shape (N,): the fraction of the image covered by the
+             clipped projected bounding box, and the fraction of points landing inside the frame.
+    '''
+    height, width = image_size
+    mats = np.array([np.array(m) for m in blender_cam2world_matrices], dtype=np.float64)
+    rot, loc = mats[:, :3, :3], mats[:, :3, 3]
+    # Camera-space coordinates: R^T (p - t), one block per view
+    cam = np.einsum('nji,npj->npi', rot, points[None, :, :] - loc[:, None, :])
+    depth = -cam[..., 2]
+    in_front = depth > 1e-6
+    safe_depth = np.where(in_front, depth, 1.)
+    u = K[0, 0] * cam[..., 0] / safe_depth + K[0, 2]
+    v = K[1, 2] - K[1, 1] * cam[..., 1] / safe_depth
+
+    inside = in_front & (u >= 0) & (u < width) & (v >= 0) & (v < height)
+    in_frame = inside.mean(axis=1)
+
+    big = np.inf
+    u_min = np.clip(np.where(in_front, u, big).min(axis=1), 0, width)
+    u_max = np.clip(np.where(in_front, u, -big).max(axis=1), 0, width)
+    v_min = np.clip(np.where(in_front, v, big).min(axis=1), 0, height)
+    v_max = np.clip(np.where(in_front, v, -big).max(axis=1), 0, height)
+    coverage = np.maximum(u_max - u_min, 0) * np.maximum(v_max - v_min, 0) / float(width * height)
+    return coverage, in_frame
+
+
+def read_pose_file(path):
+    '''OpenCV cam2world (4x4 numpy array) from a pose/%06d.txt file, or None if missing/broken.'''
+    try:
+        with open(path, 'r') as f:
+            values = [float(x) for x in f.read().split()]
+    except (IOError, ValueError):
+        return None
+    if len(values) != 16:
+        return None
+    return np.array(values).reshape(4, 4)
+
+
 def cond_mkdir(path):
     path = os.path.normpath(path)
     if not os.path.exists(path):
@@ -223,6 +422,76 @@ def get_archimedean_spiral(sphere_radius, num_steps=250):
 
     return np.array(translations)
 
+def get_camera_locations(cam_style, num_observations, sphere_radius):
+    '''
+    Camera centers for the styles used by the drivers: 'spherical' (random, num_observations),
+    'spiral' (fixed 250 step archimedean spiral) and 'orthogonal' (4 views).
+    '''
+    if cam_style == 'orthogonal':
+        return get_orthogonal_camera_positions(sphere_radius, center=(0, 0, 0))
+    if cam_style == 'spiral':
+        return get_archimedean_spiral(sphere_radius, 250)
+    return sample_spherical(num_observations, sphere_radius)
+
+
+# Subdirectories of an object's own view layout; view set names must not collide with them
+OBJECT_SUBDIRS = ('rgb', 'pose', 'stale')
+
+
+def object_dirs(split_dir):
+    '''
+    Rendered object dirs of a split, relative to it: '<object>', or '<object>/<view set>' for
+    objects rendered with named view sets (parse_view_sets), each a complete view layout.
+    '''
+    names = []
+    for e in sorted(os.scandir(split_dir), key=lambda e: e.name):
+        if not e.is_dir():
+            continue
+        if os.path.isdir(os.path.join(e.path, 'rgb')):
+            names.append(e.name)
+        else:
+            names += sorted(e.name + '/' + s.name for s in os.scandir(e.path)
+                            if s.is_dir() and os.path.isdir(os.path.join(s.path, 'rgb')))
+    return names
+
+
+def parse_view_sets(text):
+    '''
+    Named view sets from 'name:count:style' items separated by commas, e.g.
+    'train:128:spherical,eval:250:spiral,canon:4:orthogonal'. The count only matters for
+    spherical sets (spiral and orthogonal rigs are fixed) and may be left out for those.
+    :return: list of dicts with name, cam_style and num_observations.
+    '''
+    view_sets = []
+    for item in text.split(','):
+        parts = [s.strip() for s in item.split(':')]
+        if not parts[0]:
+            continue
+        if len(parts) == 2 and parts[1] in ('spiral', 'orthogonal'):
+            parts = [parts[0], '0', parts[1]]
+        if len(parts) != 3 or parts[2] not in ('spherical', 'spiral', 'orthogonal'):
+            raise ValueError("View set '{}' is not name:count:spherical|spiral|orthogonal".format(item))
+        if parts[0] in OBJECT_SUBDIRS or parts[0] in ('.', '..') or '/' in parts[0] or '\\' in parts[0]:
+            raise ValueError("View set name '{}' must be a plain directory name other than {}".format(
+                parts[0], ', '.join(OBJECT_SUBDIRS)))
+        view_sets.append({'name': parts[0], 'cam_style': parts[2], 'num_observations': int(parts[1])})
+    if len(set(v['name'] for v in view_sets)) != len(view_sets):
+        raise ValueError('View set names must be unique: {}'.format(text))
+    return view_sets
+
+
+def get_blender_poses(cam_locations, target=np.zeros((1, 3))):
+    cv_poses = look_at(cam_locations, target)
+    return [cv_cam2world_to_bcam2world(m) for m in cv_poses]
+
+
+def get_pose_sampler(cam_style, sphere_radius):
+    '''Draws replacement poses for rejected views; fixed rigs (spiral/orthogonal) return None.'''
+    if cam_style != 'spherical':
+        return None
+    return lambda: get_blender_poses(sample_spherical(1, sphere_radius))[0]
+
+
 def get_orthogonal_camera_positions(sphere_radius, center=(0, 0, 0)):
     """
     Returns 4 camera positions at 90-degree intervals around the Y axis,
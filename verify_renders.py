@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+from multiprocessing import Pool
+
+import util
+
+# Integrity check for rendered splits (pollen_{split}/<object>/{rgb,pose,intrinsics.txt,near_far.txt},
+# or pollen_{split}/<object>/<view set>/... for objects rendered with named view sets).
+# Every view must have a structurally intact PNG (signature, chunk CRCs, IHDR..IEND, no
+# decompression) and a parsable pose, and near_far.txt must have one line per view.
+# The result is a minimal list of repair jobs, one per object, naming only the views
+# that need re-rendering.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Views of the fixed camera rigs in util.get_camera_locations. The spiral is asked for 250
+# steps but its float step accumulation yields 251 poses, and the renderer writes them all.
+FIXED_VIEWS = {"spiral": 251, "orthogonal": 4}
+DEFAULT_EXPECTED_VIEWS = {"train": 128, "val": FIXED_VIEWS["spiral"], "test": FIXED_VIEWS["orthogonal"]}
+
+
+def check_png(path):
+    """Return None if the PNG is structurally intact, else a short reason."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return f"unreadable ({e.strerror})"
+    if not data.startswith(PNG_SIGNATURE):
+        return "bad signature"
+
+    pos = len(PNG_SIGNATURE)
+    first = True
+    while pos + 8 <= len(data):
+        length, = struct.unpack(">I", data[pos:pos + 4])
+        chunk_type = data[pos + 4:pos + 8]
+        end = pos + 8 + length + 4
+        if end > len(data):
+            return f"truncated in {chunk_type.decode('latin-1')}"
+        crc, = struct.unpack(">I", data[end - 4:end])
+        if zlib.crc32(data[pos + 4:end - 4]) & 0xffffffff != crc:
+            return f"CRC mismatch in {chunk_type.decode('latin-1')}"
+        if first and chunk_type != b"IHDR":
+            return "IHDR not first"
+        first = False
+        if chunk_type == b"IEND":
+            return None
+        pos = end
+    return "missing IEND"
+
+
+def check_pose(path):
+    try:
+        with open(path, "r") as f:
+            values = [float(x) for x in f.read().split()]
+    except (OSError, ValueError):
+        return False
+    return len(values) == 16
+
+
+def count_near_far_lines(path):
+    try:
+        with open(path, "r") as f:
+            return sum(1 for line in f if len(line.split()) == 2)
+    except OSError:
+        return 0
+
+
+def verify_object(object_dir, expected_views):
+    """
+    :return: dict with the views to re-render and whether intrinsics/near_far must be rewritten.
+    """
+    bad_views = {}
+    for i in range(expected_views):
+        png_path = os.path.join(object_dir, "rgb", "%06d.png" % i)
+        if not os.path.exists(png_path):
+            bad_views[i] = "missing image"
+            continue
+        reason = check_png(png_path)
+        if reason is not None:
+            bad_views[i] = reason
+        elif not check_pose(os.path.join(object_dir, "pose", "%06d.txt" % i)):
+            bad_views[i] = "missing pose"
+
+    rewrite_meta = (
+        not os.path.exists(os.path.join(object_dir, "intrinsics.txt"))
+        or count_near_far_lines(os.path.join(object_dir, "near_far.txt")) != expected_views
+    )
+    return {
+        "object": os.path.basename(os.path.normpath(object_dir)),
+        "views": sorted(bad_views),
+        "reasons": {str(k): v for k, v in sorted(bad_views.items())},
+        "rewrite_meta": rewrite_meta,
+        "ok": not bad_views and not rewrite_meta,
+    }
+
+
+def _verify_job(args):
+    split, name, object_dir, expected = args
+    result = verify_object(object_dir, expected)
+    result["split"] = split
+    result["object"] = name
+    return result
+
+
+def _set_expected(object_dir, default):
+    # Without the view set list, a set's near_far.txt (one line per requested view) sizes it
+    return count_near_far_lines(os.path.join(object_dir, "near_far.txt")) or default
+
+
+def verify_splits(render_dir, expected_views=None, splits=None, num_processes=None, view_sets=None):
+    """
+    Verify every object of every split in parallel.
+    :param splits: optional {split: [mesh file names]} (splits.json); listed objects without
+                   an output directory become full re-render jobs.
+    :param view_sets: optional util.parse_view_sets list (or its string form) the objects were
+                      rendered with; every object is then checked for each set under
+                      <object>/<set>, named '<object>/<set>' in the repair jobs.
+    :return: list of repair jobs {split, object, views, rewrite_meta, reasons}.
+    """
+    expected_views = dict(DEFAULT_EXPECTED_VIEWS, **(expected_views or {}))
+    if isinstance(view_sets, str):
+        view_sets = util.parse_view_sets(view_sets)
+    jobs, repairs = [], []
+    for split, expected in expected_views.items():
+        split_dir = os.path.join(render_dir, f"pollen_{split}")
+        objects = []
+        if os.path.isdir(split_dir):
+            with os.scandir(split_dir) as it:
+                objects = sorted(e.name for e in it if e.is_dir())
+        if view_sets:
+            targets = {f"{obj}/{v['name']}": FIXED_VIEWS.get(v["cam_style"], v["num_observations"])
+                       for obj in objects for v in view_sets}
+        else:
+            targets = {}
+            for name in util.object_dirs(split_dir) if objects else []:
+                targets[name] = _set_expected(os.path.join(split_dir, name), expected) if "/" in name else expected
+            # Objects without any view yet still need a full render
+            covered = set(name.split("/")[0] for name in targets)
+            targets.update({obj: expected for obj in objects if obj not in covered})
+        for name, n in sorted(targets.items()):
+            jobs.append((split, name, os.path.join(split_dir, *name.split("/")), n))
+
+        for mesh_name in (splits or {}).get(split, []):
+            obj = os.path.splitext(mesh_name)[0]
+            if obj in objects:
+                continue
+            for name, n in ([(f"{obj}/{v['name']}", FIXED_VIEWS.get(v["cam_style"], v["num_observations"]))
+                             for v in view_sets] if view_sets else [(obj, expected)]):
+                repairs.append({"split": split, "object": name, "views": list(range(n)),
+                                "rewrite_meta": True, "reasons": {"all": "not rendered"}})
+
+    with Pool(processes=num_processes) as pool:
+        for result in pool.imap_unordered(_verify_job, jobs, chunksize=16):
+            if not result.pop("ok"):
+                repairs.append(result)
+    repairs.sort(key=lambda r: (r["split"], r["object"]))
+    return repairs
+
+
+def is_render_complete(object_dir, expected_views):
+    return verify_object(object_dir, expected_views)["ok"]
+
+
+def has_expected_views(object_dir, expected_views):
+    """
+    Cheap completeness check for resume scans: every view's PNG exists and near_far.txt has
+    one line per view. Nothing is read or CRC-checked; that is left to verify_splits.
+    """
+    if count_near_far_lines(os.path.join(object_dir, "near_far.txt")) != expected_views:
+        return False
+    try:
+        with os.scandir(os.path.join(object_dir, "rgb")) as it:
+            names = {e.name for e in it}
+    except OSError:
+        return False
+    return all("%06d.png" % i in names for i in range(expected_views))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Verify rendered splits and write a view-level repair job list.")
+    p.add_argument("--render_dir", required=True, help="Directory containing pollen_{split} folders.")
+    p.add_argument("--out", default=None, help="Repair job list (default: <render_dir>/repair_jobs.json).")
+    p.add_argument("--splits_file", default=None, help="splits.json, to also report objects never rendered.")
+    p.add_argument("--expected", nargs="*", default=[], metavar="SPLIT=N",
+                   help="Expected views per split, e.g. train=128 val=251 test=4.")
+    p.add_argument("--num_processes", type=int, default=None)
+    p.add_argument("--view_sets", default=None,
+                   help="View sets the objects were rendered with, e.g. 'train:128:spherical,canon:4:orthogonal'.")
+    args = p.parse_args()
+
+    expected = {k: int(v) for k, v in (e.split("=") for e in args.expected)}
+    splits = None
+    if args.splits_file:
+        with open(args.splits_file, "r") as f:
+            splits = json.load(f)
+
+    repairs = verify_splits(args.render_dir, expected, splits, args.num_processes, args.view_sets)
+    out_path = args.out or os.path.join(args.render_dir, "repair_jobs.json")
+    with open(out_path, "w") as f:
+        json.dump(repairs, f, indent=2)
+
+    n_views = sum(len(r["views"]) for r in repairs)
+    print(f"[INFO] {len(repairs)} objects need repair ({n_views} views) → {out_path}")